@@ -1,5 +1,9 @@
 from flask import Flask, request, abort
 import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
 from functools import wraps
 from jose import jwt
 from urllib.request import urlopen
@@ -11,6 +15,34 @@ AUTH0_DOMAIN = @TODO_REPLACE_WITH_YOUR_DOMAIN
 ALGORITHMS = ['RS256']
 API_AUDIENCE = @TODO_REPLACE_WITH_YOUR_API_AUDIENCE
 
+# Signing keys are cached for JWKS_TTL seconds. A token signed with a
+# key we have not seen triggers a refetch, at most once every
+# JWKS_MIN_REFETCH_INTERVAL seconds. When a refetch fails the last good
+# key set keeps being served, for up to JWKS_STALE_TTL seconds past its
+# JWKS_TTL, and the refetch is retried after JWKS_MIN_REFETCH_INTERVAL.
+JWKS_TTL = 600
+JWKS_STALE_TTL = 3600
+JWKS_MIN_REFETCH_INTERVAL = 30
+JWKS_FETCH_TIMEOUT = 5
+jwks_cache = {
+    'keys': {},
+    'fetched_at': None,
+    'attempted_at': None
+}
+jwks_lock = threading.Lock()
+
+# Verified payloads, keyed by the SHA-256 of the token and kept until the
+# token's exp claim, so each token pays for RS256 verification only once.
+# Requests are served by several threads, so the cache is only touched
+# under token_cache_lock.
+TOKEN_CACHE_SIZE = 1024
+token_cache = OrderedDict()
+token_cache_lock = threading.Lock()
+token_cache_stats = {
+    'hits': 0,
+    'misses': 0
+}
+
 
 class AuthError(Exception):
     def __init__(self, error, status_code):
@@ -51,26 +83,56 @@ def get_token_auth_header():
     return token
 
 
+def fetch_jwks():
+    with urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json',
+                 timeout=JWKS_FETCH_TIMEOUT) as response:
+        jwks = json.loads(response.read())
+
+    jwks_cache['keys'] = {
+        key['kid']: {
+            'kty': key['kty'],
+            'kid': key['kid'],
+            'use': key['use'],
+            'n': key['n'],
+            'e': key['e']
+        } for key in jwks['keys']
+    }
+    jwks_cache['fetched_at'] = time.monotonic()
+
+
+def get_rsa_key(kid):
+    """Returns the cached signing key for kid, refetching the key set when
+    it has expired or when kid is not in it, rate limited. The refetch runs
+    under jwks_lock, so concurrent requests wait for one fetch
+    """
+    with jwks_lock:
+        now = time.monotonic()
+        fetched_at = jwks_cache['fetched_at']
+        attempted_at = jwks_cache['attempted_at']
+        age = None if fetched_at is None else now - fetched_at
+        can_refetch = attempted_at is None or now - attempted_at >= JWKS_MIN_REFETCH_INTERVAL
+
+        expired = age is None or age > JWKS_TTL + JWKS_STALE_TTL
+        if expired or (can_refetch and (age > JWKS_TTL or kid not in jwks_cache['keys'])):
+            jwks_cache['attempted_at'] = now
+            try:
+                fetch_jwks()
+            except (OSError, ValueError, KeyError):
+                if expired:
+                    raise
+
+        return jwks_cache['keys'].get(kid)
+
+
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    rsa_key = get_rsa_key(unverified_header['kid'])
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -105,13 +167,37 @@ def verify_decode_jwt(token):
             }, 400)
 
 
+def get_verified_payload(token):
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+
+    with token_cache_lock:
+        entry = token_cache.get(key)
+        if entry is not None and entry[0] > time.time():
+            token_cache.move_to_end(key)
+            token_cache_stats['hits'] += 1
+            return entry[1]
+
+        token_cache_stats['misses'] += 1
+        token_cache.pop(key, None)
+
+    payload = verify_decode_jwt(token)
+
+    if isinstance(payload.get('exp'), (int, float)):
+        with token_cache_lock:
+            token_cache[key] = (payload['exp'], payload)
+            while len(token_cache) > TOKEN_CACHE_SIZE:
+                token_cache.popitem(last=False)
+
+    return payload
+
+
 def requires_auth(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
         token = get_token_auth_header()
         try:
-            payload = verify_decode_jwt(token)
-        except:
+            payload = get_verified_payload(token)
+        except (AuthError, jwt.JWTError):
             abort(401)
         return f(payload, *args, **kwargs)
 
@@ -3,18 +3,28 @@
 #----------------------------------------------------------------------------#
 
 import json
+import hashlib
+from datetime import datetime
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import babel.dates
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, \
+                  stream_with_context, make_response, session
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from sqlalchemy import and_, or_, func
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from cache import create_cache
+from fragments import FragmentCache
+from instrumentation import init_instrumentation
+from metrics import init_metrics
 from itertools import groupby
 from operator import attrgetter
+from functools import lru_cache
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -24,8 +34,16 @@ moment = Moment(app)
 app.config.from_object('config')
 db = SQLAlchemy(app)
 migrate = Migrate(app, db, compare_type = True)
+cache = create_cache(app.config)
+fragment_cache = FragmentCache(create_cache(app.config, 'FRAGMENT_CACHE'))
+fragment_cache.init_app(app)
+init_instrumentation(app, db)
+metrics = init_metrics(app, db, cache)
 
 from models import *
+from search import search
+import bulk
+import seed
 
 #----------------------------------------------------------------------------#
 # Utils.
@@ -39,17 +57,143 @@ def is_valid_artist(artist_id):
   artist = Artist.query.get(artist_id)
   return artist is not None
 
+AREA_DIRECTORY_KEY = 'venues:areas'
+
+def load_area_directory():
+  rows = db.session.query(Venue.id,
+                          Venue.name,
+                          Venue.city,
+                          Venue.state,
+                          db.func.count(Show.id).label('num_upcoming_shows')) \
+                   .outerjoin(Show, and_(Show.venue_id == Venue.id,
+                                         Show.start_time >= datetime.utcnow())) \
+                   .group_by(Venue.id) \
+                   .order_by(Venue.state, Venue.city, Venue.id) \
+                   .all()
+
+  return [
+    {
+      'state': state,
+      'city': city,
+      'venues': [
+        {
+          'id': venue.id,
+          'name': venue.name,
+          'num_upcoming_shows': venue.num_upcoming_shows
+        } for venue in venue_list
+      ]
+    } for (state, city), venue_list in groupby(rows, attrgetter('state', 'city'))
+  ]
+
+def get_area_directory(version):
+  '''
+    Returns the venues grouped by area, served from the cache
+    as long as they were cached for the listing's current
+    version (see listing_version), so a write made by any
+    process or script is seen by the next request.
+  '''
+  cached = cache.get(AREA_DIRECTORY_KEY)
+  if cached is not None and cached[0] == version:
+    return cached[1]
+
+  areas = load_area_directory()
+  cache.set(AREA_DIRECTORY_KEY, (version, areas))
+  return areas
+
+def listing_version(model):
+  '''
+    The version and last modification time of a listing of
+    every row of model. Adding or editing a row moves the
+    newest updated_at, removing one changes the count; the
+    same goes for the shows listed along with the rows.
+  '''
+  count, updated_at, shows, shows_updated_at = \
+    db.session.query(func.count(model.id),
+                     func.max(model.updated_at),
+                     db.session.query(func.count(Show.id)).as_scalar(),
+                     db.session.query(func.max(Show.updated_at)).as_scalar()) \
+              .one()
+
+  version = f'{count}-{updated_at and updated_at.isoformat()}-' \
+            f'{shows}-{shows_updated_at and shows_updated_at.isoformat()}'
+  return version, max(filter(None, (updated_at, shows_updated_at)), default=None)
+
+def conditional_page(name, version, last_modified, render):
+  '''
+    Answers with a bodiless 304 when the client's copy of the
+    page is still current, otherwise with render(), tagged
+    with the page's ETag and Last-Modified time either way.
+
+    Only the ETag is validated: deleting a row or a show
+    starting does not move the Last-Modified time, so it is
+    sent for information and If-Modified-Since is ignored.
+    The ETag is weak because the layout around the page can
+    differ between two responses of the same version. Pages
+    with flashed messages waiting are always rendered, so the
+    messages are shown.
+  '''
+  etag = hashlib.sha1(f'{name}:{version}'.encode('utf-8')).hexdigest()
+  last_modified = last_modified and last_modified.replace(microsecond=0)
+
+  if request.if_none_match.contains_weak(etag) and not session.get('_flashes'):
+    response = Response(status=304)
+  else:
+    response = make_response(render(etag))
+
+  response.set_etag(etag, weak=True)
+  response.last_modified = last_modified
+  response.cache_control.no_cache = True
+  return response
+
+def format_show_cursor(show):
+  return f'{show.start_time.isoformat()}_{show.id}'
+
+def parse_show_cursor(cursor):
+  start_time, show_id = cursor.rsplit('_', 1)
+  return datetime.fromisoformat(start_time), int(show_id)
+
+def stream_template(template_name, **context):
+  '''
+    Renders a template as a stream, sending each chunk to the
+    client as soon as it is produced instead of building the
+    whole page in memory first.
+  '''
+  app.update_template_context(context)
+  template = app.jinja_env.get_template(template_name)
+  return Response(stream_with_context(template.stream(context)))
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(str(value))
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma"
+}
+
+@lru_cache(maxsize=64)
+def datetime_formatter(format, locale):
+  '''
+    The compiled Babel pattern and the parsed locale for a
+    format name (or a raw pattern) and a locale identifier.
+  '''
+  pattern = babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format))
+  return pattern, babel.Locale.parse(locale)
+
+def format_datetime(value, format='medium', locale=babel.dates.LC_TIME):
+  '''
+    Formats a datetime, or a string holding one, the way
+    babel.dates.format_datetime would, without reparsing the
+    pattern and the locale on every call.
+  '''
+  if not isinstance(value, datetime):
+    value = dateutil.parser.parse(str(value))
+  if value.tzinfo is None:
+    # Babel treats naive datetimes as UTC.
+    value = value.replace(tzinfo=babel.dates.UTC)
+
+  pattern, locale = datetime_formatter(format, locale)
+  return pattern.apply(value, locale)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
@@ -67,39 +211,40 @@ def index():
 
 @app.route('/venues')
 def venues():
-  all_venues = Venue.query.order_by(Venue.state, Venue.city).all()
-  data = [
-    {
-      'state': state,
-      'city': city,
-      'venues': list(venue_list)
-    } for (state, city), venue_list in groupby(all_venues, attrgetter('state', 'city'))
-  ]
-  return render_template('pages/venues.html', areas=data)
+  version, last_modified = listing_version(Venue)
+  return conditional_page('venues', version, last_modified,
+                          lambda page_version: render_template('pages/venues.html',
+                                                               areas=get_area_directory(version),
+                                                               page_version=page_version))
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
   search_term = request.form.get('search_term', '')
-  data = Venue.query \
-              .filter(Venue.name \
-                           .ilike(f'%{search_term}%')) \
-              .all()
-  
+  page = request.form.get('page', 1, type = int)
+  count, data = search(Venue, search_term, page)
+
   return render_template('pages/search_venues.html',
                           results={
-                            'count': len(data),
+                            'count': count,
                             'data': data
                           },
-                          search_term=search_term)
+                          search_term=search_term,
+                          page=page,
+                          has_next=page * app.config['SEARCH_RESULTS_PER_PAGE'] < count)
 
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
   venue = Venue.query.get(venue_id)
-  venue.upcoming_shows = venue.get_upcoming_shows()
-  venue.upcoming_shows_count = len(venue.upcoming_shows)
-  venue.past_shows = venue.get_past_shows()
-  venue.past_shows_count = len(venue.past_shows)
-  return render_template('pages/show_venue.html', venue=venue)
+  if venue is None:
+    abort(404)
+
+  # The shows are only loaded by the template, and only when
+  # its cached fragment is missing.
+  version, last_modified = venue.get_page_version()
+  return conditional_page(f'venue:{venue_id}', version, last_modified,
+                          lambda page_version: render_template('pages/show_venue.html',
+                                                               venue=venue,
+                                                               page_version=page_version))
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -150,33 +295,40 @@ def delete_venue(venue_id):
 #  ----------------------------------------------------------------
 @app.route('/artists')
 def artists():
-  return render_template('pages/artists.html', artists=Artist.query
-                                                             .order_by('id')
-                                                             .all())
+  version, last_modified = listing_version(Artist)
+  # The query is passed unexecuted: it only runs when the
+  # cached fragment of the listing has to be rendered again.
+  return conditional_page('artists', version, last_modified,
+                          lambda page_version: render_template('pages/artists.html',
+                                                               artists=Artist.query.order_by('id'),
+                                                               page_version=page_version))
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
   search_term = request.form.get('search_term', '')
-  data = Artist.query \
-               .filter(Artist.name \
-                             .ilike(f'%{search_term}%')) \
-               .all()
+  page = request.form.get('page', 1, type = int)
+  count, data = search(Artist, search_term, page)
 
   return render_template('pages/search_artists.html',
                           results={
-                            'count': len(data),
+                            'count': count,
                             'data': data
                           },
-                          search_term=search_term)
+                          search_term=search_term,
+                          page=page,
+                          has_next=page * app.config['SEARCH_RESULTS_PER_PAGE'] < count)
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
   artist = Artist.query.get(artist_id)
-  artist.upcoming_shows = artist.get_upcoming_shows()
-  artist.upcoming_shows_count = len(artist.upcoming_shows)
-  artist.past_shows = artist.get_past_shows()
-  artist.past_shows_count = len(artist.past_shows)
-  return render_template('pages/show_artist.html', artist=artist)
+  if artist is None:
+    abort(404)
+
+  version, last_modified = artist.get_page_version()
+  return conditional_page(f'artist:{artist_id}', version, last_modified,
+                          lambda page_version: render_template('pages/show_artist.html',
+                                                               artist=artist,
+                                                               page_version=page_version))
 
 #  Update
 #  ----------------------------------------------------------------
@@ -300,20 +452,39 @@ def create_artist_submission():
 
 @app.route('/shows')
 def shows():
-  shows = Show.query.order_by(Show.start_time.desc()).all()
-  data = []
-  for show in shows:
-    venue = Venue.query.get(show.venue_id)
-    artist = Artist.query.get(show.artist_id)
-    data.append({
-      'venue_id': venue.id,
-      'venue_name': venue.name,
-      'artist_id': artist.id,
-      'artist_name': artist.name,
-      'artist_image_link': artist.image_link,
-      'start_time': str(show.start_time)
-    })
-  return render_template('pages/shows.html', shows=data)
+  before = request.args.get('before')
+  page_size = app.config['SHOWS_PER_PAGE']
+
+  query = db.session.query(Show.id,
+                           Show.start_time,
+                           Venue.id.label('venue_id'),
+                           Venue.name.label('venue_name'),
+                           Artist.id.label('artist_id'),
+                           Artist.name.label('artist_name'),
+                           Artist.image_link.label('artist_image_link')) \
+                    .join(Venue, Show.venue_id == Venue.id) \
+                    .join(Artist, Show.artist_id == Artist.id)
+
+  if before is not None:
+    try:
+      start_time, show_id = parse_show_cursor(before)
+    except ValueError:
+      abort(400)
+
+    query = query.filter(or_(Show.start_time < start_time,
+                             and_(Show.start_time == start_time,
+                                  Show.id < show_id)))
+
+  data = query.order_by(Show.start_time.desc(), Show.id.desc()) \
+              .limit(page_size + 1) \
+              .all()
+
+  next_cursor = None
+  if len(data) > page_size:
+    data = data[:page_size]
+    next_cursor = format_show_cursor(data[-1])
+
+  return stream_template('pages/shows.html', shows=data, next_cursor=next_cursor)
 
 @app.route('/shows/create')
 def create_shows():
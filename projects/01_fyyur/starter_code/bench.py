@@ -0,0 +1,290 @@
+'''
+Fyyur benchmarks.
+
+Runs against the database in DATABASE_URL, or a throwaway SQLite file
+when it is not set. Every benchmark drops and recreates the tables, so
+never point it at a database holding real data.
+
+    python bench.py search --rows 10000 100000 1000000
+    python bench.py routes --venues 1000 --artists 5000 --shows 100000
+    python bench.py datetime --timestamps 10000
+    python bench.py pool --workers 8 16 32
+'''
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+# Slow statements are expected here, do not log every one of them.
+os.environ.setdefault('SLOW_QUERY_THRESHOLD_MS', '60000')
+
+if 'DATABASE_URL' not in os.environ:
+  os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'fyyur_bench.db')
+
+import babel.dates
+import dateutil.parser
+
+from app import app, db, cache, format_datetime, DATETIME_FORMATS
+from models import Venue, Show
+from search import search
+from seed import seed_database, zipf_weights
+
+WORDS = ['blue', 'note', 'hop', 'musical', 'park', 'square', 'live', 'music', 'coffee',
+         'jazz', 'club', 'hall', 'room', 'lounge', 'garden', 'stage', 'theatre', 'den']
+CITIES = [('San Francisco', 'CA'), ('New York', 'NY'), ('Seattle', 'WA'),
+          ('Austin', 'TX'), ('Chicago', 'IL'), ('Denver', 'CO')]
+GENRES = ['Jazz', 'Reggae', 'Swing', 'Classical', 'Folk', 'Rock n Roll', 'Hip-Hop', 'Blues']
+SEARCH_TERMS = ['jazz', 'blue note', 'seattle', 'garden', 'folk', 'lounge den']
+
+def percentile(samples, fraction):
+  ordered = sorted(samples)
+  return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def timed(func, repeat):
+  samples = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    func()
+    samples.append(time.perf_counter() - start)
+  return samples
+
+def report(name, samples):
+  print(f'{name:<32} p50 {percentile(samples, 0.50) * 1000:9.2f} ms'
+        f'   p99 {percentile(samples, 0.99) * 1000:9.2f} ms')
+
+def report_route(name, samples, statements):
+  total = sum(samples)
+  print(f'{name:<24} {len(samples) / total:9.1f} req/s'
+        f'   p50 {percentile(samples, 0.50) * 1000:8.2f} ms'
+        f'   p95 {percentile(samples, 0.95) * 1000:8.2f} ms'
+        f'   p99 {percentile(samples, 0.99) * 1000:8.2f} ms'
+        f'   sql {sum(statements) / len(statements):6.1f}/req (max {max(statements)})')
+
+def reset_database():
+  db.session.remove()
+  db.drop_all()
+  db.create_all()
+
+def seed_venues(rows, rng, batch_size=10000):
+  for batch_start in range(0, rows, batch_size):
+    batch = []
+    for _ in range(min(batch_size, rows - batch_start)):
+      city, state = rng.choice(CITIES)
+      batch.append({
+        'name': ' '.join(rng.sample(WORDS, 3)).title(),
+        'city': city,
+        'state': state,
+        'genres': rng.sample(GENRES, 2)
+      })
+    db.session.execute(Venue.__table__.insert(), batch)
+    db.session.commit()
+
+def ilike_search(search_term):
+  return Venue.query.filter(Venue.name.ilike(f'%{search_term}%')).all()
+
+def bench_search(args):
+  rng = random.Random(args.seed)
+
+  for rows in args.rows:
+    reset_database()
+    seed_venues(rows, rng)
+    print(f'\n{rows} venues')
+
+    report('ILIKE name scan',
+           timed(lambda: ilike_search(rng.choice(SEARCH_TERMS)), args.repeat))
+    report('indexed search (first page)',
+           timed(lambda: search(Venue, rng.choice(SEARCH_TERMS)), args.repeat))
+
+def route_requests(args, rng):
+  '''
+    Request factories for the routes under benchmark, each
+    returning a (method, path, form data) tuple. Detail pages
+    are requested with the same skew the data was generated
+    with, so popular venues and artists are hit most.
+  '''
+  venue_weights = zipf_weights(args.venues, args.skew)
+  artist_weights = zipf_weights(args.artists, args.skew)
+  venue_ids = range(1, args.venues + 1)
+  artist_ids = range(1, args.artists + 1)
+  show_count = db.session.query(Show).count()
+
+  def older_shows():
+    show = db.session.query(Show.id, Show.start_time) \
+                     .order_by(Show.start_time.desc(), Show.id.desc()) \
+                     .offset(rng.randrange(show_count)) \
+                     .first()
+    return 'GET', f'/shows?before={show.start_time.isoformat()}_{show.id}', None
+
+  return {
+    '/venues': lambda: ('GET', '/venues', None),
+    '/venues/<id>': lambda: ('GET', f'/venues/{rng.choices(venue_ids, cum_weights=venue_weights)[0]}', None),
+    '/artists/<id>': lambda: ('GET', f'/artists/{rng.choices(artist_ids, cum_weights=artist_weights)[0]}', None),
+    '/shows': lambda: ('GET', '/shows', None),
+    '/shows?before=': older_shows,
+    '/venues/search': lambda: ('POST', '/venues/search', {'search_term': rng.choice(SEARCH_TERMS)}),
+    '/artists/search': lambda: ('POST', '/artists/search', {'search_term': rng.choice(SEARCH_TERMS)})
+  }
+
+def bench_routes(args):
+  rng = random.Random(args.seed)
+  reset_database()
+  cache.clear()
+
+  start = time.perf_counter()
+  seed_database(args.venues, args.artists, args.shows, seed=args.seed, skew=args.skew)
+  print(f'Seeded {args.venues} venues, {args.artists} artists and {args.shows} shows'
+        f' in {time.perf_counter() - start:.1f}s\n')
+
+  client = app.test_client()
+  statement_count = 0
+
+  def count_statement(*_):
+    nonlocal statement_count
+    statement_count += 1
+
+  routes = route_requests(args, rng)
+  event.listen(db.engine, 'before_cursor_execute', count_statement)
+  try:
+    for name, next_request in routes.items():
+      if args.routes and name not in args.routes:
+        continue
+
+      samples, statements = [], []
+      for _ in range(args.repeat):
+        method, path, data = next_request()
+
+        statement_count = 0
+        start = time.perf_counter()
+        response = client.open(path, method=method, data=data)
+        # Streamed pages are only rendered as the body is read.
+        response.get_data()
+        samples.append(time.perf_counter() - start)
+        statements.append(statement_count)
+
+        if response.status_code != 200:
+          raise SystemExit(f'{method} {path} returned {response.status_code}')
+
+      report_route(name, samples, statements)
+  finally:
+    event.remove(db.engine, 'before_cursor_execute', count_statement)
+
+def reparsing_format_datetime(value, format='medium'):
+  '''
+    The datetime filter as it was: a str/parse round trip and
+    a pattern and locale lookup on every call.
+  '''
+  date = dateutil.parser.parse(str(value))
+  return babel.dates.format_datetime(date, DATETIME_FORMATS.get(format, format))
+
+def bench_datetime(args):
+  rng = random.Random(args.seed)
+  now = datetime.utcnow().replace(microsecond=0)
+  timestamps = [now + timedelta(minutes=rng.randint(-3 * 365 * 24 * 60, 365 * 24 * 60))
+                for _ in range(args.timestamps)]
+
+  for timestamp in timestamps[:100]:
+    assert format_datetime(timestamp, 'full') == reparsing_format_datetime(timestamp, 'full')
+
+  print(f'{args.timestamps} timestamps')
+  for name, func in (('str -> parse -> babel', reparsing_format_datetime),
+                     ('cached pattern and locale', format_datetime)):
+    samples = timed(lambda: [func(timestamp, 'full') for timestamp in timestamps], args.repeat)
+    report(name, samples)
+
+def bench_pool(args):
+  '''
+    Sends requests to the detail pages from several threads at
+    once, like a threaded gunicorn worker, and reports how long
+    requests waited for a pooled connection.
+  '''
+  reset_database()
+  cache.clear()
+  seed_database(args.venues, args.artists, args.shows, seed=args.seed)
+  db.session.remove()
+
+  engine = db.get_engine(app)
+  print(f'pool size {engine.pool.size()}, max overflow {engine.pool._max_overflow}\n')
+
+  for workers in args.workers:
+    engine.dispose()
+    wait_stats = getattr(engine.pool, 'wait_stats', None)
+    if wait_stats is None:
+      raise SystemExit('the pool is not timed, point DATABASE_URL at a file or a server')
+    wait_stats.__init__()
+
+    barrier = threading.Barrier(workers)
+    samples = []
+    failures = []
+
+    def work(seed):
+      rng = random.Random(seed)
+      client = app.test_client()
+      barrier.wait()
+      for _ in range(args.repeat):
+        path = rng.choice(('/venues/{}', '/artists/{}')).format(rng.randint(1, min(args.venues, args.artists)))
+        start = time.perf_counter()
+        try:
+          status_code = client.get(path).status_code
+        except Exception as error:
+          status_code = type(error).__name__
+        samples.append(time.perf_counter() - start)
+        if status_code != 200:
+          failures.append(status_code)
+
+    threads = [threading.Thread(target=work, args=(args.seed + n,)) for n in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    elapsed = time.perf_counter() - start
+
+    stats = wait_stats.stats()
+    print(f'{workers:>3} workers   {len(samples) / elapsed:8.1f} req/s'
+          f'   p50 {percentile(samples, 0.50) * 1000:8.2f} ms'
+          f'   p99 {percentile(samples, 0.99) * 1000:8.2f} ms'
+          f'   pool wait avg {stats["wait_time"] / max(stats["checkouts"], 1) * 1000:6.2f} ms'
+          f'   max {stats["max_wait"] * 1000:7.2f} ms'
+          f'   timeouts {stats["timeouts"]}   failed {len(failures)}')
+
+def main():
+  parser = argparse.ArgumentParser(description='Fyyur benchmarks')
+  parser.add_argument('--seed', type=int, default=1)
+  parser.add_argument('--repeat', type=int, default=50)
+  subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+  search_parser = subparsers.add_parser('search', help='search latency versus ILIKE')
+  search_parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+  search_parser.set_defaults(func=bench_search)
+
+  routes_parser = subparsers.add_parser('routes', help='throughput, latency and SQL statements per route')
+  routes_parser.add_argument('--venues', type=int, default=1000)
+  routes_parser.add_argument('--artists', type=int, default=5000)
+  routes_parser.add_argument('--shows', type=int, default=100000)
+  routes_parser.add_argument('--skew', type=float, default=1.1)
+  routes_parser.add_argument('--routes', nargs='+', help='only benchmark these routes')
+  routes_parser.set_defaults(func=bench_routes)
+
+  datetime_parser = subparsers.add_parser('datetime', help='the datetime template filter')
+  datetime_parser.add_argument('--timestamps', type=int, default=10000)
+  datetime_parser.set_defaults(func=bench_datetime)
+
+  pool_parser = subparsers.add_parser('pool', help='connection pool waits under concurrent requests')
+  pool_parser.add_argument('--workers', type=int, nargs='+', default=[8, 16, 32])
+  pool_parser.add_argument('--venues', type=int, default=200)
+  pool_parser.add_argument('--artists', type=int, default=500)
+  pool_parser.add_argument('--shows', type=int, default=10000)
+  pool_parser.set_defaults(func=bench_pool)
+
+  args = parser.parse_args()
+  with app.app_context():
+    args.func(args)
+
+if __name__ == '__main__':
+  main()
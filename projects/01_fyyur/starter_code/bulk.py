@@ -0,0 +1,342 @@
+#----------------------------------------------------------------------------#
+# Bulk import and export of venues, artists and shows.
+#
+#   flask import-data venues venues.csv
+#   flask import-data shows shows.ndjson --batch-size 5000
+#   flask export-data artists artists.ndjson
+#
+# Files are streamed in batches: imports use PostgreSQL COPY when available
+# and multi-row INSERTs otherwise, and exports read through a server-side
+# cursor, so neither ever holds a whole file or table in memory.
+#----------------------------------------------------------------------------#
+
+import csv
+import io
+import json
+import time
+from datetime import datetime
+from itertools import islice
+
+import click
+import dateutil.parser
+from sqlalchemy import ARRAY, Boolean, DateTime, Integer
+
+from app import app, db, cache, fragment_cache
+from models import Venue, Artist, Show
+
+ENTITIES = {
+  'venues': Venue,
+  'artists': Artist,
+  'shows': Show
+}
+
+FORMATS = ('csv', 'ndjson')
+
+class InvalidRow(Exception):
+  pass
+
+#----------------------------------------------------------------------------#
+# Row conversion.
+#----------------------------------------------------------------------------#
+
+def is_list_column(column):
+  column_type = getattr(column.type, 'impl', column.type)
+  return isinstance(column_type, ARRAY)
+
+def parse_value(column, value):
+  '''
+    Converts a raw value read from a file into the Python
+    value for a column. CSV cells arrive as strings, NDJSON
+    values may already have the right type. Raises InvalidRow
+    for values of the wrong type.
+  '''
+  if value is None or value == '':
+    return None
+
+  if is_list_column(column):
+    if isinstance(value, str):
+      if not value.startswith('['):
+        return [genre.strip() for genre in value.split(',') if genre.strip()]
+      value = json.loads(value)
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+      raise InvalidRow(f'{column.name} must be a list of strings')
+    return value
+
+  if isinstance(value, (dict, list)):
+    raise InvalidRow(f'{column.name} must not be a {type(value).__name__}')
+
+  if isinstance(column.type, Boolean):
+    if isinstance(value, bool):
+      return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y', 't')
+
+  if isinstance(column.type, Integer):
+    return int(value)
+
+  if isinstance(column.type, DateTime):
+    if isinstance(value, datetime):
+      return value
+    return dateutil.parser.parse(value)
+
+  return value
+
+def format_value(column, value, file_format):
+  if value is None:
+    return '' if file_format == 'csv' else None
+
+  if isinstance(value, datetime):
+    return value.isoformat()
+
+  if is_list_column(column) and file_format == 'csv':
+    return ','.join(value)
+
+  return value
+
+def read_rows(file, file_format):
+  '''
+    The rows of file: dicts for CSV, the lines themselves
+    for NDJSON, decoded by decode_row as they are imported.
+  '''
+  if file_format == 'csv':
+    yield from csv.DictReader(file)
+  else:
+    for line in file:
+      if line.strip():
+        yield line
+
+def decode_row(raw):
+  '''
+    raw as a dict keyed by column name, raw being a dict or
+    a line of NDJSON. Raises InvalidRow if it is neither.
+  '''
+  if isinstance(raw, str):
+    try:
+      raw = json.loads(raw)
+    except ValueError as error:
+      raise InvalidRow(f'invalid JSON, {error}')
+
+  if not isinstance(raw, dict):
+    raise InvalidRow('not an object')
+  return raw
+
+def detect_format(filename, file_format):
+  if file_format:
+    return file_format
+  if filename.endswith('.csv'):
+    return 'csv'
+  return 'ndjson'
+
+#----------------------------------------------------------------------------#
+# Writing batches.
+#----------------------------------------------------------------------------#
+
+def copy_literal(column, value):
+  '''
+    Formats a value as a field of PostgreSQL's COPY CSV format.
+  '''
+  if value is None:
+    return None
+
+  if is_list_column(column):
+    escaped = ('"{}"'.format(item.replace('\\', '\\\\').replace('"', '\\"')) for item in value)
+    return '{' + ','.join(escaped) + '}'
+
+  if isinstance(value, datetime):
+    return value.isoformat()
+
+  return value
+
+def copy_batch(connection, table, columns, batch):
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+
+  for row in batch:
+    # An unquoted empty field is NULL in COPY's CSV format.
+    writer.writerow(['' if value is None else value
+                     for value in (copy_literal(column, row.get(column.name)) for column in columns)])
+
+  buffer.seek(0)
+  column_list = ', '.join(f'"{column.name}"' for column in columns)
+  cursor = connection.connection.cursor()
+  cursor.copy_expert(f'COPY "{table.name}" ({column_list}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+def insert_batch(connection, table, columns, batch):
+  if connection.dialect.name == 'postgresql':
+    copy_batch(connection, table, columns, batch)
+  else:
+    connection.execute(table.insert(), batch)
+
+def reset_id_sequence(connection, table):
+  if connection.dialect.name == 'postgresql':
+    connection.execute(f'SELECT setval(pg_get_serial_sequence(\'"{table.name}"\', \'id\'), '
+                       f'coalesce(max(id), 1), max(id) IS NOT NULL) FROM "{table.name}"')
+
+#----------------------------------------------------------------------------#
+# Import.
+#----------------------------------------------------------------------------#
+
+def load_ids(model):
+  return { id for id, in db.session.query(model.id) }
+
+def import_rows(model, rows, batch_size=1000, on_error=None):
+  '''
+    Inserts rows (dicts keyed by column name, or NDJSON
+    lines as yielded by read_rows) in batches of
+    batch_size, each batch in a single statement and every
+    batch in one transaction.
+
+    Shows referencing unknown venues or artists are skipped,
+    checked against id sets loaded once up front. Rows that
+    cannot be parsed are skipped too; on_error, if given, is
+    called with (row number, message) for every skipped row.
+
+    Returns a (rows imported, rows skipped) tuple.
+  '''
+  table = model.__table__
+  known_ids = {}
+  if model is Show:
+    known_ids = {
+      'venue_id': load_ids(Venue),
+      'artist_id': load_ids(Artist)
+    }
+
+  imported = skipped = 0
+  has_explicit_ids = False
+  rows = iter(enumerate(rows, start=1))
+
+  with db.engine.begin() as connection:
+    while True:
+      chunk = list(islice(rows, batch_size))
+      if not chunk:
+        break
+
+      batch = []
+      for number, raw in chunk:
+        try:
+          raw = decode_row(raw)
+          row = {
+            column.name: parse_value(column, raw.get(column.name))
+            for column in table.columns
+            if column.name in raw
+          }
+
+          for column in table.columns:
+            if row.get(column.name) is None and column.default is not None and column.default.is_scalar:
+              row[column.name] = column.default.arg
+
+          for key, ids in known_ids.items():
+            if row.get(key) not in ids:
+              raise InvalidRow(f'unknown {key} {row.get(key)}')
+
+          missing = [column.name for column in table.columns
+                     if not column.nullable and not column.primary_key
+                     and column.default is None and column.server_default is None
+                     and row.get(column.name) is None]
+          if missing:
+            raise InvalidRow('missing ' + ', '.join(missing))
+        except (InvalidRow, TypeError, ValueError, OverflowError) as error:
+          skipped += 1
+          if on_error is not None:
+            on_error(number, str(error))
+          continue
+
+        has_explicit_ids = has_explicit_ids or row.get('id') is not None
+        batch.append(row)
+
+      if not batch:
+        continue
+
+      # Every row of a batch must provide the same columns.
+      columns = [column for column in table.columns
+                 if any(column.name in row for row in batch)]
+      batch = [{column.name: row.get(column.name) for column in columns} for row in batch]
+
+      insert_batch(connection, table, columns, batch)
+      imported += len(batch)
+
+    if has_explicit_ids:
+      reset_id_sequence(connection, table)
+
+  cache.clear()
+  fragment_cache.clear()
+  return imported, skipped
+
+@app.cli.command('import-data')
+@click.argument('entity', type=click.Choice(sorted(ENTITIES)))
+@click.argument('file', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'file_format', type=click.Choice(FORMATS),
+              help='File format, guessed from the file name by default.')
+@click.option('--batch-size', default=1000, show_default=True)
+def import_data(entity, file, file_format, batch_size):
+  '''Imports venues, artists or shows from a CSV or NDJSON file.'''
+  file_format = detect_format(file.name, file_format)
+
+  def report_error(number, message):
+    click.echo(f'row {number}: skipped, {message}', err=True)
+
+  start = time.perf_counter()
+  imported, skipped = import_rows(ENTITIES[entity],
+                                  read_rows(file, file_format),
+                                  batch_size=batch_size,
+                                  on_error=report_error)
+  elapsed = time.perf_counter() - start
+
+  click.echo(f'Imported {imported} {entity} ({skipped} skipped) in {elapsed:.2f}s, '
+             f'{imported / elapsed if elapsed else 0:.0f} rows/sec')
+
+#----------------------------------------------------------------------------#
+# Export.
+#----------------------------------------------------------------------------#
+
+def export_rows(model, file, file_format, batch_size=1000):
+  '''
+    Writes every row of a table to file, ordered by id,
+    reading batch_size rows at a time from a server-side
+    cursor. Returns the number of rows written.
+  '''
+  table = model.__table__
+  columns = list(table.columns)
+  writer = None
+  exported = 0
+
+  if file_format == 'csv':
+    writer = csv.writer(file)
+    writer.writerow([column.name for column in columns])
+
+  with db.engine.connect() as connection:
+    result = connection.execution_options(stream_results=True) \
+                       .execute(table.select().order_by(table.c.id))
+
+    while True:
+      batch = result.fetchmany(batch_size)
+      if not batch:
+        break
+
+      for row in batch:
+        values = [format_value(column, row[column.name], file_format) for column in columns]
+        if writer is not None:
+          writer.writerow(values)
+        else:
+          file.write(json.dumps(dict(zip((column.name for column in columns), values))) + '\n')
+
+      exported += len(batch)
+
+  return exported
+
+@app.cli.command('export-data')
+@click.argument('entity', type=click.Choice(sorted(ENTITIES)))
+@click.argument('file', type=click.File('w', encoding='utf-8', lazy=True))
+@click.option('--format', 'file_format', type=click.Choice(FORMATS),
+              help='File format, guessed from the file name by default.')
+@click.option('--batch-size', default=1000, show_default=True)
+def export_data(entity, file, file_format, batch_size):
+  '''Exports venues, artists or shows to a CSV or NDJSON file ('-' for stdout).'''
+  file_format = detect_format(file.name, file_format)
+
+  start = time.perf_counter()
+  exported = export_rows(ENTITIES[entity], file, file_format, batch_size=batch_size)
+  elapsed = time.perf_counter() - start
+
+  click.echo(f'Exported {exported} {entity} in {elapsed:.2f}s, '
+             f'{exported / elapsed if elapsed else 0:.0f} rows/sec',
+             err=file.name == '-')
@@ -0,0 +1,263 @@
+#----------------------------------------------------------------------------#
+# Application caches.
+#
+# MemoryCache keeps values in the current process, and LRUCache does too
+# within a budget of bytes. FileCache stores them as pickles in a directory,
+# so every worker on the same host shares them; it offers the same
+# get/set/delete interface as a Redis client would, and can be swapped for
+# one without touching the callers.
+#
+# Both count their hits and misses, see stats().
+#----------------------------------------------------------------------------#
+
+import hashlib
+import os
+import pickle
+import tempfile
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# Suffix of the files FileCache writes entries to before
+# moving them in place.
+TEMPORARY_SUFFIX = '.tmp'
+
+class CacheStats(object):
+  '''
+    Hit and miss counters. They are bumped without a lock:
+    under concurrent load a few increments may be lost, which
+    is fine for a hit ratio and keeps the lookups cheap.
+  '''
+  hits = 0
+  misses = 0
+
+  def record(self, value):
+    if value is None:
+      self.misses += 1
+    else:
+      self.hits += 1
+    return value
+
+  def stats(self):
+    return {
+      'hits': self.hits,
+      'misses': self.misses
+    }
+
+class MemoryCache(CacheStats):
+  def __init__(self, default_timeout=300):
+    self.default_timeout = default_timeout
+    self._entries = {}
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    entry = self._entries.get(key)
+    if entry is None:
+      return self.record(None)
+
+    expires_at, value = entry
+    if expires_at is not None and expires_at <= time.monotonic():
+      self.delete(key)
+      return self.record(None)
+
+    return self.record(value)
+
+  def set(self, key, value, timeout=None):
+    timeout = self.default_timeout if timeout is None else timeout
+    expires_at = time.monotonic() + timeout if timeout else None
+    with self._lock:
+      self._entries[key] = (expires_at, value)
+
+  def delete(self, key):
+    with self._lock:
+      self._entries.pop(key, None)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+class LRUCache(MemoryCache):
+  '''
+    A MemoryCache holding at most max_bytes worth of values,
+    dropping the least recently used ones to make room.
+    Strings and bytes are measured with sys.getsizeof, other
+    values by the size of their pickle.
+  '''
+  def __init__(self, max_bytes, default_timeout=300):
+    super().__init__(default_timeout)
+    self.max_bytes = max_bytes
+    self.size = 0
+    self._entries = OrderedDict()
+
+  @staticmethod
+  def _sizeof(value):
+    if isinstance(value, (str, bytes)):
+      return sys.getsizeof(value)
+    return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+  def get(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None:
+        self._entries.move_to_end(key)
+
+    if entry is None:
+      return self.record(None)
+
+    expires_at, value, _ = entry
+    if expires_at is not None and expires_at <= time.monotonic():
+      self.delete(key)
+      return self.record(None)
+
+    return self.record(value)
+
+  def set(self, key, value, timeout=None):
+    timeout = self.default_timeout if timeout is None else timeout
+    expires_at = time.monotonic() + timeout if timeout else None
+    size = self._sizeof(value)
+    if size > self.max_bytes:
+      return
+
+    with self._lock:
+      previous = self._entries.pop(key, None)
+      if previous is not None:
+        self.size -= previous[2]
+
+      self._entries[key] = (expires_at, value, size)
+      self.size += size
+
+      while self.size > self.max_bytes:
+        _, (_, _, evicted_size) = self._entries.popitem(last=False)
+        self.size -= evicted_size
+
+  def delete(self, key):
+    with self._lock:
+      entry = self._entries.pop(key, None)
+      if entry is not None:
+        self.size -= entry[2]
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self.size = 0
+
+class FileCache(CacheStats):
+  '''
+    Entries stored as files in directory, each holding its
+    expiry time followed by the pickled value.
+
+    Expired entries are deleted when they are read and by a
+    sweep of the directory, run by set at most every
+    sweep_interval seconds. The sweep also deletes the least
+    recently written entries beyond threshold, if one is set,
+    so keys that are never read again do not pile up.
+  '''
+
+  def __init__(self, directory, default_timeout=300, threshold=None, sweep_interval=60):
+    self.directory = directory
+    self.default_timeout = default_timeout
+    self.threshold = threshold
+    self.sweep_interval = sweep_interval
+    self._next_sweep = 0
+    os.makedirs(directory, exist_ok=True)
+
+  def _path(self, key):
+    return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+  def get(self, key):
+    try:
+      with open(self._path(key), 'rb') as cache_file:
+        expires_at = pickle.load(cache_file)
+        if expires_at is not None and expires_at <= time.time():
+          self.delete(key)
+          return self.record(None)
+        value = pickle.load(cache_file)
+    except (OSError, EOFError, TypeError, pickle.UnpicklingError):
+      return self.record(None)
+
+    return self.record(value)
+
+  def set(self, key, value, timeout=None):
+    timeout = self.default_timeout if timeout is None else timeout
+    now = time.time()
+    expires_at = now + timeout if timeout else None
+
+    # Write to a temporary file first so readers in other
+    # processes never see a partially written entry.
+    fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=TEMPORARY_SUFFIX)
+    with os.fdopen(fd, 'wb') as cache_file:
+      pickle.dump(expires_at, cache_file, pickle.HIGHEST_PROTOCOL)
+      pickle.dump(value, cache_file, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, self._path(key))
+
+    if now >= self._next_sweep:
+      self._next_sweep = now + self.sweep_interval
+      self.sweep()
+
+  def sweep(self):
+    '''
+      Deletes the expired entries, then the least recently
+      written ones beyond threshold. Returns how many are left.
+    '''
+    now = time.time()
+    entries = []
+    for entry in os.scandir(self.directory):
+      # Leave subdirectories and files being written alone.
+      if not entry.is_file() or entry.name.endswith(TEMPORARY_SUFFIX):
+        continue
+      try:
+        with open(entry.path, 'rb') as cache_file:
+          expires_at = pickle.load(cache_file)
+        expired = expires_at is not None and expires_at <= now
+        modified_at = entry.stat().st_mtime
+      except (OSError, EOFError, TypeError, pickle.UnpicklingError):
+        expired = True
+
+      if expired:
+        self._remove(entry.path)
+      else:
+        entries.append((modified_at, entry.path))
+
+    if self.threshold is not None and len(entries) > self.threshold:
+      entries.sort()
+      for _, path in entries[:len(entries) - self.threshold]:
+        self._remove(path)
+      del entries[:len(entries) - self.threshold]
+
+    return len(entries)
+
+  @staticmethod
+  def _remove(path):
+    try:
+      os.remove(path)
+    except FileNotFoundError:
+      pass
+
+  def delete(self, key):
+    self._remove(self._path(key))
+
+  def clear(self):
+    for entry in os.scandir(self.directory):
+      # Leave subdirectories alone, they may hold other caches.
+      if entry.is_file():
+        self._remove(entry.path)
+
+def create_cache(config, prefix='CACHE'):
+  '''
+    Builds the cache selected by the <prefix>_TYPE setting,
+    either 'memory' (the default), 'lru' (bounded by
+    <prefix>_MAX_BYTES) or 'file' (stored in <prefix>_DIR,
+    bounded by <prefix>_THRESHOLD entries if set).
+  '''
+  cache_type = config.get(f'{prefix}_TYPE', 'memory')
+  timeout = config.get(f'{prefix}_DEFAULT_TIMEOUT', 300)
+
+  if cache_type == 'file':
+    return FileCache(config[f'{prefix}_DIR'], default_timeout=timeout,
+                     threshold=config.get(f'{prefix}_THRESHOLD'))
+
+  if cache_type == 'lru':
+    return LRUCache(config[f'{prefix}_MAX_BYTES'], default_timeout=timeout)
+
+  return MemoryCache(default_timeout=timeout)
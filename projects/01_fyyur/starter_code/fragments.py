@@ -0,0 +1,75 @@
+#----------------------------------------------------------------------------#
+# Template fragment caching.
+#
+#   {% cache ('venue', venue.id, page_version), 600 %}
+#     ... expensive markup ...
+#   {% endcache %}
+#
+# The rendered markup of the block is stored under its key for the given
+# number of seconds (FRAGMENT_CACHE_DEFAULT_TIMEOUT when omitted). Keys
+# include the version of the page, which changes with every edit of the
+# rows it shows, so stale fragments are never looked up again: the LRU
+# backend evicts them once it is full, and the file backend deletes them
+# when it sweeps its directory for expired entries, and beyond
+# FRAGMENT_CACHE_THRESHOLD entries.
+#----------------------------------------------------------------------------#
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+class FragmentCache(object):
+  '''
+    Rendered template fragments, kept in backend (any cache
+    from cache.py).
+  '''
+
+  def __init__(self, backend):
+    self.backend = backend
+
+  def init_app(self, app):
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache = self
+
+  def get(self, key):
+    return self.backend.get(f'fragment:{key}')
+
+  def set(self, key, value, timeout=None):
+    self.backend.set(f'fragment:{key}', value, timeout)
+
+  def clear(self):
+    self.backend.clear()
+
+class FragmentCacheExtension(Extension):
+  tags = { 'cache' }
+
+  def __init__(self, environment):
+    super().__init__(environment)
+    environment.extend(fragment_cache=None)
+
+  def parse(self, parser):
+    lineno = next(parser.stream).lineno
+    args = [parser.parse_expression()]
+
+    if parser.stream.skip_if('comma'):
+      args.append(parser.parse_expression())
+    else:
+      args.append(nodes.Const(None))
+
+    body = parser.parse_statements(['name:endcache'], drop_needle=True)
+    return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+  def _render(self, key, timeout, caller):
+    cache = self.environment.fragment_cache
+    if cache is None:
+      return caller()
+
+    if isinstance(key, (tuple, list)):
+      key = ':'.join(str(part) for part in key)
+
+    markup = cache.get(key)
+    if markup is None:
+      markup = caller()
+      cache.set(key, str(markup), timeout)
+
+    return Markup(markup)
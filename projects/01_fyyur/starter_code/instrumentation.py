@@ -0,0 +1,84 @@
+#----------------------------------------------------------------------------#
+# Per-request SQL instrumentation.
+#
+# Counts the statements each request executes and the time spent in the
+# database, reports both along with the total latency in a Server-Timing
+# header, and logs statements slower than SLOW_QUERY_THRESHOLD_MS with the
+# route that ran them. Everything is switched off by SQL_INSTRUMENTATION.
+#----------------------------------------------------------------------------#
+
+import os
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+class RequestStats(object):
+  '''
+    What a single request cost so far.
+  '''
+  __slots__ = ('started_at', 'queries', 'db_time')
+
+  def __init__(self):
+    self.started_at = time.perf_counter()
+    self.queries = 0
+    self.db_time = 0.0
+
+  @property
+  def elapsed(self):
+    return time.perf_counter() - self.started_at
+
+  def server_timing(self):
+    return (f'db;dur={self.db_time * 1000:.2f};desc="{self.queries} queries", '
+            f'total;dur={self.elapsed * 1000:.2f}')
+
+def request_stats():
+  '''
+    The RequestStats of the current request, or None outside
+    of a request or when instrumentation is switched off.
+  '''
+  if not has_request_context():
+    return None
+  return g.get('request_stats')
+
+def init_instrumentation(app, db):
+  app.config.setdefault('SQL_INSTRUMENTATION', os.environ.get('SQL_INSTRUMENTATION', 'true') == 'true')
+  app.config.setdefault('SLOW_QUERY_THRESHOLD_MS', int(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100)))
+
+  logger = app.logger.getChild('sql')
+  engine = db.get_engine(app)
+
+  @event.listens_for(engine, 'before_cursor_execute')
+  def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+      context.query_started_at = time.perf_counter()
+
+  @event.listens_for(engine, 'after_cursor_execute')
+  def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = getattr(context, 'query_started_at', None)
+    stats = request_stats()
+    if started_at is None or stats is None:
+      return
+
+    elapsed = time.perf_counter() - started_at
+    stats.queries += 1
+    stats.db_time += elapsed
+
+    threshold = app.config['SLOW_QUERY_THRESHOLD_MS']
+    if threshold is not None and elapsed * 1000 >= threshold:
+      logger.warning('slow query (%.1f ms) in %s %s [%s]: %s',
+                     elapsed * 1000, request.method, request.path, request.endpoint, statement)
+
+  @app.before_request
+  def start_request_stats():
+    if app.config['SQL_INSTRUMENTATION']:
+      g.request_stats = RequestStats()
+
+  @app.after_request
+  def add_server_timing(response):
+    # Streamed pages only render as the body is sent, after this
+    # runs, so their timings cover the work done by the view itself.
+    stats = request_stats()
+    if stats is not None:
+      response.headers['Server-Timing'] = stats.server_timing()
+    return response
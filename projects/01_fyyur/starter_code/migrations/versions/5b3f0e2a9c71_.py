@@ -0,0 +1,42 @@
+"""trigram search indexes for venues and artists
+
+Revision ID: 5b3f0e2a9c71
+Revises: 2876daad2897
+Create Date: 2020-08-16 18:42:31.220147
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b3f0e2a9c71'
+down_revision = '2876daad2897'
+branch_labels = None
+depends_on = None
+
+SEARCH_INDEXES = [
+    (table, column)
+    for table in ('Venue', 'Artist')
+    for column in ('name', 'city', 'state')
+]
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    for table, column in SEARCH_INDEXES:
+        op.create_index(f'ix_{table}_{column}_trgm', table, [column],
+                        postgresql_using='gin',
+                        postgresql_ops={column: 'gin_trgm_ops'})
+
+    op.create_index('ix_Venue_genres', 'Venue', ['genres'], postgresql_using='gin')
+    op.create_index('ix_Artist_genres', 'Artist', ['genres'], postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_Artist_genres', table_name='Artist')
+    op.drop_index('ix_Venue_genres', table_name='Venue')
+
+    for table, column in reversed(SEARCH_INDEXES):
+        op.drop_index(f'ix_{table}_{column}_trgm', table_name=table)
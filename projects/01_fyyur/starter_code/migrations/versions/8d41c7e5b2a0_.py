@@ -0,0 +1,32 @@
+"""version and updated_at columns for venues, artists and shows
+
+Revision ID: 8d41c7e5b2a0
+Revises: 5b3f0e2a9c71
+Create Date: 2020-08-23 11:05:47.318402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d41c7e5b2a0'
+down_revision = '5b3f0e2a9c71'
+branch_labels = None
+depends_on = None
+
+TABLES = ('Venue', 'Artist', 'Show')
+
+
+def upgrade():
+    for table in TABLES:
+        op.add_column(table, sa.Column('version', sa.Integer(), nullable=False,
+                                       server_default='1'))
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                       server_default=sa.text("timezone('utc', now())")))
+
+
+def downgrade():
+    for table in TABLES:
+        op.drop_column(table, 'updated_at')
+        op.drop_column(table, 'version')
@@ -0,0 +1,40 @@
+"""trigram search indexes for venue and artist genres
+
+Revision ID: e7a2c94d1f38
+Revises: 8d41c7e5b2a0
+Create Date: 2020-08-27 09:14:52.604118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a2c94d1f38'
+down_revision = '8d41c7e5b2a0'
+branch_labels = None
+depends_on = None
+
+# Must stay identical to CREATE_SEARCH_GENRES in search.py.
+CREATE_SEARCH_GENRES = '''
+CREATE OR REPLACE FUNCTION search_genres(genres varchar[]) RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$ SELECT array_to_string(genres, ' ') $$
+'''
+
+TABLES = ('Venue', 'Artist')
+
+
+def upgrade():
+    op.execute(CREATE_SEARCH_GENRES)
+
+    for table in TABLES:
+        op.execute(f'CREATE INDEX "ix_{table}_genres_trgm" ON "{table}" '
+                   f'USING gin (search_genres(genres) gin_trgm_ops)')
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        op.drop_index(f'ix_{table}_genres_trgm', table_name=table)
+
+    op.execute('DROP FUNCTION search_genres(varchar[])')
@@ -1,19 +1,93 @@
 from datetime import datetime
+from sqlalchemy import case, func
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.declarative import declared_attr
+from sqlalchemy.sql.expression import FunctionElement
 from app import db
 
-class Show(db.Model):
+class utc_now(FunctionElement):
+  '''
+    The current UTC time, as a naive timestamp, for server
+    defaults. It renders the same expression on PostgreSQL as
+    migration 8d41c7e5b2a0, so tables made by create_all match
+    migrated ones; SQLite's CURRENT_TIMESTAMP is already UTC.
+  '''
+  type = db.DateTime()
+  name = 'utc_now'
+
+@compiles(utc_now)
+def compile_utc_now(element, compiler, **kw):
+  return 'CURRENT_TIMESTAMP'
+
+@compiles(utc_now, 'postgresql')
+def compile_utc_now_postgresql(element, compiler, **kw):
+  return "timezone('utc', now())"
+
+def split_timeline(shows):
+  '''
+    Splits a list of shows ordered by start_time into
+    (past_shows, upcoming_shows), using a single snapshot
+    of the current time for the whole list.
+  '''
+  now = datetime.utcnow()
+  split_at = len(shows)
+
+  for index, show in enumerate(shows):
+    if show['start_time'] >= now:
+      split_at = index
+      break
+
+  return shows[:split_at], shows[split_at:]
+
+class Versioned(object):
+  '''
+    Adds a version, bumped by the ORM on every UPDATE (which
+    also makes concurrent edits of a row fail instead of
+    silently overwriting each other), and the time of the
+    last change.
+  '''
+  version = db.Column(db.Integer, nullable=False, server_default='1')
+  updated_at = db.Column(db.DateTime, nullable=False,
+                         default=datetime.utcnow,
+                         onupdate=datetime.utcnow,
+                         server_default=utc_now())
+
+  @declared_attr
+  def __mapper_args__(cls):
+    return { 'version_id_col': cls.__table__.c.version }
+
+def page_version(version, updated_at, shows, other_model):
+  '''
+    The version and last modification time of a venue or
+    artist page: its own, its shows' and those of the
+    artists or venues it shares them with. The number of
+    upcoming shows is part of the version, so the page
+    changes as soon as one of them starts.
+  '''
+  now = datetime.utcnow()
+  count, upcoming, shows_updated_at, others_updated_at = \
+    shows.with_entities(func.count(Show.id),
+                        func.sum(case([(Show.start_time >= now, 1)], else_=0)),
+                        func.max(Show.updated_at),
+                        func.max(other_model.updated_at)) \
+         .one()
+
+  last_modified = max(filter(None, (updated_at, shows_updated_at, others_updated_at)))
+  return f'{version}-{count}-{upcoming or 0}-{others_updated_at and others_updated_at.isoformat()}', last_modified
+
+class Show(Versioned, db.Model):
     __tablename__ = 'Show'
     id = db.Column(db.Integer, primary_key=True)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
 
-class Venue(db.Model):
+class Venue(Versioned, db.Model):
     __tablename__ = 'Venue'
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
-    genres = db.Column(db.ARRAY(db.String(100)))
+    genres = db.Column(db.ARRAY(db.String(100)).with_variant(db.JSON, 'sqlite'))
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     address = db.Column(db.String(120))
@@ -26,41 +100,33 @@ class Venue(db.Model):
 
     shows = db.relationship('Show', backref='venue', lazy = True)
 
-    def get_upcoming_shows(self):
-      data = []
-
-      for show in self.shows:
-        if (show.start_time < datetime.utcnow()):
-          continue
-
-        artist = Artist.query.get(show.artist_id)
-        data.append({
-          'artist_id': artist.id,
-          'artist_name': artist.name,
-          'artist_image_link': artist.image_link,
-          'start_time': show.start_time
-        })
-        
-      return data
-
-    def get_past_shows(self):
-      data = []
-
-      for show in self.shows:
-        if (show.start_time >= datetime.utcnow()):
-          continue
-
-        artist = Artist.query.get(show.artist_id)
-        data.append({
-          'artist_id': artist.id,
-          'artist_name': artist.name,
-          'artist_image_link': artist.image_link,
-          'start_time': show.start_time
-        })
-        
-      return data
-
-class Artist(db.Model):
+    def get_page_version(self):
+      return page_version(self.version, self.updated_at,
+                          db.session.query(Show)
+                                    .join(Artist, Show.artist_id == Artist.id)
+                                    .filter(Show.venue_id == self.id),
+                          Artist)
+
+    def get_shows_timeline(self):
+      rows = db.session.query(Show.start_time,
+                              Artist.id,
+                              Artist.name,
+                              Artist.image_link) \
+                       .join(Artist, Show.artist_id == Artist.id) \
+                       .filter(Show.venue_id == self.id) \
+                       .order_by(Show.start_time) \
+                       .all()
+
+      return split_timeline([
+        {
+          'artist_id': artist_id,
+          'artist_name': artist_name,
+          'artist_image_link': artist_image_link,
+          'start_time': start_time
+        } for start_time, artist_id, artist_name, artist_image_link in rows
+      ])
+
+class Artist(Versioned, db.Model):
     __tablename__ = 'Artist'
 
     id = db.Column(db.Integer, primary_key=True)
@@ -68,7 +134,7 @@ class Artist(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(100)))
+    genres = db.Column(db.ARRAY(db.String(100)).with_variant(db.JSON, 'sqlite'))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
@@ -77,36 +143,28 @@ class Artist(db.Model):
 
     shows = db.relationship('Show', backref='artist', lazy = True)
 
-    def get_upcoming_shows(self):
-      data = []
-
-      for show in self.shows:
-        if (show.start_time < datetime.utcnow()):
-          continue
-
-        venue = Venue.query.get(show.venue_id)
-        data.append({
-          'venue_id': venue.id,
-          'venue_name': venue.name,
-          'venue_image_link': venue.image_link,
-          'start_time': show.start_time
-        })
-        
-      return data
-
-    def get_past_shows(self):
-      data = []
-
-      for show in self.shows:
-        if (show.start_time >= datetime.utcnow()):
-          continue
-
-        venue = Venue.query.get(show.venue_id)
-        data.append({
-          'venue_id': venue.id,
-          'venue_name': venue.name,
-          'venue_image_link': venue.image_link,
-          'start_time': show.start_time
-        })
-        
-      return data
+    def get_page_version(self):
+      return page_version(self.version, self.updated_at,
+                          db.session.query(Show)
+                                    .join(Venue, Show.venue_id == Venue.id)
+                                    .filter(Show.artist_id == self.id),
+                          Venue)
+
+    def get_shows_timeline(self):
+      rows = db.session.query(Show.start_time,
+                              Venue.id,
+                              Venue.name,
+                              Venue.image_link) \
+                       .join(Venue, Show.venue_id == Venue.id) \
+                       .filter(Show.artist_id == self.id) \
+                       .order_by(Show.start_time) \
+                       .all()
+
+      return split_timeline([
+        {
+          'venue_id': venue_id,
+          'venue_name': venue_name,
+          'venue_image_link': venue_image_link,
+          'start_time': start_time
+        } for start_time, venue_id, venue_name, venue_image_link in rows
+      ])
@@ -0,0 +1,156 @@
+#----------------------------------------------------------------------------#
+# Venue and artist search.
+#
+# PostgreSQL databases are searched through the pg_trgm indexes created by
+# migrations 5b3f0e2a9c71 and e7a2c94d1f38, which let ILIKE '%term%' and
+# similarity() avoid a sequential scan. SQLite databases (local development
+# and tests) get an FTS5 index per table, kept in sync by triggers. Both
+# match the rows containing every word of the search in any of the columns.
+#----------------------------------------------------------------------------#
+
+from sqlalchemy import DDL, and_, event, func, or_, text
+from app import app, db
+from models import Venue, Artist
+
+SEARCHABLE_MODELS = (Venue, Artist)
+SEARCHABLE_COLUMNS = ('name', 'city', 'state', 'genres')
+
+#----------------------------------------------------------------------------#
+# SQLite FTS5 index.
+#----------------------------------------------------------------------------#
+
+def fts_table_name(model):
+  return f'{model.__tablename__}_fts'
+
+def create_fts_ddl(model):
+  table = model.__tablename__
+  fts_table = fts_table_name(model)
+  columns = ', '.join(SEARCHABLE_COLUMNS)
+  new_values = ', '.join(f'new.{column}' for column in SEARCHABLE_COLUMNS)
+  old_values = ', '.join(f'old.{column}' for column in SEARCHABLE_COLUMNS)
+
+  return [
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS "{fts_table}" '
+    f'USING fts5({columns}, content="{table}", content_rowid="id")',
+    f'CREATE TRIGGER IF NOT EXISTS "{fts_table}_ai" AFTER INSERT ON "{table}" BEGIN '
+    f'INSERT INTO "{fts_table}"(rowid, {columns}) VALUES (new.id, {new_values}); END',
+    f'CREATE TRIGGER IF NOT EXISTS "{fts_table}_ad" AFTER DELETE ON "{table}" BEGIN '
+    f'INSERT INTO "{fts_table}"("{fts_table}", rowid, {columns}) '
+    f'VALUES (\'delete\', old.id, {old_values}); END',
+    f'CREATE TRIGGER IF NOT EXISTS "{fts_table}_au" AFTER UPDATE ON "{table}" BEGIN '
+    f'INSERT INTO "{fts_table}"("{fts_table}", rowid, {columns}) '
+    f'VALUES (\'delete\', old.id, {old_values}); '
+    f'INSERT INTO "{fts_table}"(rowid, {columns}) VALUES (new.id, {new_values}); END',
+  ]
+
+for model in SEARCHABLE_MODELS:
+  for statement in create_fts_ddl(model):
+    event.listen(model.__table__,
+                 'after_create',
+                 DDL(statement).execute_if(dialect='sqlite'))
+
+  event.listen(model.__table__,
+               'before_drop',
+               DDL(f'DROP TABLE IF EXISTS "{fts_table_name(model)}"').execute_if(dialect='sqlite'))
+
+def fts_query(search_term):
+  '''
+    Turns free text into an FTS5 query matching every word
+    as a prefix, quoting words so user input can never be
+    interpreted as FTS5 syntax.
+  '''
+  words = search_term.split()
+  return ' '.join('"{}"*'.format(word.replace('"', '""')) for word in words)
+
+def search_fts(model, search_term, page, per_page):
+  fts_table = fts_table_name(model)
+  params = {
+    'query': fts_query(search_term),
+    'limit': per_page,
+    'offset': (page - 1) * per_page
+  }
+
+  count = db.session.execute(text(f'SELECT count(*) FROM "{fts_table}" '
+                                  f'WHERE "{fts_table}" MATCH :query'),
+                             params).scalar()
+  ids = [row[0] for row in db.session.execute(text(f'SELECT rowid FROM "{fts_table}" '
+                                                   f'WHERE "{fts_table}" MATCH :query '
+                                                   f'ORDER BY bm25("{fts_table}"), rowid '
+                                                   f'LIMIT :limit OFFSET :offset'),
+                                              params)]
+
+  items = { item.id: item for item in model.query.filter(model.id.in_(ids)) }
+  return count, [items[id] for id in ids if id in items]
+
+#----------------------------------------------------------------------------#
+# PostgreSQL trigram index.
+#----------------------------------------------------------------------------#
+
+# Genres as one string, for ILIKE and similarity(). Declared immutable, as
+# array_to_string is not, so that it can be indexed; the same function is
+# created by migration e7a2c94d1f38.
+CREATE_SEARCH_GENRES = '''
+CREATE OR REPLACE FUNCTION search_genres(genres varchar[]) RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$ SELECT array_to_string(genres, ' ') $$
+'''
+
+event.listen(db.metadata, 'before_create',
+             DDL(CREATE_SEARCH_GENRES).execute_if(dialect='postgresql'))
+
+def like_pattern(word):
+  '''
+    The ILIKE pattern matching word anywhere, with the
+    wildcards it may contain escaped.
+  '''
+  escaped = word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+  return f'%{escaped}%'
+
+def search_trigram(model, search_term, page, per_page):
+  columns = (model.name, model.city, model.state, func.search_genres(model.genres))
+  words = search_term.split()
+
+  # Every word must appear in one of the columns, like the FTS5
+  # query; the best matching column of each word adds to the rank.
+  matches = and_(*(or_(*(column.ilike(like_pattern(word), escape='\\') for column in columns))
+                   for word in words))
+  rank = sum(func.greatest(*(func.similarity(column, word) for column in columns))
+             for word in words)
+
+  results = model.query \
+                 .filter(matches) \
+                 .order_by(rank.desc(), model.id) \
+                 .paginate(page, per_page, error_out=False)
+
+  return results.total, results.items
+
+#----------------------------------------------------------------------------#
+# Search entry point.
+#----------------------------------------------------------------------------#
+
+def search(model, search_term, page=1, per_page=None):
+  '''
+    Searches name, city, state and genres of a venue or artist,
+    best matches first.
+
+    :param model: Venue or Artist
+    :param search_term: free text typed by the user
+    :param page: 1-based results page
+    :param per_page: results per page, defaults to SEARCH_RESULTS_PER_PAGE
+
+    Returns a (total number of matches, page of results) tuple.
+  '''
+  per_page = per_page or app.config['SEARCH_RESULTS_PER_PAGE']
+  page = max(page, 1)
+  search_term = search_term.strip()
+
+  if not search_term:
+    results = model.query \
+                   .order_by(model.name, model.id) \
+                   .paginate(page, per_page, error_out=False)
+    return results.total, results.items
+
+  if db.engine.dialect.name == 'sqlite':
+    return search_fts(model, search_term, page, per_page)
+
+  return search_trigram(model, search_term, page, per_page)
@@ -0,0 +1,134 @@
+#----------------------------------------------------------------------------#
+# Synthetic data for development and benchmarks.
+#
+#   flask seed-data --venues 1000 --artists 5000 --shows 100000
+#
+# The same seed always produces the same rows. Popularity is skewed the
+# way real listings are: a few venues and artists host most of the shows
+# (a Zipf distribution over their ids), and most shows are in the past.
+#----------------------------------------------------------------------------#
+
+import random
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+import click
+
+from app import app
+from models import Venue, Artist, Show
+from bulk import import_rows
+
+WORDS = ['blue', 'note', 'hop', 'musical', 'park', 'square', 'live', 'music', 'coffee',
+         'jazz', 'club', 'hall', 'room', 'lounge', 'garden', 'stage', 'theatre', 'den',
+         'petals', 'guns', 'quevedo', 'matt', 'sparks', 'wild', 'fire', 'river', 'moon']
+CITIES = [('San Francisco', 'CA'), ('New York', 'NY'), ('Seattle', 'WA'), ('Austin', 'TX'),
+          ('Chicago', 'IL'), ('Denver', 'CO'), ('Nashville', 'TN'), ('New Orleans', 'LA'),
+          ('Portland', 'OR'), ('Boston', 'MA'), ('Atlanta', 'GA'), ('Miami', 'FL')]
+GENRES = ['Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk',
+          'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop',
+          'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul', 'Swing', 'Other']
+
+# Weight of the city and of the genre at each rank, so a handful of
+# cities and genres dominate like they do in real listings.
+CITY_WEIGHTS = list(accumulate(1 / rank for rank in range(1, len(CITIES) + 1)))
+GENRE_WEIGHTS = list(accumulate(1 / rank for rank in range(1, len(GENRES) + 1)))
+
+def zipf_weights(count, exponent):
+  '''
+    Cumulative weights of ids 1..count, the id at rank
+    r weighing 1 / r ** exponent.
+  '''
+  return list(accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+def random_name(rng):
+  return ' '.join(rng.sample(WORDS, rng.randint(2, 3))).title()
+
+def random_genres(rng):
+  genres = rng.choices(GENRES, cum_weights=GENRE_WEIGHTS, k=rng.randint(1, 3))
+  return sorted(set(genres))
+
+def random_place(rng):
+  return rng.choices(CITIES, cum_weights=CITY_WEIGHTS)[0]
+
+def random_phone(rng):
+  return f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(0, 9999):04d}'
+
+def generate_venues(count, rng):
+  for venue_id in range(1, count + 1):
+    city, state = random_place(rng)
+    seeking_talent = rng.random() < 0.3
+    yield {
+      'id': venue_id,
+      'name': random_name(rng),
+      'genres': random_genres(rng),
+      'city': city,
+      'state': state,
+      'address': f'{rng.randint(1, 9999)} {random_name(rng)} Street',
+      'phone': random_phone(rng),
+      'seeking_talent': seeking_talent,
+      'seeking_description': 'Looking for local artists.' if seeking_talent else None
+    }
+
+def generate_artists(count, rng):
+  for artist_id in range(1, count + 1):
+    city, state = random_place(rng)
+    seeking_venue = rng.random() < 0.4
+    yield {
+      'id': artist_id,
+      'name': random_name(rng),
+      'genres': random_genres(rng),
+      'city': city,
+      'state': state,
+      'phone': random_phone(rng),
+      'seeking_venue': seeking_venue,
+      'seeking_description': 'Looking for shows to perform at.' if seeking_venue else None
+    }
+
+def generate_shows(count, venues, artists, rng, past_fraction=0.8, skew=1.1, now=None):
+  '''
+    Shows between venue ids 1..venues and artist ids
+    1..artists. Low ids are the popular ones: with the
+    default skew the top 1% of 1000 venues host about half
+    of all shows. past_fraction of the shows started
+    within the last three years, the rest start within
+    the next six months.
+  '''
+  now = now or datetime.utcnow().replace(microsecond=0)
+  venue_weights = zipf_weights(venues, skew)
+  artist_weights = zipf_weights(artists, skew)
+  venue_ids = range(1, venues + 1)
+  artist_ids = range(1, artists + 1)
+
+  for _ in range(count):
+    if rng.random() < past_fraction:
+      offset = -timedelta(minutes=rng.randint(1, 3 * 365 * 24 * 60))
+    else:
+      offset = timedelta(minutes=rng.randint(1, 183 * 24 * 60))
+
+    yield {
+      'venue_id': rng.choices(venue_ids, cum_weights=venue_weights)[0],
+      'artist_id': rng.choices(artist_ids, cum_weights=artist_weights)[0],
+      'start_time': now + offset
+    }
+
+def seed_database(venues, artists, shows, seed=1, batch_size=5000, **options):
+  '''
+    Inserts generated venues, artists and shows into empty
+    tables. Extra options are passed on to generate_shows.
+  '''
+  rng = random.Random(seed)
+  import_rows(Venue, generate_venues(venues, rng), batch_size=batch_size)
+  import_rows(Artist, generate_artists(artists, rng), batch_size=batch_size)
+  if venues and artists:
+    import_rows(Show, generate_shows(shows, venues, artists, rng, **options), batch_size=batch_size)
+
+@app.cli.command('seed-data')
+@click.option('--venues', default=1000, show_default=True)
+@click.option('--artists', default=5000, show_default=True)
+@click.option('--shows', default=100000, show_default=True)
+@click.option('--seed', default=1, show_default=True)
+@click.option('--past-fraction', default=0.8, show_default=True)
+def seed_data(venues, artists, shows, seed, past_fraction):
+  '''Fills empty tables with synthetic venues, artists and shows.'''
+  seed_database(venues, artists, shows, seed=seed, past_fraction=past_fraction)
+  click.echo(f'Seeded {venues} venues, {artists} artists and {shows} shows')
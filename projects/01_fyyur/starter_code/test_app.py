@@ -0,0 +1,696 @@
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from sqlalchemy import create_engine, event
+
+from app import app, db, cache, fragment_cache, format_datetime
+from cache import LRUCache, FileCache
+from models import Venue, Artist, Show
+from search import search, search_trigram
+from bulk import import_rows, export_rows, read_rows
+from seed import seed_database
+from metrics import Metrics
+from pool import engine_options
+
+
+class QueryCounter(object):
+    """Counts the SQL statements executed while it is active"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _before_cursor_execute(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        app.config['TESTING'] = True
+        self.client = app.test_client
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+        cache.clear()
+        fragment_cache.clear()
+
+    def tearDown(self):
+        """Executed after reach test"""
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def add_shows(self, venue, artist, count):
+        now = datetime.utcnow()
+        for i in range(count):
+            offset = timedelta(days=i + 1)
+            start_time = now - offset if i % 2 else now + offset
+            db.session.add(Show(venue_id=venue.id,
+                                artist_id=artist.id,
+                                start_time=start_time))
+        db.session.commit()
+
+    def create_venue_and_artist(self):
+        venue = Venue(name='The Musical Hop', city='San Francisco', state='CA', genres=['Jazz'])
+        artist = Artist(name='Guns N Petals', city='San Francisco', state='CA', genres=['Rock n Roll'])
+        db.session.add_all([venue, artist])
+        db.session.commit()
+        return venue, artist
+
+    def count_queries(self, path):
+        with QueryCounter(db.engine) as counter:
+            res = self.client().get(path)
+        self.assertEqual(res.status_code, 200)
+        return counter.count
+
+    def test_show_timeline_is_split_by_start_time(self):
+        venue, artist = self.create_venue_and_artist()
+        self.add_shows(venue, artist, 5)
+
+        past_shows, upcoming_shows = venue.get_shows_timeline()
+
+        self.assertEqual(len(past_shows), 2)
+        self.assertEqual(len(upcoming_shows), 3)
+        self.assertEqual(past_shows[0]['artist_name'], 'Guns N Petals')
+        self.assertTrue(all(show['start_time'] >= datetime.utcnow() for show in upcoming_shows))
+
+        past_shows, upcoming_shows = artist.get_shows_timeline()
+
+        self.assertEqual(len(past_shows), 2)
+        self.assertEqual(upcoming_shows[0]['venue_name'], 'The Musical Hop')
+
+    def test_show_pages_use_constant_number_of_queries(self):
+        venue, artist = self.create_venue_and_artist()
+        venue_path = f'/venues/{venue.id}'
+        artist_path = f'/artists/{artist.id}'
+
+        self.add_shows(venue, artist, 2)
+        venue_queries = self.count_queries(venue_path)
+        artist_queries = self.count_queries(artist_path)
+
+        self.add_shows(venue, artist, 50)
+        self.assertEqual(self.count_queries(venue_path), venue_queries)
+        self.assertEqual(self.count_queries(artist_path), artist_queries)
+
+    def test_shows_are_paginated_by_cursor(self):
+        venue, artist = self.create_venue_and_artist()
+        self.add_shows(venue, artist, app.config['SHOWS_PER_PAGE'] + 5)
+
+        res = self.client().get('/shows')
+        body = res.get_data(as_text=True)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(body.count('tile-show'), app.config['SHOWS_PER_PAGE'])
+        self.assertIn('Older shows', body)
+
+        first = Show.query.order_by(Show.start_time.desc(), Show.id.desc()) \
+                          .offset(app.config['SHOWS_PER_PAGE'] - 1) \
+                          .first()
+        res = self.client().get('/shows',
+                                query_string={'before': f'{first.start_time.isoformat()}_{first.id}'})
+        body = res.get_data(as_text=True)
+
+        self.assertEqual(body.count('tile-show'), 5)
+        self.assertNotIn('Older shows', body)
+
+    def test_shows_use_constant_number_of_queries(self):
+        venue, artist = self.create_venue_and_artist()
+
+        self.add_shows(venue, artist, 2)
+        queries = self.count_queries('/shows')
+
+        self.add_shows(venue, artist, 50)
+        self.assertEqual(self.count_queries('/shows'), queries)
+
+    def test_shows_invalid_cursor(self):
+        res = self.client().get('/shows', query_string={'before': 'yesterday'})
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_search_matches_name_city_and_genres(self):
+        self.create_venue_and_artist()
+        db.session.add(Venue(name='Park Square Live Music & Coffee', city='Seattle', state='WA',
+                             genres=['Folk', 'Classical']))
+        db.session.commit()
+
+        count, data = search(Venue, 'music')
+        self.assertEqual(count, 2)
+        self.assertEqual({venue.name for venue in data},
+                         {'The Musical Hop', 'Park Square Live Music & Coffee'})
+
+        self.assertEqual(search(Venue, 'seattle')[0], 1)
+        self.assertEqual(search(Venue, 'folk')[0], 1)
+        self.assertEqual(search(Artist, 'petals')[0], 1)
+        self.assertEqual(search(Artist, 'hop')[0], 0)
+
+    def test_search_matches_every_word_across_columns(self):
+        self.create_venue_and_artist()
+        db.session.add(Venue(name='The Dueling Pianos Bar', city='New York', state='NY',
+                             genres=['Jazz', 'Classical']))
+        db.session.commit()
+
+        count, data = search(Venue, 'jazz san francisco')
+        self.assertEqual(count, 1)
+        self.assertEqual(data[0].name, 'The Musical Hop')
+
+        self.assertEqual(search(Venue, 'JAZZ')[0], 2)
+        self.assertEqual(search(Venue, 'jazz seattle')[0], 0)
+
+    def test_search_reflects_edits_and_deletes(self):
+        venue, artist = self.create_venue_and_artist()
+
+        venue.name = 'The Dueling Pianos Bar'
+        db.session.commit()
+        self.assertEqual(search(Venue, 'musical')[0], 0)
+        self.assertEqual(search(Venue, 'pianos')[0], 1)
+
+        db.session.delete(venue)
+        db.session.commit()
+        self.assertEqual(search(Venue, 'pianos')[0], 0)
+
+    def test_search_is_paginated(self):
+        db.session.add_all([Artist(name=f'Band {i}', city='Austin', state='TX')
+                            for i in range(app.config['SEARCH_RESULTS_PER_PAGE'] + 3)])
+        db.session.commit()
+
+        res = self.client().post('/artists/search', data={'search_term': 'band'})
+        body = res.get_data(as_text=True)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(f'"band": {app.config["SEARCH_RESULTS_PER_PAGE"] + 3}', body)
+        self.assertIn('More results', body)
+
+        res = self.client().post('/artists/search', data={'search_term': 'band', 'page': 2})
+
+        self.assertEqual(res.get_data(as_text=True).count('<h5>Band'), 3)
+
+    def test_search_ignores_fts_syntax(self):
+        self.create_venue_and_artist()
+
+        self.assertEqual(search(Venue, 'hop" OR "x')[0], 0)
+        self.assertEqual(search(Venue, '   ')[0], 1)
+
+    def test_updated_at_server_default_is_utc(self):
+        from sqlalchemy.dialects import postgresql
+        from sqlalchemy.schema import CreateTable
+
+        ddl = str(CreateTable(Venue.__table__).compile(dialect=postgresql.dialect()))
+        self.assertIn("updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT timezone('utc', now())", ddl)
+
+        db.session.execute(Venue.__table__.insert().values(name='Park Square', city='Seattle', state='WA'))
+        updated_at = db.session.query(Venue.updated_at).scalar()
+        self.assertLess(abs(updated_at - datetime.utcnow()), timedelta(minutes=1))
+
+    def test_venues_directory_is_cached(self):
+        venue, artist = self.create_venue_and_artist()
+        self.add_shows(venue, artist, 3)
+
+        self.assertIn('The Musical Hop', self.client().get('/venues').get_data(as_text=True))
+        # Only the listing's version is read.
+        self.assertEqual(self.count_queries('/venues'), 1)
+
+        version, areas = cache.get('venues:areas')
+        self.assertEqual(areas[0]['city'], 'San Francisco')
+        self.assertEqual(areas[0]['venues'][0]['num_upcoming_shows'], 2)
+
+    def test_venues_directory_follows_writes_made_elsewhere(self):
+        self.create_venue_and_artist()
+        etag = self.client().get('/venues').headers['ETag']
+
+        # Written outside the request path, as another worker or a script would.
+        db.session.add(Venue(name='Park Square', city='Seattle', state='WA'))
+        db.session.commit()
+
+        res = self.client().get('/venues', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('Park Square', res.get_data(as_text=True))
+
+        res = self.client().get('/venues', headers={'If-None-Match': res.headers['ETag']})
+        self.assertEqual(res.status_code, 304)
+
+    def test_venues_directory_is_invalidated_by_venue_edits(self):
+        self.client().get('/venues')
+
+        self.client().post('/venues/create', data={
+            'name': 'The Dueling Pianos Bar',
+            'city': 'New York',
+            'state': 'NY',
+            'address': '335 Delancey Street',
+            'phone': '914-003-1132',
+            'genres': ['Classical'],
+            'image_link': '',
+            'facebook_link': ''
+        })
+        self.assertIn('The Dueling Pianos Bar', self.client().get('/venues').get_data(as_text=True))
+
+        venue_id = Venue.query.filter_by(name='The Dueling Pianos Bar').one().id
+        self.client().post(f'/venues/{venue_id}/edit', data={
+            'name': 'Park Square Live Music & Coffee',
+            'city': 'Seattle',
+            'state': 'WA',
+            'address': '34 Whiskey Moore Ave',
+            'phone': '415-000-1234',
+            'genres': ['Folk'],
+            'facebook_link': ''
+        })
+        body = self.client().get('/venues').get_data(as_text=True)
+        self.assertIn('Park Square Live Music &amp; Coffee', body)
+        self.assertIn('Seattle, WA', body)
+
+        self.client().delete(f'/venues/{venue_id}')
+        self.assertNotIn('Park Square', self.client().get('/venues').get_data(as_text=True))
+
+    def test_show_missing_venue(self):
+        res = self.client().get('/venues/1000')
+
+        self.assertEqual(res.status_code, 404)
+
+    def test_import_skips_invalid_rows(self):
+        venue, artist = self.create_venue_and_artist()
+        errors = []
+
+        imported, skipped = import_rows(Show, [
+            {'venue_id': str(venue.id), 'artist_id': str(artist.id), 'start_time': '2035-04-01T20:00:00'},
+            {'venue_id': '1000', 'artist_id': str(artist.id), 'start_time': '2035-04-01T20:00:00'},
+            {'venue_id': str(venue.id), 'artist_id': str(artist.id), 'start_time': 'not a date'},
+            {'venue_id': str(venue.id), 'artist_id': str(artist.id)}
+        ], batch_size=2, on_error=lambda number, message: errors.append(number))
+
+        self.assertEqual((imported, skipped), (1, 3))
+        self.assertEqual(errors, [2, 3, 4])
+        self.assertEqual(Show.query.count(), 1)
+
+    def test_import_skips_malformed_ndjson_lines(self):
+        errors = []
+        file = io.StringIO('\n'.join([
+            '{"name": "Park Square", "city": "Seattle", "state": "WA", "genres": ["Folk"]}',
+            '{"name": "Park Square", "city": ',
+            '["Park Square", "Seattle", "WA"]',
+            '{"name": "Park Square", "city": "Seattle", "state": "WA", "genres": 5}',
+            '{"name": "Park Square", "city": "Seattle", "state": "WA", "genres": [5]}',
+            '{"name": {"first": "Park"}, "city": "Seattle", "state": "WA"}',
+            '{"name": "The Musical Hop", "city": "San Francisco", "state": "CA", "genres": "Jazz"}'
+        ]))
+
+        imported, skipped = import_rows(Venue, read_rows(file, 'ndjson'), batch_size=3,
+                                        on_error=lambda number, message: errors.append(number))
+
+        self.assertEqual((imported, skipped), (2, 5))
+        self.assertEqual(errors, [2, 3, 4, 5, 6])
+        self.assertEqual([venue.genres for venue in Venue.query.order_by(Venue.id)], [['Folk'], ['Jazz']])
+
+    def test_export_round_trips_through_import(self):
+        imported, skipped = import_rows(Venue, [
+            {'name': 'Park Square', 'city': 'Seattle', 'state': 'WA', 'genres': 'Folk, Jazz'},
+            {'name': 'The Dueling Pianos Bar', 'city': 'New York', 'state': 'NY', 'genres': '["Classical"]',
+             'seeking_talent': 'true'}
+        ])
+        self.assertEqual((imported, skipped), (2, 0))
+
+        for file_format in ('csv', 'ndjson'):
+            file = io.StringIO()
+            self.assertEqual(export_rows(Venue, file, file_format, batch_size=1), 2)
+            self.assertIn('Park Square', file.getvalue())
+
+        venues = Venue.query.order_by(Venue.id).all()
+        self.assertEqual(venues[0].genres, ['Folk', 'Jazz'])
+        self.assertFalse(venues[0].seeking_talent)
+        self.assertTrue(venues[1].seeking_talent)
+
+    def test_seeded_data_is_skewed_and_mostly_past(self):
+        seed_database(20, 30, 1000, seed=7)
+
+        self.assertEqual(Venue.query.count(), 20)
+        self.assertEqual(Artist.query.count(), 30)
+        self.assertEqual(Show.query.count(), 1000)
+
+        popular = Show.query.filter(Show.venue_id == 1).count()
+        unpopular = Show.query.filter(Show.venue_id == 20).count()
+        self.assertGreater(popular, unpopular * 5)
+
+        past = Show.query.filter(Show.start_time < datetime.utcnow()).count()
+        self.assertGreater(past, 700)
+
+    def test_server_timing_reports_queries(self):
+        venue, artist = self.create_venue_and_artist()
+        venue_id = venue.id
+        db.session.remove()
+
+        res = self.client().get(f'/venues/{venue_id}')
+
+        self.assertRegex(res.headers['Server-Timing'],
+                         r'^db;dur=[0-9.]+;desc="3 queries", total;dur=[0-9.]+$')
+
+    def test_slow_queries_are_logged_with_their_route(self):
+        app.config['SLOW_QUERY_THRESHOLD_MS'] = 0
+        try:
+            with self.assertLogs(app.logger.getChild('sql'), 'WARNING') as logs:
+                self.client().get('/shows')
+        finally:
+            app.config['SLOW_QUERY_THRESHOLD_MS'] = 100
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('GET /shows [shows]', logs.output[0])
+
+    def test_instrumentation_can_be_switched_off(self):
+        app.config['SQL_INSTRUMENTATION'] = False
+        try:
+            res = self.client().get('/shows')
+        finally:
+            app.config['SQL_INSTRUMENTATION'] = True
+
+        self.assertNotIn('Server-Timing', res.headers)
+
+    def test_file_cache_sweeps_expired_and_excess_entries(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_cache = FileCache(directory, threshold=3)
+            for i in range(5):
+                file_cache.set(f'page:{i}', i)
+                os.utime(file_cache._path(f'page:{i}'), (i, i))
+            # Only the first set sweeps, until sweep_interval passes.
+            for i in range(5):
+                file_cache.set(f'stale:{i}', 'markup', timeout=-1)
+
+            self.assertEqual(len(os.listdir(directory)), 10)
+            self.assertEqual(file_cache.sweep(), 3)
+            self.assertEqual(sorted(os.listdir(directory)),
+                             sorted(os.path.basename(file_cache._path(f'page:{i}')) for i in (2, 3, 4)))
+            self.assertEqual(file_cache.get('page:4'), 4)
+            self.assertIsNone(file_cache.get('page:0'))
+
+
+        venue, artist = self.create_venue_and_artist()
+        self.client().get('/venues')
+        self.client().get('/venues')
+        self.client().get(f'/venues/{venue.id}')
+
+        res = self.client().get('/metrics')
+        body = res.get_data(as_text=True)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertRegex(body, r'http_requests_total\{route="/venues",method="GET",status="200"\} [1-9]')
+        self.assertIn('http_request_duration_seconds_count{route="/venues/<int:venue_id>",method="GET"}', body)
+        self.assertRegex(body, r'http_requests_in_flight [1-9]')
+        self.assertIn('cache_hit_ratio', body)
+        self.assertIn('db_pool_checkouts_total', body)
+
+    def test_metrics_are_summed_over_threads(self):
+        metrics = Metrics(buckets=(0.1, 1.0))
+
+        def record():
+            for _ in range(100):
+                metrics.inc('requests_total')
+                metrics.observe('latency_seconds', (), 0.5)
+
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        body = metrics.render()
+        self.assertIn('requests_total 400', body)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 0', body)
+        self.assertIn('latency_seconds_bucket{le="1.0"} 400', body)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 400', body)
+        self.assertIn('latency_seconds_sum 200.0', body)
+
+    def test_metrics_retire_the_shards_of_finished_threads(self):
+        metrics = Metrics(buckets=(0.1, 1.0))
+
+        for _ in range(50):
+            thread = threading.Thread(target=metrics.observe, args=('latency_seconds', (), 0.5))
+            thread.start()
+            thread.join()
+        metrics.inc('requests_total')
+
+        self.assertLessEqual(len(metrics._shards), 2)
+        body = metrics.render()
+        self.assertIn('requests_total 1', body)
+        self.assertIn('latency_seconds_count 50', body)
+        self.assertIn('latency_seconds_sum 25.0', body)
+
+    def test_datetime_filter(self):
+        start_time = datetime(2035, 4, 1, 20, 5)
+
+        self.assertEqual(format_datetime(start_time, 'full'), 'Sunday April, 1, 2035 at 8:05PM')
+        self.assertEqual(format_datetime(start_time), 'Sun 04, 01, 2035 8:05PM')
+        self.assertEqual(format_datetime('2035-04-01 20:05:00', 'full'), 'Sunday April, 1, 2035 at 8:05PM')
+        self.assertEqual(format_datetime(start_time, 'y-MM-dd'), '2035-04-01')
+
+    def test_artist_listing_fragment_is_cached(self):
+        self.create_venue_and_artist()
+        self.client().get('/artists')
+
+        with QueryCounter(db.engine) as counter:
+            body = self.client().get('/artists').get_data(as_text=True)
+
+        self.assertEqual(counter.count, 1)
+        self.assertIn('Guns N Petals', body)
+
+    def test_venue_page_fragment_follows_edits(self):
+        venue, artist = self.create_venue_and_artist()
+        venue_id, artist_id = venue.id, artist.id
+        self.add_shows(venue, artist, 1)
+        self.client().get(f'/venues/{venue_id}')
+
+        self.client().post(f'/artists/{artist_id}/edit', data={
+            'name': 'The Wild Sax Band',
+            'image_link': '',
+            'city': 'San Francisco',
+            'state': 'CA',
+            'phone': '',
+            'genres': ['Jazz'],
+            'facebook_link': ''
+        })
+        body = self.client().get(f'/venues/{venue_id}').get_data(as_text=True)
+
+        self.assertIn('The Wild Sax Band', body)
+        self.assertNotIn('Guns N Petals', body)
+
+    def test_lru_cache_stays_within_its_byte_budget(self):
+        lru = LRUCache(max_bytes=1000)
+        value = 'x' * 300
+
+        for key in 'abcd':
+            lru.set(key, value)
+            lru.get('a')
+
+        self.assertLessEqual(lru.size, 1000)
+        self.assertIsNotNone(lru.get('a'))
+        self.assertIsNone(lru.get('b'))
+        self.assertIsNotNone(lru.get('d'))
+
+        lru.set('huge', 'x' * 2000)
+        self.assertIsNone(lru.get('huge'))
+
+    def test_edits_bump_the_version(self):
+        venue, artist = self.create_venue_and_artist()
+        updated_at = venue.updated_at
+
+        venue.name = 'Park Square'
+        db.session.commit()
+
+        self.assertEqual(venue.version, 2)
+        self.assertGreater(venue.updated_at, updated_at)
+        self.assertEqual(artist.version, 1)
+
+    def test_venue_page_revalidation(self):
+        venue, artist = self.create_venue_and_artist()
+        venue_id = venue.id
+        self.add_shows(venue, artist, 2)
+
+        res = self.client().get(f'/venues/{venue_id}')
+        etag = res.headers['ETag']
+        last_modified = res.headers['Last-Modified']
+        self.assertTrue(etag.startswith('W/'))
+
+        res = self.client().get(f'/venues/{venue_id}', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.get_data(), b'')
+
+        # Last-Modified is only informational.
+        res = self.client().get(f'/venues/{venue_id}',
+                                headers={'If-Modified-Since': last_modified})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['Last-Modified'], last_modified)
+
+        # A new show for one of the venue's artists changes the page.
+        self.add_shows(venue, artist, 1)
+        res = self.client().get(f'/venues/{venue_id}', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_artist_edit_changes_pages_showing_the_artist(self):
+        venue, artist = self.create_venue_and_artist()
+        venue_id, artist_id = venue.id, artist.id
+        self.add_shows(venue, artist, 1)
+
+        venue_etag = self.client().get(f'/venues/{venue_id}').headers['ETag']
+        artists_etag = self.client().get('/artists').headers['ETag']
+
+        artist = Artist.query.get(artist_id)
+        artist.name = 'The Wild Sax Band'
+        db.session.commit()
+
+        for path, etag in ((f'/venues/{venue_id}', venue_etag), ('/artists', artists_etag)):
+            res = self.client().get(path, headers={'If-None-Match': etag})
+            self.assertEqual(res.status_code, 200)
+            self.assertIn('The Wild Sax Band', res.get_data(as_text=True))
+
+    def test_venue_listing_revalidation(self):
+        self.create_venue_and_artist()
+        etag = self.client().get('/venues').headers['ETag']
+
+        self.assertEqual(self.client().get('/venues', headers={'If-None-Match': etag}).status_code, 304)
+
+        db.session.add(Venue(name='Park Square', city='Seattle', state='WA'))
+        db.session.commit()
+        self.assertEqual(self.client().get('/venues', headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_listing_revalidation_after_a_deletion(self):
+        venue, artist = self.create_venue_and_artist()
+        db.session.add(Venue(name='Park Square', city='Seattle', state='WA'))
+        db.session.commit()
+        venue_id = venue.id
+
+        res = self.client().get('/venues')
+        etag, last_modified = res.headers['ETag'], res.headers['Last-Modified']
+
+        self.assertEqual(self.client().delete(f'/venues/{venue_id}').status_code, 200)
+        for headers in ({'If-None-Match': etag}, {'If-Modified-Since': last_modified}):
+            res = self.client().get('/venues', headers=headers)
+            self.assertEqual(res.status_code, 200)
+            self.assertNotIn('The Musical Hop', res.get_data(as_text=True))
+
+    def test_listing_version_follows_shows(self):
+        venue, artist = self.create_venue_and_artist()
+        etag = self.client().get('/artists').headers['ETag']
+
+        self.add_shows(venue, artist, 1)
+        self.assertEqual(self.client().get('/artists', headers={'If-None-Match': etag}).status_code, 200)
+
+    def run_pool_workers(self, environ, workers, hold):
+        with tempfile.TemporaryDirectory() as directory:
+            uri = 'sqlite:///' + os.path.join(directory, 'pool.db')
+            engine = create_engine(uri, **engine_options(uri, environ))
+            barrier = threading.Barrier(workers)
+            errors = []
+
+            def work():
+                barrier.wait()
+                for _ in range(10):
+                    try:
+                        with engine.connect() as connection:
+                            connection.execute('SELECT 1')
+                            time.sleep(hold)
+                    except Exception as error:
+                        errors.append(error)
+
+            threads = [threading.Thread(target=work) for _ in range(workers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            engine.dispose()
+            return engine.pool.wait_stats, errors
+
+    def test_pool_serves_concurrent_workers_without_stalls(self):
+        stats, errors = self.run_pool_workers({ 'DB_POOL_SIZE': '8', 'DB_MAX_OVERFLOW': '8' },
+                                              workers=16, hold=0.005)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(stats.timeouts, 0)
+        self.assertEqual(stats.checkouts, 160)
+        self.assertLess(stats.max_wait, 0.5)
+
+    def test_pool_exhaustion_is_measured(self):
+        stats, errors = self.run_pool_workers({ 'DB_POOL_SIZE': '1', 'DB_MAX_OVERFLOW': '0',
+                                                'DB_POOL_TIMEOUT': '0.01' },
+                                              workers=4, hold=0.05)
+
+        self.assertGreater(stats.timeouts, 0)
+        self.assertEqual(len(errors), stats.timeouts)
+        self.assertGreaterEqual(stats.max_wait, 0.01)
+
+    def test_engine_options(self):
+        self.assertEqual(engine_options('sqlite://', {}), { 'pool_pre_ping': True })
+
+        options = engine_options('postgresql://localhost/fyyur',
+                                 { 'DB_POOL_SIZE': '5', 'DB_STATEMENT_TIMEOUT': '2000',
+                                   'DB_POOL_PRE_PING': 'false' })
+        self.assertEqual(options['pool_size'], 5)
+        self.assertFalse(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args'], { 'options': '-c statement_timeout=2000' })
+
+
+@unittest.skipUnless(app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres'),
+                     'needs DATABASE_URL pointing at PostgreSQL')
+class TrigramSearchTestCase(unittest.TestCase):
+    """Runs the PostgreSQL search, whichever database backs the other tests"""
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.session.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        db.session.commit()
+        db.create_all()
+        db.session.add_all([
+            Venue(name='The Musical Hop', city='San Francisco', state='CA',
+                  genres=['Jazz', 'Reggae']),
+            Venue(name='The Dueling Pianos Bar', city='New York', state='NY',
+                  genres=['Classical', 'R&B']),
+            Venue(name='100% Jazz Club', city='New Orleans', state='LA', genres=['Jazz']),
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_every_word_must_match_a_column(self):
+        count, data = search_trigram(Venue, 'jazz san francisco', 1, 10)
+        self.assertEqual(count, 1)
+        self.assertEqual(data[0].name, 'The Musical Hop')
+
+        self.assertEqual(search_trigram(Venue, 'jazz new', 1, 10)[0], 1)
+        self.assertEqual(search_trigram(Venue, 'jazz seattle', 1, 10)[0], 0)
+
+    def test_genres_match_case_insensitively(self):
+        self.assertEqual(search_trigram(Venue, 'JAZZ', 1, 10)[0], 2)
+        self.assertEqual(search_trigram(Venue, 'reg', 1, 10)[0], 1)
+
+    def test_genres_count_towards_the_rank(self):
+        count, data = search_trigram(Venue, 'jazz', 1, 10)
+        self.assertEqual([venue.name for venue in data],
+                         ['100% Jazz Club', 'The Musical Hop'])
+
+    def test_wildcards_are_matched_literally(self):
+        self.assertEqual(search_trigram(Venue, '100%', 1, 10)[0], 1)
+        self.assertEqual(search_trigram(Venue, '%', 1, 10)[0], 1)
+        self.assertEqual(search_trigram(Venue, 'r_b', 1, 10)[0], 0)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,370 @@
+'''
+Trivia API benchmarks.
+
+Runs against the database in TRIVIA_BENCH_DATABASE, or a throwaway SQLite
+file when it is not set. The tables are dropped and recreated, so never
+point it at a database holding real data.
+
+    python bench_flaskr.py questions --rows 1000000
+    python bench_flaskr.py asgi --rows 10000 --clients 1000
+    python bench_flaskr.py search --rows 100000
+    python bench_flaskr.py serialize --rows 100000
+    python bench_flaskr.py batch --rows 10000
+'''
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from flaskr import create_app, QUESTIONS_PER_PAGE
+from flaskr.question_cache import QuestionCache, json_array
+from models import db, Question, Category, QuestionRecord, QUESTION_RECORD_COLUMNS, format_object
+
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+TOPICS = ['planets', 'painters', 'rivers', 'empires', 'films', 'football', 'elements',
+          'mountains', 'composers', 'inventions', 'islands', 'olympics']
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def report(name, samples):
+    print(f'{name:<40} p50 {percentile(samples, 0.50) * 1000:9.2f} ms'
+          f'   p99 {percentile(samples, 0.99) * 1000:9.2f} ms')
+
+
+def timed_get(client, path, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = client.get(path)
+        samples.append(time.perf_counter() - start)
+        assert res.status_code == 200, res.status_code
+    return samples
+
+
+def seed(rows, rng, batch_size=20000):
+    db.drop_all()
+    db.create_all()
+    db.session.execute(Category.__table__.insert(), [{'type': type} for type in CATEGORIES])
+
+    for batch_start in range(0, rows, batch_size):
+        db.session.execute(Question.__table__.insert(), [
+            {
+                'question': f'Question number {i} about {rng.choice(TOPICS)}?',
+                'answer': f'Answer {i}',
+                'category': rng.randint(1, len(CATEGORIES)),
+                'difficulty': rng.randint(1, 5)
+            } for i in range(batch_start, min(batch_start + batch_size, rows))
+        ])
+    db.session.commit()
+
+
+def create_bench_app():
+    database_path = os.environ.get('TRIVIA_BENCH_DATABASE',
+                                   'sqlite:///' + os.path.join(tempfile.gettempdir(), 'trivia_bench.db'))
+    return create_app({ 'database_path': database_path })
+
+
+def create_seeded_app(rows, args):
+    with create_bench_app().app_context():
+        seed(rows, random.Random(args.seed))
+
+    # A fresh app, so that anything create_app loads up front
+    # reflects the seeded rows.
+    return create_bench_app()
+
+
+def bench_questions(args):
+    for rows in args.rows:
+        client = create_seeded_app(rows, args).test_client()
+        print(f'\n{rows} questions')
+
+        last_page = max(rows // QUESTIONS_PER_PAGE, 1)
+        for name, page in (('first', 1), ('middle', last_page // 2), ('last', last_page)):
+            report(f'GET /questions?page= ({name} page)',
+                   timed_get(client, f'/questions?page={page}', args.repeat))
+
+            after = (page - 1) * QUESTIONS_PER_PAGE
+            report(f'GET /questions?after= ({name} page)',
+                   timed_get(client, f'/questions?after={after}', args.repeat))
+
+
+def client_requests(rows, count, rng):
+    '''
+    The requests of one client browsing pages, categories,
+    searching and playing the quiz.
+    '''
+    last_page = max(rows // QUESTIONS_PER_PAGE, 1)
+    requests = []
+    for _ in range(count):
+        kind = rng.randrange(4)
+        if kind == 0:
+            requests.append(('GET', f'/questions?page={rng.randint(1, last_page)}', None))
+        elif kind == 1:
+            category = rng.randint(1, len(CATEGORIES))
+            requests.append(('GET', f'/categories/{category}/questions?page={rng.randint(1, 10)}', None))
+        elif kind == 2:
+            requests.append(('POST', '/search', {'searchTerm': f'number {rng.randrange(rows)}?'}))
+        else:
+            requests.append(('POST', '/quizzes', {
+                'previous_questions': [],
+                'quiz_category': {'type': 'Science', 'id': rng.randint(1, len(CATEGORIES))}
+            }))
+    return requests
+
+
+def report_throughput(name, samples, elapsed):
+    print(f'{name:<40} {len(samples) / elapsed:9.1f} req/s'
+          f'   p50 {percentile(samples, 0.50) * 1000:9.2f} ms'
+          f'   p99 {percentile(samples, 0.99) * 1000:9.2f} ms')
+
+
+def run_wsgi_clients(app, clients, threads):
+    '''
+    Every client's requests through the WSGI app, served by a fixed
+    number of threads like a threaded worker: clients beyond that
+    queue for a thread, and their wait counts towards the latency.
+    '''
+    samples = []
+
+    def run_client(requests, queued_at):
+        client = app.test_client()
+        started_at = queued_at
+        for method, path, body in requests:
+            res = client.open(path, method=method, json=body)
+            assert res.status_code == 200, res.status_code
+            samples.append(time.perf_counter() - started_at)
+            started_at = time.perf_counter()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        for future in [executor.submit(run_client, requests, start) for requests in clients]:
+            future.result()
+    return samples, time.perf_counter() - start
+
+
+async def run_asgi_clients(app, clients):
+    '''
+    Every client's requests through the ASGI app, all clients at once.
+    '''
+    samples = []
+
+    async def run_client(client, requests):
+        for method, path, body in requests:
+            started_at = time.perf_counter()
+            res = await client.open(path, method=method, json=body)
+            assert res.status_code == 200, res.status_code
+            samples.append(time.perf_counter() - started_at)
+
+    async with app.test_app() as test_app:
+        start = time.perf_counter()
+        await asyncio.gather(*(run_client(test_app.test_client(), requests) for requests in clients))
+        elapsed = time.perf_counter() - start
+
+    return samples, elapsed
+
+
+def bench_asgi(args):
+    from flaskr.asgi import create_async_app
+
+    rows = args.rows[0]
+    rng = random.Random(args.seed)
+    app = create_seeded_app(rows, args)
+    clients = [client_requests(rows, args.requests, rng) for _ in range(args.clients)]
+    print(f'\n{rows} questions, {args.clients} clients x {args.requests} requests')
+
+    samples, elapsed = run_wsgi_clients(app, clients, args.threads)
+    report_throughput(f'WSGI ({args.threads} threads)', samples, elapsed)
+
+    async_app = create_async_app({ 'database_path': app.config['SQLALCHEMY_DATABASE_URI'] })
+    samples, elapsed = asyncio.run(run_asgi_clients(async_app, clients))
+    report_throughput('ASGI (one event loop)', samples, elapsed)
+
+
+def timed_post(client, path, body, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = client.post(path, json=body)
+        samples.append(time.perf_counter() - start)
+        assert res.status_code == 200, res.status_code
+    return samples
+
+
+def timed_substring_search(app, search_term, repeat):
+    '''
+    The search as it was before the index: every question whose
+    text contains the term, unranked and unpaginated.
+    '''
+    samples = []
+    with app.app_context():
+        for _ in range(repeat):
+            start = time.perf_counter()
+            questions = Question.query.filter(Question.question.ilike(f'%{search_term}%')).all()
+            [question.format() for question in questions]
+            samples.append(time.perf_counter() - start)
+            db.session.remove()
+    return samples
+
+
+def bench_search(args):
+    for rows in args.rows:
+        with create_bench_app().app_context():
+            seed(rows, random.Random(args.seed))
+
+        start = time.perf_counter()
+        app = create_bench_app()
+        print(f'\n{rows} questions, app created in {time.perf_counter() - start:.2f} s')
+        client = app.test_client()
+
+        for search_term in ('question', TOPICS[0], f'number {rows // 2}', 'nothing'):
+            start = time.perf_counter()
+            total = client.post('/search', json={'searchTerm': search_term}).get_json()['totalQuestions']
+            print(f'POST /search "{search_term}": {total} matches, first in '
+                  f'{(time.perf_counter() - start) * 1000:.2f} ms')
+            report(f'POST /search "{search_term}"',
+                   timed_post(client, '/search', {'searchTerm': search_term}, args.repeat))
+            report(f'POST /search?page=50 "{search_term}"',
+                   timed_post(client, '/search?page=50', {'searchTerm': search_term}, args.repeat))
+            report(f'substring scan "{search_term}"',
+                   timed_substring_search(app, search_term, max(args.repeat // 10, 1)))
+
+
+def measure(function):
+    '''
+    (seconds function took, bytes its result holds), timed and
+    traced in separate runs since tracing slows it down.
+    '''
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    db.session.remove()
+
+    tracemalloc.start()
+    result = function()
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    db.session.remove()
+    return elapsed, allocated
+
+
+def report_serialization(name, rows, elapsed, allocated=None):
+    line = f'{name:<40} {rows / elapsed:12,.0f} questions/s'
+    if allocated is not None:
+        line += f'   {allocated / 2 ** 20:8.1f} MiB held'
+    print(line)
+
+
+def fill_cache(cache):
+    cache.clear()
+    cache.store(db.session.query(*QUESTION_RECORD_COLUMNS), {})
+    return cache
+
+
+def bench_serialize(args):
+    for rows in args.rows:
+        app = create_seeded_app(rows, args)
+        print(f'\n{rows} questions')
+
+        with app.app_context():
+            report_serialization('ORM instances, loaded', rows,
+                                 *measure(lambda: Question.query.all()))
+            report_serialization('  and serialized', rows,
+                                 *measure(lambda: json.dumps(format_object(Question.query.all()))))
+
+            report_serialization('QuestionRecords, loaded', rows, *measure(
+                lambda: [QuestionRecord(*row) for row in db.session.query(*QUESTION_RECORD_COLUMNS)]))
+
+            cache = QuestionCache(rows)
+            report_serialization('QuestionCache, loaded and serialized', rows,
+                                 *measure(lambda: fill_cache(cache)))
+
+            fill_cache(cache)
+            ids = list(range(1, rows + 1))
+            start = time.perf_counter()
+            json_array(ids, cache.cached(ids)[0])
+            report_serialization('  cached JSON joined', rows, time.perf_counter() - start)
+
+        client = app.test_client()
+        for path in ('/questions?page=2', '/categories/1/questions'):
+            timed_get(client, path, 1)
+            report(f'GET {path} (cached)', timed_get(client, path, args.repeat))
+
+
+def generate_questions(count, rng):
+    return [
+        {
+            'question': f'Imported question {i} about {rng.choice(TOPICS)}?',
+            'answer': f'Answer {i}',
+            'category': rng.randint(1, len(CATEGORIES)),
+            'difficulty': rng.randint(1, 5)
+        } for i in range(count)
+    ]
+
+
+def bench_batch(args):
+    for rows in args.rows:
+        questions = generate_questions(rows, random.Random(args.seed))
+
+        client = create_seeded_app(0, args).test_client()
+        start = time.perf_counter()
+        for question in questions:
+            assert client.post('/questions', json=question).status_code == 200
+        elapsed = time.perf_counter() - start
+        print(f'\n{rows} questions')
+        print(f'{"POST /questions, one at a time":<40} {rows / elapsed:9.1f} questions/s')
+
+        client = create_seeded_app(0, args).test_client()
+        start = time.perf_counter()
+        for batch_start in range(0, rows, args.batch_size):
+            res = client.post('/questions/batch',
+                              json={'questions': questions[batch_start:batch_start + args.batch_size]})
+            assert res.get_json()['success']
+        elapsed = time.perf_counter() - start
+        print(f'{f"POST /questions/batch, {args.batch_size} at a time":<40} {rows / elapsed:9.1f} questions/s')
+
+        ids = list(range(1, rows + 1))
+        start = time.perf_counter()
+        for batch_start in range(0, rows, args.batch_size):
+            res = client.delete('/questions/batch', json={'ids': ids[batch_start:batch_start + args.batch_size]})
+            assert res.get_json()['success']
+        elapsed = time.perf_counter() - start
+        print(f'{f"DELETE /questions/batch, {args.batch_size} at a time":<40} {rows / elapsed:9.1f} questions/s')
+
+
+BENCHMARKS = {
+    'asgi': bench_asgi,
+    'batch': bench_batch,
+    'questions': bench_questions,
+    'search': bench_search,
+    'serialize': bench_serialize,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Trivia API benchmarks')
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000000])
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=5)
+    parser.add_argument('--threads', type=int, default=30)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == '__main__':
+    main()
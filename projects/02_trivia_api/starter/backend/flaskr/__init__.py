@@ -1,17 +1,93 @@
 import os
+from bisect import bisect_right
 from flask import Flask, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 import random
 
-from models import db, setup_db, Question, Category, format_object
+from models import db, setup_db, Question, Category, QUESTION_RECORD_COLUMNS, QUESTION_IDS_SUMMARY
+from .category_registry import CategoryRegistry
+from .json_fragments import json_response
+from .question_batch import (IDS_PER_STATEMENT, as_integer, validate_question, validate_questions,
+                             created_results, deleted_results, insert_questions, delete_questions)
+from .question_cache import QuestionCache, json_array, track_question_changes
+from .question_index import QuestionIndex
+from .question_search import QuestionSearch, search_statements, uses_database_search
+from .instrumentation import init_instrumentation
+from .metrics import init_metrics
 
 QUESTIONS_PER_PAGE = 10
+QUIZ_SAMPLE_ATTEMPTS = 8
+
+def select_random_question(question_ids, previous_questions):
+  '''
+    Chooses uniformly at random the id of a question which
+    has not appeared before, or None when every question has
+    already been used.
+
+    :param question_ids: sequence of ids of eligible questions
+    :param previous_questions: list of ids of previously used questions
+  '''
+  previous_questions = set(previous_questions)
+
+  # While most questions are still unused a few random draws
+  # are all it takes to find one...
+  for _ in range(QUIZ_SAMPLE_ATTEMPTS):
+    if not question_ids:
+      return None
+
+    question_id = random.choice(question_ids)
+    if question_id not in previous_questions:
+      return question_id
+
+  # ...but near the end of a game the unused ones are found
+  # directly, so the game can neither stall nor loop forever.
+  remaining_ids = [ id for id in question_ids if id not in previous_questions ]
+  if not remaining_ids:
+    return None
+
+  return random.choice(remaining_ids)
 
 def create_app(test_config=None):
   app = Flask(__name__)
-  setup_db(app)
+
+  if test_config is None:
+    setup_db(app)
+  else:
+    setup_db(app, test_config['database_path'])
+
   CORS(app)
+  init_instrumentation(app, db)
+  init_metrics(app, db)
+
+  app.config.setdefault('CATEGORY_MAX_AGE', int(os.environ.get('CATEGORY_MAX_AGE', 300)))
+  category_registry = CategoryRegistry(app.config['CATEGORY_MAX_AGE'])
+  category_registry.load(db.session.query(Category.id, Category.type))
+  app.extensions['category_registry'] = category_registry
+
+  app.config.setdefault('QUESTION_INDEX_MAX_AGE', float(os.environ.get('QUESTION_INDEX_MAX_AGE', 5)))
+  question_index = QuestionIndex(app.config['QUESTION_INDEX_MAX_AGE'])
+  app.extensions['question_index'] = question_index
+
+  # Without full text search in the database, questions are
+  # searched in memory.
+  question_search = None
+  if not uses_database_search(db.engine):
+    question_search = QuestionSearch()
+
+  def load_questions():
+    question_index.load(db.session.query(Question.id, Question.category))
+    if question_search is not None:
+      question_search.load(db.session.query(Question.id, Question.question, Question.answer))
+
+  load_questions()
+  db.session.remove()
+
+  app.config.setdefault('QUESTION_CACHE_SIZE', int(os.environ.get('QUESTION_CACHE_SIZE', 200000)))
+  app.config.setdefault('QUESTION_CACHE_MAX_AGE', float(os.environ.get('QUESTION_CACHE_MAX_AGE', 60)))
+  question_cache = QuestionCache(app.config['QUESTION_CACHE_SIZE'], app.config['QUESTION_CACHE_MAX_AGE'])
+  app.extensions['question_cache'] = question_cache
+  track_question_changes(db.session)
 
   @app.after_request
   def after_request(response):
@@ -19,62 +95,132 @@ def create_app(test_config=None):
     response.headers.add('Access-Control-Allow-Methods', 'GET, POST, PATCH, DELETE, OPTIONS')
     return response
     
+  def current_categories():
+    '''
+      The category registry, reloaded first if it is stale.
+    '''
+    if category_registry.stale():
+      category_registry.load(db.session.query(Category.id, Category.type))
+    return category_registry
+
+  def current_question_index():
+    '''
+      The question index, reloaded first along with the search
+      index if questions were written by another worker, whose
+      changes the question cache then forgets as well.
+    '''
+    if question_index.stale():
+      if not question_index.matches(*db.session.query(*QUESTION_IDS_SUMMARY).one()):
+        load_questions()
+        question_cache.clear()
+    return question_index
+
+  def cached_questions(ids):
+    '''
+      The JSON of the questions ids by id, from the question
+      cache, reading the ones missing from it as plain tuples.
+    '''
+    generation = question_cache.generation
+    found, missing = question_cache.cached(ids)
+    for start in range(0, len(missing), IDS_PER_STATEMENT):
+      batch = missing[start:start + IDS_PER_STATEMENT]
+      question_cache.store(db.session.query(*QUESTION_RECORD_COLUMNS)
+                                     .filter(Question.id.in_(batch)), found, generation)
+    return found
+
+  def questions_json(ids):
+    return json_array(ids, cached_questions(ids))
+
   @app.route('/categories')
   def categories():
-    return jsonify({
-      'success': True,
-      'categories': [ category.type for category in Category.query.all() ]
-    })
+    return json_response({
+      'success': True
+    }, categories = current_categories().json())
 
   @app.route('/questions')
   def questions():
+    '''
+      Lists questions ordered by id, QUESTIONS_PER_PAGE at a time.
+
+      Pages are selected either with ?page=N or, for deep pages,
+      with ?after=<id of the last question already seen>, which
+      seeks straight to the next page instead of skipping rows.
+    '''
     page = request.args.get('page', 1, type = int)
-    start = (page - 1) * 10
-    end = start + 10
+    after = request.args.get('after', type = int)
 
-    question_list = format_object(Question.query.all())
-    category_list = [ category.type for category in Category.query.all() ]
-    paginated_question_list = question_list[start:end]
+    # The page and the total come from the same snapshot of the index.
+    all_ids = current_question_index().ids()
 
-    return jsonify({
+    if after is not None:
+      start = bisect_right(all_ids, after)
+    else:
+      start = (max(page, 1) - 1) * QUESTIONS_PER_PAGE
+    ids = all_ids[start:start + QUESTIONS_PER_PAGE]
+
+    next_cursor = None
+    if len(ids) == QUESTIONS_PER_PAGE:
+      next_cursor = ids[-1]
+
+    return json_response({
       'success': True,
-      'questions': paginated_question_list,
-      'total_questions': len(question_list),
-      'categories': category_list,
-      'current_category': ''
-    })
+      'total_questions': len(all_ids),
+      'current_category': '',
+      'next_cursor': next_cursor
+    }, questions = questions_json(ids), categories = current_categories().json())
 
   @app.route('/categories/<int:category_id>/questions')
   def get_questions_by_category(category_id):
-    questions = Question.query                                    \
-                        .filter(Question.category == category_id) \
-                        .all()
+    '''
+      Lists the questions of a category, all of them or,
+      when ?page=N is given, QUESTIONS_PER_PAGE at a time.
+    '''
+    page = request.args.get('page', type = int)
+    ids = current_question_index().ids(category_id)
 
-    return jsonify({
-      'questions': format_object(questions),
-      'totalQuestions': len(questions),
+    if page is not None:
+      start = (max(page, 1) - 1) * QUESTIONS_PER_PAGE
+      ids = ids[start:start + QUESTIONS_PER_PAGE]
+
+    return json_response({
+      'totalQuestions': question_index.count(category_id),
       'currentCategory': category_id
-    })
+    }, questions = questions_json(ids))
 
   @app.route('/search', methods=['POST'])
   def search_question():
+    '''
+      Lists the questions whose text or answer contains every
+      word of searchTerm, best match first, QUESTIONS_PER_PAGE
+      at a time, selected with ?page=N.
+    '''
     search_term = request.json['searchTerm']
-    questions = Question.query.filter(Question.question                   \
-                                              .ilike(f'%{search_term}%')) \
-                              .all()
+    page = request.args.get('page', 1, type = int)
+    start = (max(page, 1) - 1) * QUESTIONS_PER_PAGE
 
-    return jsonify({
-      'questions': format_object(questions),
-      'totalQuestions': len(questions),
+    if question_search is None:
+      count, page_ids = search_statements(search_term, start, QUESTIONS_PER_PAGE)
+      total = db.session.execute(count).scalar()
+      ids = [ id for id, in db.session.execute(page_ids) ]
+    else:
+      current_question_index()
+      total, ids = question_search.search(search_term, start, QUESTIONS_PER_PAGE)
+
+    return json_response({
+      'totalQuestions': total,
       'currentCategory': ''
-    })
+    }, questions = questions_json(ids))
 
   @app.route('/questions/<int:question_id>', methods=['DELETE'])
   def delete_question(question_id):
     try:
       question = Question.query.get(question_id)
+      category_id = question.category
       question.delete()
       db.session.commit()
+      question_index.remove(question_id, category_id)
+      if question_search is not None:
+        question_search.remove(question_id)
     except:
       db.session.rollback()
       abort(400)
@@ -87,14 +233,18 @@ def create_app(test_config=None):
 
   @app.route('/questions', methods=['POST'])
   def create_question():
+    values, _ = validate_question(request.get_json(silent = True), current_categories())
+    if values is None:
+      abort(400)
+
     try:
-      new_question = Question(question = request.json['question'],
-                              answer = request.json['answer'],
-                              difficulty = request.json['difficulty'],
-                              category = request.json['category'])
+      new_question = Question(**values)
 
       db.session.add(new_question)
       db.session.commit()
+      question_index.add(new_question.id, values['category'])
+      if question_search is not None:
+        question_search.add(new_question.id, values['question'], values['answer'])
     except:
       db.session.rollback()
       abort(400)
@@ -105,55 +255,86 @@ def create_app(test_config=None):
       'success': True
     })
 
-  def get_questions_by_category(quiz_category):
-    questions = []
+  @app.route('/questions/batch', methods=['POST'])
+  def create_questions():
+    '''
+      Creates the questions of a {"questions": [...]} body in a
+      single transaction, with one result per question, in order:
+      its id when it was created, or why it was not.
+    '''
+    items = (request.get_json(silent = True) or {}).get('questions')
+    if not isinstance(items, list):
+      abort(400)
 
-    if (quiz_category['type'] == 'click'):
-      questions = Question.query.all()
-    else:
-      questions = Question.query                                               \
-                          .filter(Question.category == quiz_category['id'])  \
-                          .all() 
+    rows, results = validate_questions(items, current_categories())
+    try:
+      ids = insert_questions(db.session.connection(), rows)
+      db.session.commit()
+    except:
+      db.session.rollback()
+      abort(422)
+    finally:
+      db.session.close()
 
-    return format_object(questions)
+    question_index.add_many([ (id, row['category']) for id, row in zip(ids, rows) ])
+    if question_search is not None:
+      question_search.add_many([ (id, row['question'], row['answer']) for id, row in zip(ids, rows) ])
 
-  def select_random_question(questions, previous_questions):
-    '''
-      Chooses a random question from a given set of questions
-      which has not appeared before
+    return jsonify({
+      'success': len(ids) == len(items),
+      'created': len(ids),
+      'results': created_results(results, ids)
+    })
 
-      :param questions: list of eligible questions
-      :param previous_questions: list of ids of previously used questions
+  @app.route('/questions/batch', methods=['DELETE'])
+  def delete_questions_batch():
+    '''
+      Deletes the questions of an {"ids": [...]} body in a single
+      transaction, with one result per id, in order.
     '''
-    chosen_question = None
+    items = (request.get_json(silent = True) or {}).get('ids')
+    if not isinstance(items, list):
+      abort(400)
 
-    while (True):
-      if (len(questions) == len(previous_questions)):
-        # This means that all questions have
-        # already been used, and therefore
-        # the game must end.
-        break
+    ids = [ as_integer(item) for item in items ]
+    try:
+      deleted = delete_questions(db.session.connection(), sorted({ id for id in ids if id is not None }))
+      db.session.commit()
+    except:
+      db.session.rollback()
+      abort(422)
+    finally:
+      db.session.close()
 
-      question_index = random.randint(0, len(questions) - 1)
-      chosen_question = questions[question_index]
-      
-      if (not chosen_question['id'] in previous_questions):
-        break
+    deleted_ids = { id for id, _ in deleted }
+    question_index.remove_many(deleted)
+    question_cache.discard_many(deleted_ids)
+    if question_search is not None:
+      question_search.remove_many(deleted_ids)
 
+    results = deleted_results(ids, deleted_ids)
     return jsonify({
-      'question': chosen_question
+      'success': all(result['success'] for result in results),
+      'deleted': len(deleted_ids),
+      'results': results
     })
 
   @app.route('/quizzes', methods=['POST'])
   def get_quizzes():
     previous_questions = request.json['previous_questions']
     quiz_category = request.json['quiz_category']
-    
-    questions = get_questions_by_category(quiz_category)
 
-    return jsonify({
-      'question': select_random_question(questions, previous_questions)
-    })
+    category_id = None
+    if quiz_category['type'] != 'click':
+      category_id = int(quiz_category['id'])
+
+    question_id = select_random_question(current_question_index().ids(category_id),
+                                         previous_questions)
+    question = 'null'
+    if question_id is not None:
+      question = cached_questions([question_id]).get(question_id, 'null')
+
+    return json_response({}, question = question)
 
   @app.errorhandler(400)
   def not_found(error):
@@ -0,0 +1,399 @@
+'''
+Asynchronous (ASGI) entry point of the Trivia API.
+
+Serves the same endpoints and JSON as create_app, with async
+handlers over an async SQLAlchemy engine, so a worker keeps
+serving other requests while one waits on the database:
+
+    pip install -r requirements-async.txt
+    hypercorn 'flaskr.asgi:create_async_app()'
+
+PostgreSQL is reached through asyncpg and SQLite through
+aiosqlite. The pool is configured by the same DB_* variables
+as the WSGI app, see pool.py.
+'''
+
+import os
+from bisect import bisect_right
+
+from quart import Quart, Response, request, abort, jsonify
+from quart_cors import cors
+from sqlalchemy import select
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from models import db, database_path, Question, Category, QUESTION_RECORD_COLUMNS, QUESTION_IDS_SUMMARY
+from pool import engine_options
+from . import QUESTIONS_PER_PAGE, select_random_question
+from .category_registry import CategoryRegistry
+from .json_fragments import json_object
+from .question_batch import (IDS_PER_STATEMENT, as_integer, validate_question, validate_questions,
+                             created_results, deleted_results, allocate_ids_statement,
+                             insert_statements)
+from .question_cache import QuestionCache, json_array
+from .question_index import QuestionIndex
+from .question_search import QuestionSearch, search_statements, uses_database_search
+
+ASYNC_DRIVERS = {
+  'postgres': 'postgresql+asyncpg',
+  'postgresql': 'postgresql+asyncpg',
+  'sqlite': 'sqlite+aiosqlite'
+}
+
+questions_table = Question.__table__
+categories_table = Category.__table__
+
+
+def async_database_url(database_uri):
+  '''
+    database_uri with its driver replaced by the async one.
+  '''
+  url = make_url(database_uri)
+  backend = url.drivername.split('+')[0]
+  return url.set(drivername=ASYNC_DRIVERS.get(backend, url.drivername))
+
+
+def async_engine_options(database_uri):
+  '''
+    engine_options translated for the async drivers: their pools
+    are adapted for asyncio, and asyncpg takes server settings
+    instead of libpq options.
+  '''
+  options = engine_options(database_uri)
+  connect_args = options.pop('connect_args', {})
+
+  if 'poolclass' in options:
+    options['poolclass'] = AsyncAdaptedQueuePool
+
+  if 'options' in connect_args:
+    statement_timeout = connect_args['options'].split('=', 1)[1]
+    options['connect_args'] = { 'server_settings': { 'statement_timeout': statement_timeout } }
+
+  return options
+
+
+def create_async_app(test_config=None):
+  app = Quart(__name__)
+  app = cors(app)
+
+  if test_config is None:
+    database_uri = database_path
+  else:
+    database_uri = test_config['database_path']
+
+  engine = create_async_engine(async_database_url(database_uri),
+                               **async_engine_options(database_uri))
+  app.config.setdefault('CATEGORY_MAX_AGE', int(os.environ.get('CATEGORY_MAX_AGE', 300)))
+  category_registry = CategoryRegistry(app.config['CATEGORY_MAX_AGE'])
+  app.extensions['category_registry'] = category_registry
+
+  app.config.setdefault('QUESTION_INDEX_MAX_AGE', float(os.environ.get('QUESTION_INDEX_MAX_AGE', 5)))
+  question_index = QuestionIndex(app.config['QUESTION_INDEX_MAX_AGE'])
+  app.extensions['question_index'] = question_index
+  question_search = None
+  if not uses_database_search(engine):
+    question_search = QuestionSearch()
+
+  app.config.setdefault('QUESTION_CACHE_SIZE', int(os.environ.get('QUESTION_CACHE_SIZE', 200000)))
+  app.config.setdefault('QUESTION_CACHE_MAX_AGE', float(os.environ.get('QUESTION_CACHE_MAX_AGE', 60)))
+  question_cache = QuestionCache(app.config['QUESTION_CACHE_SIZE'], app.config['QUESTION_CACHE_MAX_AGE'])
+  app.extensions['question_cache'] = question_cache
+
+  async def load_categories(connection):
+    result = await connection.execute(select(categories_table.c.id,
+                                             categories_table.c.type))
+    category_registry.load(result.all())
+
+  async def current_categories():
+    '''
+      The category registry, reloaded first if it is stale.
+    '''
+    if category_registry.stale():
+      async with engine.connect() as connection:
+        await load_categories(connection)
+    return category_registry
+
+  async def load_questions(connection):
+    result = await connection.execute(select(questions_table.c.id,
+                                             questions_table.c.category))
+    question_index.load(result.all())
+
+    if question_search is not None:
+      result = await connection.execute(select(questions_table.c.id,
+                                               questions_table.c.question,
+                                               questions_table.c.answer))
+      question_search.load(result.all())
+
+  async def current_question_index():
+    '''
+      The question index, reloaded first along with the search
+      index if questions were written by another worker, whose
+      changes the question cache then forgets as well.
+    '''
+    if question_index.stale():
+      async with engine.connect() as connection:
+        summary = (await connection.execute(select(*QUESTION_IDS_SUMMARY))).one()
+        if not question_index.matches(*summary):
+          await load_questions(connection)
+          question_cache.clear()
+    return question_index
+
+  async def cached_questions(ids):
+    '''
+      The JSON of the questions ids by id, from the question
+      cache, reading the ones missing from it as plain tuples.
+    '''
+    generation = question_cache.generation
+    found, missing = question_cache.cached(ids)
+    if missing:
+      async with engine.connect() as connection:
+        for start in range(0, len(missing), IDS_PER_STATEMENT):
+          batch = missing[start:start + IDS_PER_STATEMENT]
+          result = await connection.execute(select(*QUESTION_RECORD_COLUMNS)
+                                            .where(questions_table.c.id.in_(batch)))
+          question_cache.store(result, found, generation)
+    return found
+
+  async def questions_json(ids):
+    return json_array(ids, await cached_questions(ids))
+
+  def json_response(data, **fragments):
+    return Response(json_object(data, **fragments), mimetype='application/json')
+
+  @app.before_serving
+  async def startup():
+    async with engine.begin() as connection:
+      await connection.run_sync(db.metadata.create_all)
+      await load_categories(connection)
+      await load_questions(connection)
+
+  @app.after_serving
+  async def shutdown():
+    await engine.dispose()
+
+  @app.after_request
+  async def after_request(response):
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization, true')
+    response.headers.add('Access-Control-Allow-Methods', 'GET, POST, PATCH, DELETE, OPTIONS')
+    return response
+
+  @app.route('/categories')
+  async def categories():
+    return json_response({
+      'success': True
+    }, categories = (await current_categories()).json())
+
+  @app.route('/questions')
+  async def questions():
+    page = request.args.get('page', 1, type = int)
+    after = request.args.get('after', type = int)
+
+    # The page and the total come from the same snapshot of the index.
+    all_ids = (await current_question_index()).ids()
+
+    if after is not None:
+      start = bisect_right(all_ids, after)
+    else:
+      start = (max(page, 1) - 1) * QUESTIONS_PER_PAGE
+    ids = all_ids[start:start + QUESTIONS_PER_PAGE]
+
+    next_cursor = None
+    if len(ids) == QUESTIONS_PER_PAGE:
+      next_cursor = ids[-1]
+
+    return json_response({
+      'success': True,
+      'total_questions': len(all_ids),
+      'current_category': '',
+      'next_cursor': next_cursor
+    }, questions = await questions_json(ids), categories = (await current_categories()).json())
+
+  @app.route('/categories/<int:category_id>/questions')
+  async def get_questions_by_category(category_id):
+    page = request.args.get('page', type = int)
+    ids = (await current_question_index()).ids(category_id)
+
+    if page is not None:
+      start = (max(page, 1) - 1) * QUESTIONS_PER_PAGE
+      ids = ids[start:start + QUESTIONS_PER_PAGE]
+
+    return json_response({
+      'totalQuestions': question_index.count(category_id),
+      'currentCategory': category_id
+    }, questions = await questions_json(ids))
+
+  @app.route('/search', methods=['POST'])
+  async def search_question():
+    search_term = (await request.get_json())['searchTerm']
+    page = request.args.get('page', 1, type = int)
+    start = (max(page, 1) - 1) * QUESTIONS_PER_PAGE
+
+    if question_search is None:
+      count, page_ids = search_statements(search_term, start, QUESTIONS_PER_PAGE)
+      async with engine.connect() as connection:
+        total = (await connection.execute(count)).scalar()
+        ids = (await connection.execute(page_ids)).scalars().all()
+    else:
+      await current_question_index()
+      total, ids = question_search.search(search_term, start, QUESTIONS_PER_PAGE)
+
+    return json_response({
+      'totalQuestions': total,
+      'currentCategory': ''
+    }, questions = await questions_json(ids))
+
+  @app.route('/questions/<int:question_id>', methods=['DELETE'])
+  async def delete_question(question_id):
+    async with engine.begin() as connection:
+      result = await connection.execute(select(questions_table.c.category)
+                                        .where(questions_table.c.id == question_id))
+      row = result.first()
+      if row is None:
+        abort(400)
+
+      await connection.execute(questions_table.delete()
+                               .where(questions_table.c.id == question_id))
+
+    question_index.remove(question_id, row.category)
+    question_cache.discard(question_id)
+    if question_search is not None:
+      question_search.remove(question_id)
+
+    return jsonify({
+      'success': True
+    })
+
+  @app.route('/questions', methods=['POST'])
+  async def create_question():
+    values, _ = validate_question(await request.get_json(silent = True),
+                                  await current_categories())
+    if values is None:
+      abort(400)
+
+    try:
+      async with engine.begin() as connection:
+        result = await connection.execute(questions_table.insert().values(**values))
+    except Exception:
+      abort(400)
+
+    question_id = result.inserted_primary_key[0]
+    question_index.add(question_id, values['category'])
+    if question_search is not None:
+      question_search.add(question_id, values['question'], values['answer'])
+
+    return jsonify({
+      'success': True
+    })
+
+  @app.route('/questions/batch', methods=['POST'])
+  async def create_questions():
+    items = ((await request.get_json(silent = True)) or {}).get('questions')
+    if not isinstance(items, list):
+      abort(400)
+
+    rows, results = validate_questions(items, await current_categories())
+    ids = []
+    try:
+      async with engine.begin() as connection:
+        if rows and engine.dialect.name == 'postgresql':
+          ids = (await connection.execute(allocate_ids_statement(len(rows)))).scalars().all()
+          for statement in insert_statements(ids, rows):
+            await connection.execute(statement)
+        else:
+          for row in rows:
+            result = await connection.execute(questions_table.insert(), row)
+            ids.append(result.inserted_primary_key[0])
+    except Exception:
+      abort(422)
+
+    question_index.add_many([ (id, row['category']) for id, row in zip(ids, rows) ])
+    if question_search is not None:
+      question_search.add_many([ (id, row['question'], row['answer']) for id, row in zip(ids, rows) ])
+
+    return jsonify({
+      'success': len(ids) == len(items),
+      'created': len(ids),
+      'results': created_results(results, ids)
+    })
+
+  @app.route('/questions/batch', methods=['DELETE'])
+  async def delete_questions_batch():
+    items = ((await request.get_json(silent = True)) or {}).get('ids')
+    if not isinstance(items, list):
+      abort(400)
+
+    ids = [ as_integer(item) for item in items ]
+    valid_ids = sorted({ id for id in ids if id is not None })
+    deleted = []
+    try:
+      async with engine.begin() as connection:
+        for start in range(0, len(valid_ids), IDS_PER_STATEMENT):
+          condition = questions_table.c.id.in_(valid_ids[start:start + IDS_PER_STATEMENT])
+          result = await connection.execute(select(questions_table.c.id, questions_table.c.category)
+                                            .where(condition))
+          deleted.extend(result.all())
+          await connection.execute(questions_table.delete().where(condition))
+    except Exception:
+      abort(422)
+
+    deleted_ids = { id for id, _ in deleted }
+    question_index.remove_many(deleted)
+    question_cache.discard_many(deleted_ids)
+    if question_search is not None:
+      question_search.remove_many(deleted_ids)
+
+    results = deleted_results(ids, deleted_ids)
+    return jsonify({
+      'success': all(result['success'] for result in results),
+      'deleted': len(deleted_ids),
+      'results': results
+    })
+
+  @app.route('/quizzes', methods=['POST'])
+  async def get_quizzes():
+    body = await request.get_json()
+    previous_questions = body['previous_questions']
+    quiz_category = body['quiz_category']
+
+    category_id = None
+    if quiz_category['type'] != 'click':
+      category_id = int(quiz_category['id'])
+
+    question_id = select_random_question((await current_question_index()).ids(category_id),
+                                         previous_questions)
+    question = 'null'
+    if question_id is not None:
+      question = (await cached_questions([question_id])).get(question_id, 'null')
+
+    return json_response({}, question = question)
+
+  @app.errorhandler(400)
+  async def bad_request(error):
+    return jsonify({
+      'success': False,
+      'message': 'Bad request.'
+    }), 400
+
+  @app.errorhandler(404)
+  async def not_found(error):
+    return jsonify({
+      'success': False,
+      'message': 'Not found.'
+    }), 404
+
+  @app.errorhandler(405)
+  async def method_not_allowed(error):
+    return jsonify({
+      'success': False,
+      'message': 'The used HTTP method is not allowed.'
+    }), 405
+
+  @app.errorhandler(422)
+  async def unprocessable_entity(error):
+    return jsonify({
+      'success': False,
+      'message': 'The request could not be processed.'
+    }), 422
+
+  return app
@@ -0,0 +1,51 @@
+import json
+import time
+
+
+class CategoryRegistry(object):
+  '''
+    The categories, read once by create_app and served from
+    memory along with their JSON, since they hardly ever change.
+
+    The registry turns stale max_age seconds after it was
+    loaded, or as soon as invalidate() is called, and is then
+    reloaded by the next request needing it. Each worker
+    process holds its own copy.
+  '''
+
+  def __init__(self, max_age=300):
+    self.max_age = max_age
+    self._state = ({}, '[]')
+    self._loaded_at = None
+
+  def load(self, rows):
+    '''
+      Replaces the categories with (category id, type) rows.
+    '''
+    types = { category_id: type for category_id, type in sorted(rows) }
+
+    # Swapped in one assignment, so that a reader never sees
+    # the types of one load with the JSON of another.
+    self._state = (types, json.dumps(list(types.values())))
+    self._loaded_at = time.monotonic()
+
+  def invalidate(self):
+    self._loaded_at = None
+
+  def stale(self):
+    return self._loaded_at is None or time.monotonic() - self._loaded_at > self.max_age
+
+  def types(self):
+    '''
+      The category types, ordered by id.
+    '''
+    return list(self._state[0].values())
+
+  def json(self):
+    '''
+      The JSON array of the category types, ordered by id.
+    '''
+    return self._state[1]
+
+  def __contains__(self, category_id):
+    return category_id in self._state[0]
@@ -0,0 +1,268 @@
+'''
+  Prometheus metrics.
+
+  GET /metrics returns the Prometheus text exposition format: requests
+  and latency histograms per route template, requests in flight and
+  database pool usage. Each thread bumps its own counters, without
+  taking a lock; a scrape sums them over every thread. The numbers are
+  per process, so every worker is scraped on its own.
+'''
+
+import threading
+import time
+
+from flask import Response, g, request
+from sqlalchemy import event
+
+
+# Upper bounds, in seconds, of the request latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def format_labels(labels):
+  if not labels:
+    return ''
+
+  def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+  return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels) + '}'
+
+def format_value(value):
+  return repr(value) if isinstance(value, float) else str(value)
+
+class Shard(object):
+  '''
+    The counters and histograms of a single thread.
+  '''
+  def __init__(self):
+    self.counters = {}
+    self.histograms = {}
+
+class Metrics(object):
+  '''
+    Counters, gauges and histograms keyed by (name, labels),
+    labels being a tuple of (label, value) pairs.
+
+    Writes only ever touch the calling thread's shard, so
+    they need no lock; the lock is taken once per thread, to
+    register its shard, and by scrapes. The shards of threads
+    that have finished are folded into a single retired one,
+    so a server starting a thread per request keeps as many
+    shards as it has live threads.
+  '''
+
+  def __init__(self, buckets=LATENCY_BUCKETS):
+    self.buckets = buckets
+    self.descriptions = {}
+    self.collectors = []
+    self._shards = {}
+    self._retired = Shard()
+    self._local = threading.local()
+    self._lock = threading.Lock()
+
+  def describe(self, name, metric_type, description):
+    self.descriptions[name] = (metric_type, description)
+
+  def _shard(self):
+    shard = getattr(self._local, 'shard', None)
+    if shard is None:
+      shard = self._local.shard = Shard()
+      with self._lock:
+        self._retire_finished()
+        self._shards[threading.current_thread()] = shard
+    return shard
+
+  def _retire_finished(self):
+    '''
+      Adds the counts of the threads that have finished to the
+      retired shard and drops their own. Called with the lock held.
+    '''
+    finished = [ thread for thread in self._shards if not thread.is_alive() ]
+    for thread in finished:
+      shard = self._shards.pop(thread)
+      self._add_shard(self._retired, shard)
+
+  @staticmethod
+  def _add_shard(total, shard):
+    # Copied first: the owning thread may add keys meanwhile.
+    counters = total.counters
+    for key, value in list(shard.counters.items()):
+      counters[key] = counters.get(key, 0) + value
+
+    histograms = total.histograms
+    for key, histogram in list(shard.histograms.items()):
+      histogram = list(histogram)
+      sums = histograms.setdefault(key, [0] * len(histogram))
+      for position, value in enumerate(histogram):
+        sums[position] += value
+
+  def inc(self, name, labels=(), amount=1):
+    '''
+      Adds amount to a counter, or to a gauge when
+      amount is negative.
+    '''
+    counters = self._shard().counters
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + amount
+
+  def observe(self, name, labels, value):
+    histograms = self._shard().histograms
+    key = (name, labels)
+    histogram = histograms.get(key)
+    if histogram is None:
+      # One count per bucket, then the sum and the count.
+      histogram = histograms[key] = [0] * (len(self.buckets) + 2)
+
+    for position, bound in enumerate(self.buckets):
+      if value <= bound:
+        histogram[position] += 1
+        break
+    histogram[-2] += value
+    histogram[-1] += 1
+
+  def collector(self, func):
+    '''
+      Registers func to be called on every scrape. It returns
+      (name, labels, value) samples for metrics whose values
+      are read on demand rather than counted.
+    '''
+    self.collectors.append(func)
+    return func
+
+  def samples(self):
+    '''
+      Every sample as a {name: {labels: value}} mapping, histograms
+      as lists of per-bucket counts followed by the sum and count.
+    '''
+    total = Shard()
+    with self._lock:
+      self._retire_finished()
+      self._add_shard(total, self._retired)
+      shards = list(self._shards.values())
+
+    for shard in shards:
+      self._add_shard(total, shard)
+
+    counters = {}
+    for (name, labels), value in total.counters.items():
+      counters.setdefault(name, {})[labels] = value
+
+    histograms = {}
+    for (name, labels), histogram in total.histograms.items():
+      histograms.setdefault(name, {})[labels] = histogram
+
+    for collect in self.collectors:
+      for name, labels, value in collect():
+        counters.setdefault(name, {})[labels] = value
+
+    return counters, histograms
+
+  def render(self):
+    counters, histograms = self.samples()
+    lines = []
+
+    def header(name, default_type):
+      metric_type, description = self.descriptions.get(name, (default_type, None))
+      if description:
+        lines.append(f'# HELP {name} {description}')
+      lines.append(f'# TYPE {name} {metric_type}')
+
+    for name in sorted(counters):
+      header(name, 'untyped')
+      for labels, value in sorted(counters[name].items()):
+        lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+
+    for name in sorted(histograms):
+      header(name, 'histogram')
+      for labels, histogram in sorted(histograms[name].items()):
+        cumulative = 0
+        for bound, count in zip(self.buckets, histogram):
+          cumulative += count
+          lines.append(f'{name}_bucket{format_labels(labels + (("le", bound),))} {cumulative}')
+        lines.append(f'{name}_bucket{format_labels(labels + (("le", "+Inf"),))} {histogram[-1]}')
+        lines.append(f'{name}_sum{format_labels(labels)} {format_value(histogram[-2])}')
+        lines.append(f'{name}_count{format_labels(labels)} {histogram[-1]}')
+
+    return '\n'.join(lines) + '\n'
+
+def init_metrics(app, db, cache=None):
+  '''
+    Records request and pool metrics for app, plus the
+    hit ratio of cache if given, and serves them on
+    GET /metrics.
+  '''
+  metrics = Metrics()
+  engine = db.get_engine(app)
+
+  metrics.describe('http_requests_total', 'counter', 'Requests handled, by route template, method and status.')
+  metrics.describe('http_request_duration_seconds', 'histogram', 'Request latency, by route template and method.')
+  metrics.describe('http_requests_in_flight', 'gauge', 'Requests being handled right now.')
+  metrics.describe('db_pool_checkouts_total', 'counter', 'Connections checked out of the pool.')
+  metrics.describe('db_pool_size', 'gauge', 'Connections the pool keeps open.')
+  metrics.describe('db_pool_checked_out', 'gauge', 'Connections currently checked out.')
+  metrics.describe('db_pool_overflow', 'gauge', 'Connections open beyond the pool size.')
+  metrics.describe('db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a free connection.')
+  metrics.describe('db_pool_wait_seconds_max', 'gauge', 'Longest wait for a free connection.')
+  metrics.describe('db_pool_timeouts_total', 'counter', 'Checkouts that gave up waiting for a connection.')
+  metrics.describe('cache_requests_total', 'counter', 'Cache lookups, by result.')
+  metrics.describe('cache_hit_ratio', 'gauge', 'Share of cache lookups that were hits.')
+
+  @event.listens_for(engine, 'checkout')
+  def count_checkout(dbapi_connection, connection_record, connection_proxy):
+    metrics.inc('db_pool_checkouts_total')
+
+  @metrics.collector
+  def collect_pool():
+    pool = engine.pool
+    # Only QueuePool, the default outside SQLite, is sized.
+    for name, attribute in (('db_pool_size', 'size'),
+                            ('db_pool_checked_out', 'checkedout'),
+                            ('db_pool_overflow', 'overflow')):
+      if hasattr(pool, attribute):
+        yield name, (), getattr(pool, attribute)()
+
+    # Only pools from pool.py are timed.
+    wait_stats = getattr(pool, 'wait_stats', None)
+    if wait_stats is not None:
+      yield 'db_pool_wait_seconds_total', (), wait_stats.wait_time
+      yield 'db_pool_wait_seconds_max', (), wait_stats.max_wait
+      yield 'db_pool_timeouts_total', (), wait_stats.timeouts
+
+  if cache is not None:
+    @metrics.collector
+    def collect_cache():
+      stats = cache.stats()
+      lookups = stats['hits'] + stats['misses']
+      yield 'cache_requests_total', (('result', 'hit'),), stats['hits']
+      yield 'cache_requests_total', (('result', 'miss'),), stats['misses']
+      yield 'cache_hit_ratio', (), stats['hits'] / lookups if lookups else 0.0
+
+  @app.before_request
+  def start_request_metrics():
+    g.metrics_started_at = time.perf_counter()
+    g.metrics_in_flight = True
+    metrics.inc('http_requests_in_flight')
+
+  @app.after_request
+  def record_request_metrics(response):
+    started_at = g.pop('metrics_started_at', None)
+    if started_at is not None:
+      route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+      metrics.inc('http_requests_total',
+                  (('route', route), ('method', request.method), ('status', str(response.status_code))))
+      metrics.observe('http_request_duration_seconds',
+                      (('route', route), ('method', request.method)),
+                      time.perf_counter() - started_at)
+    return response
+
+  @app.teardown_request
+  def end_request_metrics(exception=None):
+    # Runs even when the request failed before after_request.
+    if g.pop('metrics_in_flight', False):
+      metrics.inc('http_requests_in_flight', amount=-1)
+
+  @app.route('/metrics')
+  def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+  return metrics
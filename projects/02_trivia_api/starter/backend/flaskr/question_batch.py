@@ -0,0 +1,163 @@
+from sqlalchemy import func, select
+
+from models import Question
+
+# Ids per statement reading or deleting questions by id,
+# below SQLite's limit of bound parameters.
+IDS_PER_STATEMENT = 500
+
+# Rows per multi-row insert: with an id and the four fields each,
+# far below the 32767 bound parameters asyncpg can send.
+ROWS_PER_INSERT = 500
+
+QUESTION_FIELDS = ('question', 'answer', 'difficulty', 'category')
+
+questions_table = Question.__table__
+
+
+def as_integer(value):
+  '''
+    value as an int, or None when it is not one. Numbers
+    with a fractional part are rejected, not truncated.
+  '''
+  if isinstance(value, bool):
+    return None
+
+  if isinstance(value, float):
+    return int(value) if value.is_integer() else None
+
+  try:
+    return int(value)
+  except (TypeError, ValueError):
+    return None
+
+
+def validate_question(item, categories):
+  '''
+    (the column values of the question described by item, None),
+    or (None, the reason it does not describe a valid question).
+
+    :param item: an element of the questions of a batch
+    :param categories: the category registry
+  '''
+  if not isinstance(item, dict):
+    return None, 'Expected an object.'
+
+  missing = [ field for field in QUESTION_FIELDS if field not in item ]
+  if missing:
+    return None, f'Missing {", ".join(missing)}.'
+
+  for field in ('question', 'answer'):
+    if not isinstance(item[field], str) or not item[field].strip():
+      return None, f'{field} must be a non-empty string.'
+
+  difficulty = as_integer(item['difficulty'])
+  category = as_integer(item['category'])
+  if difficulty is None:
+    return None, 'difficulty must be an integer.'
+  if category not in categories:
+    return None, 'Unknown category.'
+
+  return {
+    'question': item['question'],
+    'answer': item['answer'],
+    'difficulty': difficulty,
+    'category': category
+  }, None
+
+
+def validate_questions(items, categories):
+  '''
+    (the column values of the valid questions of items, a result
+    per item), in one pass. The results of the valid questions
+    get their ids from created_results once they are inserted.
+  '''
+  rows = []
+  results = []
+  for item in items:
+    values, message = validate_question(item, categories)
+    if values is None:
+      results.append({ 'success': False, 'message': message })
+    else:
+      rows.append(values)
+      results.append({ 'success': True })
+  return rows, results
+
+
+def created_results(results, ids):
+  created = iter(ids)
+  for result in results:
+    if result['success']:
+      result['id'] = next(created)
+  return results
+
+
+def deleted_results(ids, deleted_ids):
+  '''
+    A result per element of ids, as_integer of the items of a
+    batch of deletions, deleted_ids being the ones deleted.
+  '''
+  results = []
+  for id in ids:
+    if id is None:
+      results.append({ 'success': False, 'message': 'Expected a question id.' })
+    elif id in deleted_ids:
+      results.append({ 'success': True, 'id': id })
+    else:
+      results.append({ 'success': False, 'id': id, 'message': 'Not found.' })
+  return results
+
+
+def allocate_ids_statement(count):
+  '''
+    The statement drawing count ids from the questions sequence,
+    so rows inserted together can be told apart on PostgreSQL.
+  '''
+  sequence = func.pg_get_serial_sequence('questions', 'id')
+  return select([func.nextval(sequence)]).select_from(func.generate_series(1, count))
+
+
+def insert_statements(ids, rows):
+  '''
+    The multi-row inserts of rows, with their ids drawn by
+    allocate_ids_statement, ROWS_PER_INSERT rows each.
+  '''
+  for start in range(0, len(rows), ROWS_PER_INSERT):
+    end = start + ROWS_PER_INSERT
+    yield questions_table.insert().values([ dict(row, id=id)
+                                            for id, row in zip(ids[start:end], rows[start:end]) ])
+
+
+def insert_questions(connection, rows):
+  '''
+    Inserts the column values of rows, in the transaction of
+    connection, and returns the ids of the new questions in order.
+  '''
+  if not rows:
+    return []
+
+  if connection.dialect.name == 'postgresql':
+    ids = [ id for id, in connection.execute(allocate_ids_statement(len(rows))) ]
+    for statement in insert_statements(ids, rows):
+      connection.execute(statement)
+    return ids
+
+  # Elsewhere the ids of a multi-row insert are not returned,
+  # but single-row inserts are cheap on the local database.
+  return [ connection.execute(questions_table.insert(), row).inserted_primary_key[0] for row in rows ]
+
+
+def delete_questions(connection, ids):
+  '''
+    Deletes the questions ids, in the transaction of connection, and
+    returns the (question id, category id) rows actually deleted.
+  '''
+  deleted = []
+  for start in range(0, len(ids), IDS_PER_STATEMENT):
+    batch = ids[start:start + IDS_PER_STATEMENT]
+    condition = questions_table.c.id.in_(batch)
+    deleted.extend(tuple(row) for row in connection.execute(select([questions_table.c.id,
+                                                                   questions_table.c.category])
+                                                            .where(condition)))
+    connection.execute(questions_table.delete().where(condition))
+  return deleted
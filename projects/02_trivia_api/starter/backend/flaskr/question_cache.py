@@ -0,0 +1,143 @@
+from itertools import chain
+import json
+import time
+
+from sqlalchemy import event
+
+from models import Question, QuestionRecord
+
+# The session.info key of the ids of the questions changed
+# by the transaction of a session.
+CHANGED_QUESTIONS = 'changed_question_ids'
+
+
+class QuestionCache(object):
+  '''
+    The JSON of questions, serialized once per question id and
+    then reused by every response listing it.
+
+    Questions missing from the cache are read as plain column
+    tuples into QuestionRecords, never as ORM instances. Entries
+    are discarded once the change of their question is committed,
+    and the whole cache is dropped once it holds max_size
+    questions or max_age seconds after it was last dropped.
+    Each worker process holds its own copy, so changes made by
+    other workers show up within max_age seconds.
+  '''
+
+  def __init__(self, max_size=200000, max_age=60):
+    self.max_size = max_size
+    self.max_age = max_age
+    self._fragments = {}
+    self._generation = 0
+    self._cleared_at = time.monotonic()
+
+  @property
+  def generation(self):
+    '''
+      Incremented by every discard, so a reader can tell
+      whether the rows it read may have changed since.
+    '''
+    return self._generation
+
+  def cached(self, ids):
+    '''
+      (JSON of the cached questions by id, ids not cached).
+    '''
+    if time.monotonic() - self._cleared_at > self.max_age:
+      self.clear()
+
+    fragments = self._fragments
+    found = {}
+    missing = []
+
+    for question_id in ids:
+      fragment = fragments.get(question_id)
+      if fragment is None:
+        missing.append(question_id)
+      else:
+        found[question_id] = fragment
+
+    return found, missing
+
+  def store(self, rows, found, generation=None):
+    '''
+      Serializes the questions of rows, tuples of the
+      QUESTION_RECORD_COLUMNS, into the cache and found.
+
+      generation is the cache's generation before the rows were
+      read: if questions were discarded since, the rows may hold
+      their old values and only go into found.
+    '''
+    fragments = self._fragments
+    if generation is not None and generation != self._generation:
+      fragments = {}
+    elif len(fragments) >= self.max_size:
+      fragments = self._fragments = {}
+
+    for row in rows:
+      record = QuestionRecord(*row)
+      fragment = json.dumps(record.format(), separators=(',', ':'))
+      fragments[record.id] = found[record.id] = fragment
+
+  def discard(self, question_id):
+    self._generation += 1
+    self._fragments.pop(question_id, None)
+
+  def discard_many(self, question_ids):
+    self._generation += 1
+    fragments = self._fragments
+    for question_id in question_ids:
+      fragments.pop(question_id, None)
+
+  def clear(self):
+    self._generation += 1
+    self._fragments = {}
+    self._cleared_at = time.monotonic()
+
+  def __len__(self):
+    return len(self._fragments)
+
+
+def collect_changed_questions(session, flush_context):
+  # Still the state before the flush: deleted instances are listed.
+  changed = session.info.setdefault(CHANGED_QUESTIONS, set())
+  for instance in chain(session.dirty, session.deleted):
+    if isinstance(instance, Question):
+      changed.add(instance.id)
+
+
+def discard_changed_questions(session):
+  changed = session.info.pop(CHANGED_QUESTIONS, None)
+  app = getattr(session, 'app', None)
+  if changed and app is not None:
+    question_cache = app.extensions.get('question_cache')
+    if question_cache is not None:
+      question_cache.discard_many(changed)
+
+
+def forget_changed_questions(session):
+  session.info.pop(CHANGED_QUESTIONS, None)
+
+
+def track_question_changes(session):
+  '''
+    Registers, once, the hooks discarding the questions changed
+    through session from the question cache of the session's
+    app, session being Flask-SQLAlchemy's db.session. They are
+    discarded after the commit, so a concurrent reader cannot
+    cache the old values again.
+  '''
+  if event.contains(session, 'after_commit', discard_changed_questions):
+    return
+
+  event.listen(session, 'after_flush', collect_changed_questions)
+  event.listen(session, 'after_commit', discard_changed_questions)
+  event.listen(session, 'after_rollback', forget_changed_questions)
+
+
+def json_array(ids, found):
+  '''
+    The JSON array of the questions ids found, in order.
+  '''
+  return '[' + ','.join(found[id] for id in ids if id in found) + ']'
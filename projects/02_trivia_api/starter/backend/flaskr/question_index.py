@@ -0,0 +1,145 @@
+from array import array
+from bisect import bisect_left
+from heapq import merge
+import threading
+import time
+
+
+class QuestionIndex(object):
+  '''
+    In-memory index of question ids, overall and per category,
+    each kept as a sorted array of machine integers.
+
+    It is loaded once by create_app and then kept in sync by
+    every endpoint that writes questions, so listing, counting
+    and sampling questions never have to scan the table. Each
+    worker process holds its own copy: max_age seconds after it
+    was last checked, it is compared with the count, greatest
+    and sum of the ids of the table, and reloaded when they
+    differ, so writes made by other workers show up too.
+
+    Writes replace the arrays they change rather than mutating
+    them, so the arrays returned by ids() never change under a
+    reader, who needs no lock.
+  '''
+
+  def __init__(self, max_age=5):
+    self.max_age = max_age
+    self._lock = threading.Lock()
+    self._all_ids = array('l')
+    self._category_ids = {}
+    self._checked_at = None
+
+  def load(self, rows):
+    '''
+      Rebuilds the index from (question id, category id) rows.
+    '''
+    all_ids = array('l')
+    category_ids = {}
+
+    for question_id, category_id in sorted(rows):
+      all_ids.append(question_id)
+      category_ids.setdefault(category_id, array('l')).append(question_id)
+
+    with self._lock:
+      self._all_ids = all_ids
+      self._category_ids = category_ids
+    self._checked_at = time.monotonic()
+
+  def stale(self):
+    return self._checked_at is None or time.monotonic() - self._checked_at > self.max_age
+
+  def matches(self, count, max_id, id_sum):
+    '''
+      Whether the index holds count ids, the greatest being max_id
+      and their sum id_sum, as read from the questions table.
+    '''
+    self._checked_at = time.monotonic()
+    all_ids = self._all_ids
+    return (len(all_ids), all_ids[-1] if all_ids else None, sum(all_ids)) == \
+           (count, max_id, id_sum or 0)
+
+  def add(self, question_id, category_id):
+    with self._lock:
+      category_ids = dict(self._category_ids)
+      category_ids[category_id] = inserted(category_ids.get(category_id, array('l')), question_id)
+      self._all_ids = inserted(self._all_ids, question_id)
+      self._category_ids = category_ids
+
+  def remove(self, question_id, category_id):
+    with self._lock:
+      category_ids = dict(self._category_ids)
+      if category_id in category_ids:
+        category_ids[category_id] = removed(category_ids[category_id], question_id)
+      self._all_ids = removed(self._all_ids, question_id)
+      self._category_ids = category_ids
+
+  def add_many(self, rows):
+    '''
+      Adds (question id, category id) rows, merging them into
+      each array once rather than inserting them one at a time.
+    '''
+    added = {}
+    for question_id, category_id in sorted(rows):
+      added.setdefault(category_id, []).append(question_id)
+
+    with self._lock:
+      category_ids = dict(self._category_ids)
+      for category_id, ids in added.items():
+        category_ids[category_id] = array('l', merge(category_ids.get(category_id, ()), ids))
+      self._all_ids = array('l', merge(self._all_ids, sorted(id for id, _ in rows)))
+      self._category_ids = category_ids
+
+  def remove_many(self, rows):
+    '''
+      Removes (question id, category id) rows, filtering each
+      array once rather than deleting them one at a time.
+    '''
+    removed_ids = { question_id for question_id, _ in rows }
+
+    with self._lock:
+      category_ids = dict(self._category_ids)
+      for category_id in { category_id for _, category_id in rows }:
+        ids = category_ids.get(category_id, ())
+        category_ids[category_id] = array('l', (id for id in ids if id not in removed_ids))
+      self._all_ids = array('l', (id for id in self._all_ids if id not in removed_ids))
+      self._category_ids = category_ids
+
+  def ids(self, category_id=None):
+    '''
+      Sorted ids of the questions in a category,
+      or of every question when category_id is None.
+    '''
+    if category_id is None:
+      return self._all_ids
+
+    return self._category_ids.get(category_id, array('l'))
+
+  def count(self, category_id=None):
+    return len(self.ids(category_id))
+
+  def counts(self):
+    '''
+      Number of questions in each category.
+    '''
+    return { category_id: len(ids) for category_id, ids in self._category_ids.items() }
+
+
+def inserted(ids, question_id):
+  '''
+    A copy of the sorted array ids with question_id inserted.
+  '''
+  position = bisect_left(ids, question_id)
+  if position < len(ids) and ids[position] == question_id:
+    return ids
+  return ids[:position] + array('l', (question_id,)) + ids[position:]
+
+
+def removed(ids, question_id):
+  '''
+    A copy of the sorted array ids without question_id.
+  '''
+  position = bisect_left(ids, question_id)
+  if position == len(ids) or ids[position] != question_id:
+    return ids
+  return ids[:position] + ids[position + 1:]
@@ -0,0 +1,199 @@
+from heapq import nsmallest
+from math import log
+import re
+import threading
+
+from sqlalchemy import func, literal_column, select
+
+from models import Question
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# Weights of the words of a question and of its answer, the
+# weights PostgreSQL's ts_rank gives to 'A' and 'B' lexemes.
+QUESTION_WEIGHT = 1.0
+ANSWER_WEIGHT = 0.4
+
+# BM25 term frequency saturation and length normalization.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# The best RESULT_CACHE_DEPTH ids of up to RESULT_CACHE_SIZE
+# searches are kept until the next write, so paging through the
+# results of a common word does not rank them all again.
+RESULT_CACHE_DEPTH = 1000
+RESULT_CACHE_SIZE = 1024
+
+# Must stay identical to the expression indexed by
+# migrations/0002_question_search.sql, or the index is not used.
+SEARCH_DOCUMENT = literal_column(
+  "(setweight(to_tsvector('simple', coalesce(question, '')), 'A') || "
+  "setweight(to_tsvector('simple', coalesce(answer, '')), 'B'))")
+
+
+def tokenize(text):
+  '''
+    The words of text, lowercased, split like PostgreSQL's
+    'simple' text search configuration splits them.
+  '''
+  return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+class QuestionSearch(object):
+  '''
+    In-memory inverted index of the words of every question
+    and answer, for databases without full text search.
+
+    Like QuestionIndex it is loaded once by create_app and kept
+    in sync by the endpoints that write questions. Questions
+    matching every word of the search are ranked with BM25.
+  '''
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._postings = {}
+    self._documents = {}
+    self._total_length = 0.0
+    self._results = {}
+
+  def load(self, rows):
+    '''
+      Rebuilds the index from (question id, question, answer) rows.
+    '''
+    with self._lock:
+      self._postings = {}
+      self._documents = {}
+      self._total_length = 0.0
+      self._results = {}
+
+      for question_id, question, answer in rows:
+        self._add(question_id, question, answer)
+
+  def add(self, question_id, question, answer):
+    with self._lock:
+      self._add(question_id, question, answer)
+
+  def add_many(self, rows):
+    '''
+      Adds (question id, question, answer) rows under a single
+      acquisition of the lock.
+    '''
+    with self._lock:
+      for question_id, question, answer in rows:
+        self._add(question_id, question, answer)
+
+  def remove(self, question_id):
+    self.remove_many((question_id,))
+
+  def remove_many(self, question_ids):
+    with self._lock:
+      for question_id in question_ids:
+        self._remove(question_id)
+
+  def _remove(self, question_id):
+    length, terms = self._documents.pop(question_id, (0.0, ()))
+    self._total_length -= length
+    self._results = {}
+
+    for term in terms:
+      postings = self._postings[term]
+      del postings[question_id]
+      if not postings:
+        del self._postings[term]
+
+  def _add(self, question_id, question, answer):
+    frequencies = {}
+    for weight, text in ((QUESTION_WEIGHT, question), (ANSWER_WEIGHT, answer)):
+      for term in tokenize(text):
+        frequencies[term] = frequencies.get(term, 0.0) + weight
+
+    for term, frequency in frequencies.items():
+      self._postings.setdefault(term, {})[question_id] = frequency
+
+    length = sum(frequencies.values())
+    self._documents[question_id] = (length, tuple(frequencies))
+    self._total_length += length
+    self._results = {}
+
+  def search(self, search_term, offset, limit):
+    '''
+      (number of matching questions, ids of the questions ranked
+      offset to offset + limit), best match first.
+    '''
+    terms = frozenset(tokenize(search_term))
+    if not terms:
+      return 0, []
+
+    with self._lock:
+      results = self._results
+      cached = results.get(terms)
+      if cached is not None and offset + limit <= RESULT_CACHE_DEPTH:
+        total, ranked = cached
+        return total, ranked[offset:offset + limit]
+
+      matches, scores = self._rank(terms)
+
+    depth = max(offset + limit, RESULT_CACHE_DEPTH)
+    ranked = nsmallest(depth, matches, key=lambda id: (-scores[id], id))
+
+    with self._lock:
+      # Unless a write came in meanwhile and cleared the results.
+      if results is self._results:
+        if len(results) >= RESULT_CACHE_SIZE:
+          results.clear()
+        results[terms] = (len(matches), ranked[:RESULT_CACHE_DEPTH])
+
+    return len(matches), ranked[offset:offset + limit]
+
+  def _rank(self, terms):
+    '''
+      The ids of the questions containing every term, and their
+      BM25 scores.
+    '''
+    postings = sorted((self._postings.get(term, {}) for term in terms), key=len)
+    if not postings[0]:
+      return [], {}
+
+    # Walk the rarest word's questions, checking the others.
+    others = postings[1:]
+    matches = [ question_id for question_id in postings[0]
+                if all(question_id in other for other in others) ]
+
+    documents = self._documents
+    document_count = len(documents)
+    length_weight = BM25_K1 * BM25_B * document_count / self._total_length
+    base_normalization = BM25_K1 * (1 - BM25_B)
+
+    scores = dict.fromkeys(matches, 0.0)
+    for term_postings in postings:
+      idf = log(1 + (document_count - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+      weight = idf * (BM25_K1 + 1)
+      for question_id in matches:
+        frequency = term_postings[question_id]
+        normalization = base_normalization + length_weight * documents[question_id][0]
+        scores[question_id] += weight * frequency / (frequency + normalization)
+
+    return matches, scores
+
+
+def search_statements(search_term, offset, limit):
+  '''
+    The statements counting and ranking the questions matching
+    search_term with PostgreSQL full text search, for databases
+    migrated with migrations/0002_question_search.sql.
+  '''
+  query = func.plainto_tsquery(literal_column("'simple'"), search_term)
+  matches = SEARCH_DOCUMENT.op('@@')(query)
+  questions = Question.__table__
+
+  count = select([func.count()]).select_from(questions).where(matches)
+  rank = func.ts_rank(SEARCH_DOCUMENT, query)
+  page = (select([questions.c.id]).where(matches)
+                                  .order_by(rank.desc(), questions.c.id)
+                                  .offset(offset)
+                                  .limit(limit))
+  return count, page
+
+
+def uses_database_search(engine):
+  return engine.dialect.name == 'postgresql'
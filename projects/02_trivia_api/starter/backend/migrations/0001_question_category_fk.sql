@@ -0,0 +1,24 @@
+--
+-- Makes questions.category an indexed integer foreign key to categories.
+--
+-- Databases created from trivia.psql already have the integer column and
+-- the foreign key but no index; databases created by db.create_all() with
+-- the old model have a text column and neither.
+--
+-- Apply with: psql trivia < migrations/0001_question_category_fk.sql
+--
+
+BEGIN;
+
+ALTER TABLE public.questions
+    ALTER COLUMN category TYPE integer USING category::integer;
+
+ALTER TABLE public.questions
+    DROP CONSTRAINT IF EXISTS category;
+
+ALTER TABLE ONLY public.questions
+    ADD CONSTRAINT category FOREIGN KEY (category) REFERENCES public.categories(id) ON UPDATE CASCADE ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS ix_questions_category ON public.questions USING btree (category);
+
+COMMIT;
@@ -0,0 +1,19 @@
+--
+-- Full text search over questions and their answers, for POST /search.
+--
+-- Indexes the same weighted document flaskr/question_search.py searches:
+-- the words of the question weighted 'A' and those of the answer 'B', with
+-- the 'simple' configuration so that words are matched as typed. The two
+-- expressions must stay identical for the planner to use the index.
+--
+-- Apply with: psql trivia < migrations/0002_question_search.sql
+--
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS ix_questions_search ON public.questions USING gin ((
+    setweight(to_tsvector('simple', coalesce(question, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(answer, '')), 'B')
+));
+
+COMMIT;
@@ -1,8 +1,10 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, ForeignKey, create_engine, func
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from pool import engine_options
+
 database_name = "trivia"
 database_path = "postgres://{}:{}@{}/{}".format('postgres',
                                                 'postgres',
@@ -18,6 +20,7 @@ setup_db(app)
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path)
     db.app = app
     db.init_app(app)
     db.create_all()
@@ -32,7 +35,7 @@ class Question(db.Model):
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  category = Column(Integer, ForeignKey('categories.id', onupdate='CASCADE', ondelete='SET NULL'), index=True)
   difficulty = Column(Integer)
 
   def __init__(self, question, answer, category, difficulty):
@@ -61,6 +64,38 @@ class Question(db.Model):
       'difficulty': self.difficulty
     }
 
+'''
+QuestionRecord
+    a question as plain column values, for the read paths,
+    which need neither the session nor change tracking
+'''
+class QuestionRecord(object):
+  __slots__ = ('id', 'question', 'answer', 'category', 'difficulty')
+
+  def __init__(self, id, question, answer, category, difficulty):
+    self.id = id
+    self.question = question
+    self.answer = answer
+    self.category = category
+    self.difficulty = difficulty
+
+  def format(self):
+    return {
+      'id': self.id,
+      'question': self.question,
+      'answer': self.answer,
+      'category': self.category,
+      'difficulty': self.difficulty
+    }
+
+# The columns of a QuestionRecord, in the order it takes them.
+QUESTION_RECORD_COLUMNS = (Question.id, Question.question, Question.answer,
+                           Question.category, Question.difficulty)
+
+# The count, greatest and sum of the question ids, which a
+# QuestionIndex is checked against.
+QUESTION_IDS_SUMMARY = (func.count(Question.id), func.max(Question.id), func.sum(Question.id))
+
 '''
 Category
 
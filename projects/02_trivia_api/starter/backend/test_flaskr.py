@@ -1,10 +1,14 @@
+import importlib.util
 import os
+import tempfile
+import threading
 import unittest
 import json
 from flask_sqlalchemy import SQLAlchemy
 
-from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr import create_app, QUESTIONS_PER_PAGE
+from flaskr.question_index import QuestionIndex
+from models import db, setup_db, Question, Category
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -12,29 +16,607 @@ class TriviaTestCase(unittest.TestCase):
 
     def setUp(self):
         """Define test variables and initialize app."""
-        self.app = create_app()
-        self.client = self.app.test_client
         self.database_name = "trivia_test"
-        self.database_path = "postgres://{}/{}".format('localhost:5432', self.database_name)
-        setup_db(self.app, self.database_path)
+        self.database_path = os.environ.get('TRIVIA_TEST_DATABASE',
+                                            "postgres://{}/{}".format('localhost:5432', self.database_name))
+        self.app = create_app({ 'database_path': self.database_path })
+        self.client = self.app.test_client
 
         # binds the app to the current context
         with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
             # create all tables
-            self.db.create_all()
-    
+            db.create_all()
+
+        self.add_categories()
+
     def tearDown(self):
         """Executed after reach test"""
-        pass
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def add_categories(self):
+        with self.app.app_context():
+            db.session.add_all([Category(type) for type in ('Science', 'Art', 'Geography')])
+            db.session.commit()
+        self.app.extensions['category_registry'].invalidate()
+
+    def add_questions(self, count, category=1):
+        for i in range(count):
+            res = self.client().post('/questions', json={
+                'question': f'Question {i}?',
+                'answer': f'Answer {i}',
+                'category': category,
+                'difficulty': 1 + i % 5
+            })
+            self.assertEqual(res.status_code, 200)
+
+    def test_get_questions_first_page(self):
+        self.add_questions(QUESTIONS_PER_PAGE + 5)
+
+        res = self.client().get('/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(len(data['questions']), QUESTIONS_PER_PAGE)
+        self.assertEqual(data['total_questions'], QUESTIONS_PER_PAGE + 5)
+        self.assertEqual(data['categories'], ['Science', 'Art', 'Geography'])
+
+    def test_get_questions_by_page_and_cursor_agree(self):
+        self.add_questions(QUESTIONS_PER_PAGE + 5)
+
+        first_page = json.loads(self.client().get('/questions?page=1').data)
+        second_page = json.loads(self.client().get('/questions?page=2').data)
+        after_first = json.loads(self.client().get(f'/questions?after={first_page["next_cursor"]}').data)
+
+        self.assertEqual(len(second_page['questions']), 5)
+        self.assertEqual(second_page['questions'], after_first['questions'])
+        self.assertIsNone(second_page['next_cursor'])
+
+    def test_get_questions_beyond_last_page(self):
+        self.add_questions(3)
+
+        res = self.client().get('/questions?page=100')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['questions'], [])
+        self.assertEqual(data['total_questions'], 3)
+
+    def test_total_questions_follows_create_and_delete(self):
+        self.add_questions(2)
+        self.assertEqual(json.loads(self.client().get('/questions').data)['total_questions'], 2)
+
+        res = self.client().post('/questions', json={
+            'question': 'Whose autobiography is entitled I Know Why the Caged Bird Sings?',
+            'answer': 'Maya Angelou',
+            'difficulty': 2,
+            'category': 1
+        })
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(self.client().get('/questions').data)['total_questions'], 3)
+
+        res = self.client().delete('/questions/1')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(self.client().get('/questions').data)['total_questions'], 2)
+
+    def test_quiz_never_repeats_a_question(self):
+        self.add_questions(5, category=1)
+        self.add_questions(5, category=2)
+
+        previous_questions = []
+        for _ in range(5):
+            res = self.client().post('/quizzes', json={
+                'previous_questions': previous_questions,
+                'quiz_category': {'type': 'Science', 'id': 1}
+            })
+            question = json.loads(res.data)['question']
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(question['category'], 1)
+            self.assertNotIn(question['id'], previous_questions)
+            previous_questions.append(question['id'])
+
+        res = self.client().post('/quizzes', json={
+            'previous_questions': previous_questions,
+            'quiz_category': {'type': 'Science', 'id': 1}
+        })
+        self.assertIsNone(json.loads(res.data)['question'])
+
+    def test_quiz_all_categories_sees_new_questions(self):
+        self.add_questions(1, category=1)
+        first = json.loads(self.client().post('/quizzes', json={
+            'previous_questions': [],
+            'quiz_category': {'type': 'click', 'id': 0}
+        }).data)['question']
+
+        self.client().post('/questions', json={
+            'question': 'What is the largest lake in Africa?',
+            'answer': 'Lake Victoria',
+            'difficulty': 2,
+            'category': 3
+        })
+        res = self.client().post('/quizzes', json={
+            'previous_questions': [first['id']],
+            'quiz_category': {'type': 'click', 'id': 0}
+        })
+
+        self.assertIsNotNone(json.loads(res.data)['question'])
+
+    def test_get_questions_by_category(self):
+        self.add_questions(QUESTIONS_PER_PAGE + 2, category=2)
+        self.add_questions(3, category=3)
+
+        data = json.loads(self.client().get('/categories/2/questions').data)
+        self.assertEqual(len(data['questions']), QUESTIONS_PER_PAGE + 2)
+        self.assertEqual(data['totalQuestions'], QUESTIONS_PER_PAGE + 2)
+        self.assertTrue(all(question['category'] == 2 for question in data['questions']))
+
+        data = json.loads(self.client().get('/categories/2/questions?page=2').data)
+        self.assertEqual(len(data['questions']), 2)
+        self.assertEqual(data['totalQuestions'], QUESTIONS_PER_PAGE + 2)
+
+    def test_category_counts_follow_create_and_delete(self):
+        self.client().post('/questions', json={
+            'question': 'What is the heaviest organ in the human body?',
+            'answer': 'The Liver',
+            'difficulty': 4,
+            'category': 1
+        })
+        data = json.loads(self.client().get('/categories/1/questions').data)
+        self.assertEqual(data['totalQuestions'], 1)
+
+        self.client().delete(f'/questions/{data["questions"][0]["id"]}')
+        data = json.loads(self.client().get('/categories/1/questions?page=1').data)
+        self.assertEqual(data['totalQuestions'], 0)
+        self.assertEqual(data['questions'], [])
+
+    def test_question_index_hands_out_snapshots(self):
+        question_index = QuestionIndex()
+        question_index.load([(1, 1), (2, 1), (3, 2)])
+        all_ids, category_ids = question_index.ids(), question_index.ids(1)
+
+        question_index.remove(2, 1)
+        question_index.add(4, 1)
+        question_index.add(5, 3)
+
+        self.assertEqual(list(all_ids), [1, 2, 3])
+        self.assertEqual(list(category_ids), [1, 2])
+        self.assertEqual(list(question_index.ids()), [1, 3, 4, 5])
+        self.assertEqual(list(question_index.ids(1)), [1, 4])
+        self.assertEqual(question_index.counts(), {1: 2, 2: 1, 3: 1})
+
+    def test_create_question_with_a_string_category(self):
+        question = {
+            'question': 'What is the heaviest organ in the human body?',
+            'answer': 'The Liver',
+            'difficulty': 4,
+            'category': '1'
+        }
+        self.assertEqual(self.client().post('/questions', json=question).status_code, 200)
+        data = json.loads(self.client().get('/categories/1/questions').data)
+        self.assertEqual(data['totalQuestions'], 1)
+
+        res = self.client().post('/questions', json=dict(question, category='9'))
+        self.assertEqual(res.status_code, 400)
+
+    def search(self, search_term, page=1):
+        res = self.client().post(f'/search?page={page}', json={'searchTerm': search_term})
+        self.assertEqual(res.status_code, 200)
+        return json.loads(res.data)
+
+    def test_search_ranks_and_paginates(self):
+        self.add_questions(QUESTIONS_PER_PAGE + 5)
+        for question, answer in (('Which is the largest planet?', 'Jupiter'),
+                                 ('Which planet is called the red planet?', 'Mars')):
+            self.client().post('/questions', json={
+                'question': question, 'answer': answer, 'category': 1, 'difficulty': 2
+            })
+
+        # The question that says it twice ranks first.
+        data = self.search('planet')
+        self.assertEqual(data['totalQuestions'], 2)
+        self.assertEqual([question['answer'] for question in data['questions']], ['Mars', 'Jupiter'])
+
+        first_page = self.search('QUESTION')
+        second_page = self.search('question', page=2)
+        self.assertEqual(first_page['totalQuestions'], QUESTIONS_PER_PAGE + 5)
+        self.assertEqual(len(first_page['questions']), QUESTIONS_PER_PAGE)
+        self.assertEqual(len(second_page['questions']), 5)
+
+    def test_search_matches_every_word_of_question_and_answer(self):
+        self.add_questions(5)
+
+        self.assertEqual(self.search('question answer 3')['totalQuestions'], 1)
+        self.assertEqual(self.search('question 3 missing')['totalQuestions'], 0)
+        self.assertEqual(self.search('?')['questions'], [])
+
+    def test_search_follows_create_and_delete(self):
+        self.add_questions(2)
+        question_id = self.search('Question 1')['questions'][0]['id']
+
+        self.client().delete(f'/questions/{question_id}')
+
+        self.assertEqual(self.search('question 1')['totalQuestions'], 0)
+        self.assertEqual(self.search('question')['totalQuestions'], 1)
+
+    def test_create_questions_in_a_batch(self):
+        res = self.client().post('/questions/batch', json={'questions': [
+            {'question': 'Largest planet?', 'answer': 'Jupiter', 'category': 1, 'difficulty': 2},
+            {'question': 'Smallest planet?', 'answer': 'Mercury', 'category': '1', 'difficulty': '3'},
+            {'question': '', 'answer': 'Nothing', 'category': 1, 'difficulty': 1},
+            {'question': 'Painter of the Mona Lisa?', 'answer': 'Leonardo', 'category': 9, 'difficulty': 1},
+            {'question': 'Missing answer?'},
+            'not a question',
+            {'question': 'Hottest planet?', 'answer': 'Venus', 'category': 1, 'difficulty': 2.7}
+        ]})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(data['success'])
+        self.assertEqual(data['created'], 2)
+        self.assertEqual([result['success'] for result in data['results']],
+                         [True, True, False, False, False, False, False])
+        self.assertEqual([result['message'] for result in data['results'][2:]], [
+            'question must be a non-empty string.',
+            'Unknown category.',
+            'Missing answer, difficulty, category.',
+            'Expected an object.',
+            'difficulty must be an integer.'
+        ])
+
+        data = json.loads(self.client().get('/categories/1/questions').data)
+        self.assertEqual(data['totalQuestions'], 2)
+        self.assertEqual([question['id'] for question in data['questions']],
+                         [result['id'] for result in json.loads(res.data)['results'][:2]])
+        self.assertEqual(data['questions'][1]['difficulty'], 3)
+        self.assertEqual(self.search('planet')['totalQuestions'], 2)
+
+    def test_delete_questions_in_a_batch(self):
+        self.add_questions(5)
+        ids = [question['id'] for question in json.loads(self.client().get('/questions').data)['questions']]
+
+        res = self.client().delete('/questions/batch',
+                                   json={'ids': [ids[0], float(ids[3]), 1000, 'x', ids[1] + 0.9]})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted'], 2)
+        self.assertEqual(data['results'], [
+            {'success': True, 'id': ids[0]},
+            {'success': True, 'id': ids[3]},
+            {'success': False, 'id': 1000, 'message': 'Not found.'},
+            {'success': False, 'message': 'Expected a question id.'},
+            {'success': False, 'message': 'Expected a question id.'}
+        ])
+
+        data = json.loads(self.client().get('/questions').data)
+        self.assertEqual([question['id'] for question in data['questions']], [ids[1], ids[2], ids[4]])
+        self.assertEqual(data['total_questions'], 3)
+        self.assertEqual(self.search('question')['totalQuestions'], 3)
+
+    def test_delete_repeated_ids_in_a_batch(self):
+        self.add_questions(2)
+        ids = [question['id'] for question in json.loads(self.client().get('/questions').data)['questions']]
+
+        res = self.client().delete('/questions/batch', json={'ids': [ids[0], ids[0]]})
+        data = json.loads(res.data)
+
+        self.assertTrue(data['success'])
+        self.assertEqual(data['deleted'], 1)
+        self.assertEqual(data['results'], [{'success': True, 'id': ids[0]}] * 2)
+        self.assertEqual(json.loads(self.client().get('/questions').data)['total_questions'], 1)
+
+    def test_batch_without_a_list(self):
+        for method in ('post', 'delete'):
+            res = getattr(self.client(), method)('/questions/batch', json={'questions': 'all'})
+            self.assertEqual(res.status_code, 400)
+
+    def test_delete_missing_question(self):
+        res = self.client().delete('/questions/1000')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(data['success'])
+
+    def test_server_timing_reports_queries(self):
+        self.add_questions(1)
+        self.client().get('/categories')
+        res = self.client().get('/questions')
+
+        self.assertRegex(res.headers['Server-Timing'],
+                         r'^db;dur=[0-9.]+;desc="1 queries", total;dur=[0-9.]+$')
+
+    def test_categories_are_served_from_memory(self):
+        self.client().get('/categories')
+
+        with self.app.app_context():
+            db.session.add(Category('History'))
+            db.session.commit()
+
+        res = self.client().get('/categories')
+        self.assertRegex(res.headers['Server-Timing'], r'desc="0 queries"')
+        self.assertEqual(json.loads(res.data), {
+            'success': True,
+            'categories': ['Science', 'Art', 'Geography']
+        })
+
+        self.app.extensions['category_registry'].invalidate()
+
+        res = self.client().get('/questions')
+        self.assertEqual(json.loads(res.data)['categories'], ['Science', 'Art', 'Geography', 'History'])
+
+    def test_question_json_is_cached_until_the_question_changes(self):
+        self.add_questions(3)
+        self.client().get('/categories')
+        self.client().get('/questions')
+
+        # The page comes from the question index, its JSON from the cache.
+        res = self.client().get('/questions')
+        self.assertRegex(res.headers['Server-Timing'], r'desc="0 queries"')
+
+        with self.app.app_context():
+            question = Question.query.filter(Question.answer == 'Answer 1').one()
+            question.answer = 'Changed'
+            question.update()
+
+        data = json.loads(self.client().get('/categories/1/questions').data)
+        self.assertEqual([question['answer'] for question in data['questions']],
+                         ['Answer 0', 'Changed', 'Answer 2'])
+        self.assertEqual(data['questions'][1], {
+            'id': data['questions'][1]['id'],
+            'question': 'Question 1?',
+            'answer': 'Changed',
+            'category': 1,
+            'difficulty': 2
+        })
+
+    def test_question_json_is_discarded_once_the_change_is_committed(self):
+        self.add_questions(1)
+        question_cache = self.app.extensions['question_cache']
+        self.client().get('/questions')
+        self.assertEqual(len(question_cache), 1)
+
+        with self.app.app_context():
+            question = Question.query.one()
+            question.answer = 'Changed'
+            db.session.flush()
+            self.assertEqual(len(question_cache), 1)
+            db.session.rollback()
+            self.assertEqual(len(question_cache), 1)
+
+            question.answer = 'Changed'
+            db.session.commit()
+            self.assertEqual(len(question_cache), 0)
+            question_id = question.id
+
+        # Commits only discard from the cache of their own app.
+        other_cache = create_app({ 'database_path': self.database_path }).extensions['question_cache']
+        other_cache.store([(question_id, 'Question 0?', 'Answer 0', 1, 2)], {})
+        self.client().get('/questions')
+        with self.app.app_context():
+            question = Question.query.one()
+            question.answer = 'Changed again'
+            question.update()
+        self.assertEqual(len(question_cache), 0)
+        self.assertEqual(len(other_cache), 1)
+
+        # Rows read before a discard are not cached.
+        generation = other_cache.generation
+        other_cache.discard(question_id)
+        found = {}
+        other_cache.store([(question_id, 'Question 0?', 'Answer 0', 1, 2)], found, generation)
+        self.assertIn(question_id, found)
+        self.assertEqual(len(other_cache), 0)
+
+    def test_slow_queries_are_logged_with_their_route(self):
+        self.app.config['SLOW_QUERY_THRESHOLD_MS'] = 0
+
+        with self.assertLogs(self.app.logger.getChild('sql'), 'WARNING') as logs:
+            self.client().get('/categories')
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('GET /categories [categories]', logs.output[0])
+
+    def test_metrics_endpoint(self):
+        self.add_questions(2)
+        self.client().get('/questions')
+        self.client().get('/categories/1/questions')
+
+        res = self.client().get('/metrics')
+        body = res.get_data(as_text=True)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('http_requests_total{route="/questions",method="POST",status="200"} 2', body)
+        self.assertIn('http_request_duration_seconds_count{route="/categories/<int:category_id>/questions",method="GET"} 1', body)
+        self.assertIn('http_requests_in_flight 1', body)
+
+    def test_concurrent_requests_do_not_stall_on_the_pool(self):
+        with tempfile.TemporaryDirectory() as directory:
+            app = create_app({ 'database_path': 'sqlite:///' + os.path.join(directory, 'trivia.db') })
+            with app.app_context():
+                db.session.add_all([Category(type) for type in ('Science', 'Art', 'Geography')])
+                db.session.commit()
+                pool = db.get_engine(app).pool
+
+            workers = pool.size()
+            barrier = threading.Barrier(workers)
+            statuses = []
+
+            def work():
+                client = app.test_client()
+                barrier.wait()
+                for _ in range(10):
+                    statuses.append(client.get('/questions').status_code)
+
+            threads = [threading.Thread(target=work) for _ in range(workers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            with app.app_context():
+                db.get_engine(app).dispose()
+
+        self.assertEqual(statuses, [200] * workers * 10)
+        self.assertEqual(pool.wait_stats.timeouts, 0)
+        self.assertLess(pool.wait_stats.max_wait, 1)
+
+
+class SharedDatabaseTestCase(unittest.TestCase):
+    """This class checks two workers, two apps on one database"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        database_path = 'sqlite:///' + os.path.join(self.directory.name, 'trivia.db')
+
+        self.worker_a = create_app({ 'database_path': database_path })
+        with self.worker_a.app_context():
+            db.session.add_all([Category(type) for type in ('Science', 'Art', 'Geography')])
+            db.session.add(Question('Question 0?', 'Answer 0', 1, 1))
+            db.session.commit()
+        self.worker_b = create_app({ 'database_path': database_path })
+        self.worker_a.extensions['category_registry'].invalidate()
+        for app in (self.worker_a, self.worker_b):
+            app.extensions['question_index'].max_age = 0
+
+    def tearDown(self):
+        for app in (self.worker_a, self.worker_b):
+            with app.app_context():
+                db.get_engine(app).dispose()
+        self.directory.cleanup()
+
+    def get(self, app, path):
+        res = app.test_client().get(path)
+        self.assertEqual(res.status_code, 200)
+        return json.loads(res.data)
+
+    def quiz(self, app, previous_questions):
+        res = app.test_client().post('/quizzes', json={'previous_questions': previous_questions,
+                                                        'quiz_category': {'type': 'Science', 'id': 1}})
+        return json.loads(res.data)['question']
+
+    def test_questions_written_by_another_worker(self):
+        self.assertEqual(self.get(self.worker_b, '/categories/1/questions')['totalQuestions'], 1)
+        first_id = self.quiz(self.worker_b, [])['id']
+
+        res = self.worker_a.test_client().post('/questions', json={
+            'question': 'Largest planet?', 'answer': 'Jupiter', 'category': 1, 'difficulty': 2
+        })
+        self.assertEqual(res.status_code, 200)
+
+        data = self.get(self.worker_b, '/questions')
+        self.assertEqual(data['total_questions'], 2)
+        self.assertEqual(len(data['questions']), 2)
+
+        data = self.get(self.worker_b, '/categories/1/questions')
+        self.assertEqual(data['totalQuestions'], 2)
+        self.assertEqual([question['answer'] for question in data['questions']], ['Answer 0', 'Jupiter'])
+        self.assertEqual(self.quiz(self.worker_b, [first_id])['answer'], 'Jupiter')
+
+        res = self.worker_a.test_client().delete(f'/questions/{first_id}')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.get(self.worker_b, '/categories/1/questions')['totalQuestions'], 1)
+        self.assertIsNone(self.quiz(self.worker_b, [first_id + 1]))
+
+    def test_question_json_changed_by_another_worker(self):
+        question_cache = self.worker_b.extensions['question_cache']
+        self.assertEqual(self.quiz(self.worker_b, [])['answer'], 'Answer 0')
+        self.assertEqual(len(question_cache), 1)
+
+        # An edit leaves the ids alone: it shows up once the cache expires.
+        with self.worker_a.app_context():
+            question = Question.query.one()
+            question.answer = 'Changed'
+            question.update()
+        self.assertEqual(self.quiz(self.worker_b, [])['answer'], 'Answer 0')
+
+        question_cache.max_age = 0
+        self.assertEqual(self.quiz(self.worker_b, [])['answer'], 'Changed')
+
+        # A deletion changes the ids: the cache is dropped along with the index.
+        question_cache.max_age = 60
+        with self.worker_a.app_context():
+            Question.query.one().delete()
+        self.assertEqual(self.get(self.worker_b, '/categories/1/questions')['questions'], [])
+        self.assertEqual(len(question_cache), 0)
+
+
+@unittest.skipUnless(importlib.util.find_spec('quart'), 'requires requirements-async.txt')
+class AsyncTriviaTestCase(unittest.IsolatedAsyncioTestCase):
+    """This class checks that the ASGI app answers like the WSGI one"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database_path = 'sqlite:///' + os.path.join(self.directory.name, 'trivia.db')
+
+        app = create_app({ 'database_path': self.database_path })
+        with app.app_context():
+            db.session.add_all([Category(type) for type in ('Science', 'Art', 'Geography')])
+            db.session.add_all([Question(f'Question {i}?', f'Answer {i}', 1 + i % 3, 1 + i % 5)
+                                for i in range(25)])
+            db.session.commit()
+            db.get_engine(app).dispose()
+
+        # A fresh app, so that its question index holds the rows above.
+        self.app = create_app({ 'database_path': self.database_path })
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.get_engine(self.app).dispose()
+        self.directory.cleanup()
+
+    async def test_same_responses_as_wsgi(self):
+        from flaskr.asgi import create_async_app
+
+        requests = [
+            ('GET', '/categories', None),
+            ('GET', '/questions', None),
+            ('GET', '/questions?page=3', None),
+            ('GET', '/questions?after=10', None),
+            ('GET', '/categories/2/questions', None),
+            ('GET', '/categories/2/questions?page=2', None),
+            ('POST', '/search', {'searchTerm': 'question 1'}),
+            ('POST', '/search?page=2', {'searchTerm': 'question'}),
+            ('POST', '/questions', {'question': 'New?', 'answer': 'Yes', 'category': 3, 'difficulty': 2}),
+            ('POST', '/questions', {'question': 'Newer?', 'answer': 'Yes', 'category': '1', 'difficulty': 2}),
+            ('POST', '/questions', {'question': 'Unknown?', 'answer': 'Yes', 'category': '9', 'difficulty': 2}),
+            ('DELETE', '/questions/4', None),
+            ('DELETE', '/questions/1000', None),
+            ('POST', '/questions/batch', {'questions': [
+                {'question': 'Largest planet?', 'answer': 'Jupiter', 'category': 2, 'difficulty': 2},
+                {'question': 'Unknown?', 'answer': 'Yes', 'category': 9, 'difficulty': 2}
+            ]}),
+            ('DELETE', '/questions/batch', {'ids': [5, 6, 5, 1000, None]}),
+            ('POST', '/search', {'searchTerm': 'planet'}),
+            ('GET', '/questions?page=3', None),
+            ('GET', '/categories/1/questions', None),
+            ('GET', '/categories/3/questions?page=3', None),
+            ('POST', '/quizzes', {'previous_questions': list(range(1, 28)),
+                                  'quiz_category': {'type': 'click', 'id': 0}})
+        ]
+
+        expected = []
+        client = self.app.test_client()
+        for method, path, body in requests:
+            res = client.open(path, method=method, json=body)
+            expected.append((res.status_code, json.loads(res.data)))
+
+        # Reseed, so the async app sees the rows the sync one started from.
+        self.tearDown()
+        self.setUp()
 
-    """
-    TODO
-    Write at least one test for each test for successful operation and for expected errors.
-    """
+        async_app = create_async_app({ 'database_path': self.database_path })
+        async with async_app.test_app() as test_app:
+            async_client = test_app.test_client()
+            for (method, path, body), (status_code, data) in zip(requests, expected):
+                res = await async_client.open(path, method=method, json=body)
+                with self.subTest(method=method, path=path):
+                    self.assertEqual(res.status_code, status_code)
+                    self.assertEqual(await res.get_json(), data)
 
 
 # Make the tests conveniently executable
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()
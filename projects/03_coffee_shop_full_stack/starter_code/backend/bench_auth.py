@@ -0,0 +1,64 @@
+'''
+Micro-benchmark of the requires_auth decorator overhead.
+
+Signs tokens with a local stand-in JWKS server (see test_auth.py), so it
+runs offline:
+
+    python bench_auth.py
+'''
+
+import timeit
+
+from flask import Flask
+
+from src.auth import auth
+from src.auth.auth import requires_auth, check_permissions
+from src.auth.jwks import JWKSCache
+from test_auth import JWKSServer
+
+KNOWN_PERMISSIONS = ['get:drinks-detail', 'post:drinks', 'patch:drinks', 'delete:drinks']
+
+
+def report(name, seconds, number):
+    print(f'{name:<56} {seconds / number * 1e6:10.2f} us/call')
+
+
+def main(number=2000):
+    app = Flask(__name__)
+
+    @requires_auth('delete:drinks')
+    def delete_drink(payload):
+        return payload
+
+    with JWKSServer() as server:
+        server.add_key('bench')
+        auth.jwks_cache = JWKSCache(server.url)
+
+        for role_size in (len(KNOWN_PERMISSIONS), 2000):
+            # The checked permission is the last one, the worst case for a list scan.
+            permissions = [f'read:menu-{i}' for i in range(role_size - 1)] + ['delete:drinks']
+            token = server.sign('bench', permissions=permissions)
+            print(f'\n{role_size} permissions in the token')
+
+            with app.test_request_context(headers={'Authorization': 'Bearer ' + token}):
+                def uncached():
+                    auth.token_cache.clear()
+                    delete_drink()
+
+                report('requires_auth, verifying the token on every call',
+                       timeit.timeit(uncached, number=number // 10), number // 10)
+                report('requires_auth, cached payload',
+                       timeit.timeit(delete_drink, number=number), number)
+
+                plain_payload = dict(delete_drink())
+                verified_payload = delete_drink()
+                report('check_permissions on a permissions list',
+                       timeit.timeit(lambda: check_permissions('delete:drinks', plain_payload),
+                                     number=number), number)
+                report('check_permissions on the precomputed frozenset',
+                       timeit.timeit(lambda: check_permissions('delete:drinks', verified_payload),
+                                     number=number), number)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,20 @@
 import os
-from flask import Flask, request, jsonify, abort
+import hashlib
+import threading
+import time
+from flask import Flask, request, jsonify, abort, Response
 from sqlalchemy import exc
 import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
+from .database.models import db_drop_and_create_all, setup_db, Drink, get_menu_version
 from .auth.auth import AuthError, requires_auth
+from .instrumentation import init_instrumentation
 
 app = Flask(__name__)
 setup_db(app)
 CORS(app)
+init_instrumentation(app)
 
 '''
 @TODO uncomment the following line to initialize the datbase
@@ -18,6 +23,49 @@ CORS(app)
 '''
 # db_drop_and_create_all()
 
+## MENU CACHE
+'''
+The drinks menu changes only when a drink is inserted, updated or deleted,
+each of which bumps the menu version. The JSON body of each representation
+('short' or 'long') is rendered once per version and served with a strong
+ETag, so clients revalidating with If-None-Match get a bodiless 304.
+The version is kept per process, so a rendered menu is also dropped
+MENU_CACHE_MAX_AGE seconds after it was rendered: changes made by other
+workers show up within that time, and as the ETag is a hash of the body
+an unchanged menu keeps its ETag.
+'''
+app.config.setdefault('MENU_CACHE_MAX_AGE', float(os.environ.get('MENU_CACHE_MAX_AGE', 5)))
+
+menu_cache = {}
+menu_cache_lock = threading.Lock()
+
+def get_menu(representation):
+    version = get_menu_version()
+    entry = menu_cache.get((version, representation))
+    now = time.monotonic()
+
+    if entry is None or now - entry[2] > app.config['MENU_CACHE_MAX_AGE']:
+        drinks = Drink.query.order_by(Drink.id).all()
+        body = json.dumps({
+            'success': True,
+            'drinks': [getattr(drink, representation)() for drink in drinks]
+        }).encode('utf-8')
+        entry = (body, hashlib.sha1(body).hexdigest(), now)
+
+        with menu_cache_lock:
+            for key in [key for key in menu_cache if key[0] != version]:
+                del menu_cache[key]
+            menu_cache[(version, representation)] = entry
+
+    return entry[:2]
+
+def menu_response(representation, cache_control):
+    body, etag = get_menu(representation)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response.make_conditional(request)
+
 ## ROUTES
 '''
 @TODO implement endpoint
@@ -27,6 +75,9 @@ CORS(app)
     returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
         or appropriate status code indicating reason for failure
 '''
+@app.route('/drinks')
+def get_drinks():
+    return menu_response('short', 'public, no-cache')
 
 
 '''
@@ -37,6 +88,10 @@ CORS(app)
     returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
         or appropriate status code indicating reason for failure
 '''
+@app.route('/drinks-detail')
+@requires_auth('get:drinks-detail')
+def get_drinks_detail(payload):
+    return menu_response('long', 'private, no-cache')
 
 
 '''
@@ -102,9 +157,23 @@ def unprocessable(error):
 @TODO implement error handler for 404
     error handler should conform to general task above 
 '''
+@app.errorhandler(404)
+def not_found(error):
+    return jsonify({
+                    "success": False, 
+                    "error": 404,
+                    "message": "resource not found"
+                    }), 404
 
 
 '''
 @TODO implement error handler for AuthError
     error handler should conform to general task above 
 '''
+@app.errorhandler(AuthError)
+def auth_error(error):
+    return jsonify({
+                    "success": False, 
+                    "error": error.status_code,
+                    "message": error.error['description']
+                    }), error.status_code
@@ -2,13 +2,18 @@ import json
 from flask import request, _request_ctx_stack
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+
+from .jwks import JWKSCache
+from .token_cache import TokenCache
 
 
 AUTH0_DOMAIN = 'udacity-fsnd.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'dev'
 
+jwks_cache = JWKSCache(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+token_cache = TokenCache(maxsize=1024)
+
 ## AuthError Exception
 '''
 AuthError Exception
@@ -20,6 +25,20 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+## Verified Payload
+'''
+VerifiedPayload
+The decoded jwt payload, as a plain dict, which also carries its
+`permissions` claim as a frozenset so permission checks are a hash lookup
+computed once per token rather than a list scan per request
+'''
+class VerifiedPayload(dict):
+    def __init__(self, payload):
+        super().__init__(payload)
+        permissions = payload.get('permissions')
+        self.permission_set = frozenset(permissions) if isinstance(permissions, list) else None
+
+
 ## Auth Header
 
 '''
@@ -31,7 +50,33 @@ class AuthError(Exception):
     return the token part of the header
 '''
 def get_token_auth_header():
-   raise Exception('Not Implemented')
+    auth = request.headers.get('Authorization', None)
+    if not auth:
+        raise AuthError({
+            'code': 'authorization_header_missing',
+            'description': 'Authorization header is expected.'
+        }, 401)
+
+    parts = auth.split()
+    if parts[0].lower() != 'bearer':
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must start with "Bearer".'
+        }, 401)
+
+    elif len(parts) == 1:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Token not found.'
+        }, 401)
+
+    elif len(parts) > 2:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must be bearer token.'
+        }, 401)
+
+    return parts[1]
 
 '''
 @TODO implement check_permissions(permission, payload) method
@@ -45,7 +90,23 @@ def get_token_auth_header():
     return true otherwise
 '''
 def check_permissions(permission, payload):
-    raise Exception('Not Implemented')
+    if 'permissions' not in payload:
+        raise AuthError({
+            'code': 'invalid_claims',
+            'description': 'Permissions not included in JWT.'
+        }, 400)
+
+    permissions = getattr(payload, 'permission_set', None)
+    if permissions is None:
+        permissions = payload['permissions']
+
+    if permission not in permissions:
+        raise AuthError({
+            'code': 'unauthorized',
+            'description': 'Permission not found.'
+        }, 403)
+
+    return True
 
 '''
 @TODO implement verify_decode_jwt(token) method
@@ -59,9 +120,81 @@ def check_permissions(permission, payload):
     return the decoded payload
 
     !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
+    !!NOTE the key set is not downloaded per request, it is cached by jwks_cache (see jwks.py)
 '''
 def verify_decode_jwt(token):
-    raise Exception('Not Implemented')
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except jwt.JWTError:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 401)
+
+    if 'kid' not in unverified_header:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization malformed.'
+        }, 401)
+
+    try:
+        rsa_key = jwks_cache.get_key(unverified_header['kid'])
+    except Exception:
+        raise AuthError({
+            'code': 'jwks_unavailable',
+            'description': 'Unable to fetch the signing keys.'
+        }, 503)
+
+    if rsa_key is None:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to find the appropriate key.'
+        }, 400)
+
+    try:
+        return jwt.decode(
+            token,
+            rsa_key,
+            algorithms=ALGORITHMS,
+            audience=API_AUDIENCE,
+            issuer='https://' + AUTH0_DOMAIN + '/'
+        )
+
+    except jwt.ExpiredSignatureError:
+        raise AuthError({
+            'code': 'token_expired',
+            'description': 'Token expired.'
+        }, 401)
+
+    except jwt.JWTClaimsError:
+        raise AuthError({
+            'code': 'invalid_claims',
+            'description': 'Incorrect claims. Please, check the audience and issuer.'
+        }, 401)
+
+    except Exception:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 400)
+
+'''
+get_verified_payload(token) method
+    @INPUTS
+        token: a json web token (string)
+
+    returns the decoded payload as a VerifiedPayload, verifying the token with
+    verify_decode_jwt only the first time it is seen; the payload is then
+    served from token_cache until the token expires
+'''
+def get_verified_payload(token):
+    payload = token_cache.get(token)
+
+    if payload is None:
+        payload = VerifiedPayload(verify_decode_jwt(token))
+        token_cache.set(token, payload)
+
+    return payload
 
 '''
 @TODO implement @requires_auth(permission) decorator method
@@ -69,7 +202,7 @@ def verify_decode_jwt(token):
         permission: string permission (i.e. 'post:drink')
 
     it should use the get_token_auth_header method to get the token
-    it should use the verify_decode_jwt method to decode the jwt
+    it should use the verify_decode_jwt method to decode the jwt (through get_verified_payload)
     it should use the check_permissions method validate claims and check the requested permission
     return the decorator which passes the decoded payload to the decorated method
 '''
@@ -78,7 +211,7 @@ def requires_auth(permission=''):
         @wraps(f)
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
+            payload = get_verified_payload(token)
             check_permissions(permission, payload)
             return f(payload, *args, **kwargs)
 
@@ -0,0 +1,124 @@
+import json
+import threading
+import time
+from urllib.request import urlopen
+
+
+'''
+JWKSCache
+Caches the signing keys published at a JSON Web Key Set url, by key id (kid)
+
+    - keys are fetched once and reused for `ttl` seconds
+    - for `stale_ttl` seconds after that, the cached keys keep being
+      served while a background thread fetches fresh ones
+    - a kid missing from the cache forces a fetch, at most once every
+      `min_refetch_interval` seconds, so a flood of tokens with made up
+      kids cannot turn into a flood of requests to the identity provider
+    - one fetch runs at a time: requests needing the same refresh wait
+      for it and reuse its keys instead of fetching again
+'''
+class JWKSCache:
+    def __init__(self, url, ttl=600, stale_ttl=3600, min_refetch_interval=30, timeout=5):
+        self.url = url
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.min_refetch_interval = min_refetch_interval
+        self.timeout = timeout
+
+        self._keys = {}
+        self._fetched_at = None
+        self._last_fetch_attempt = None
+        self._refreshing = False
+        # _lock guards the cached state, _refresh_lock serializes fetches
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    '''
+    fetch()
+        downloads the key set, returning its RSA keys by kid
+    '''
+    def fetch(self):
+        with urlopen(self.url, timeout=self.timeout) as response:
+            jwks = json.loads(response.read())
+
+        return {
+            key['kid']: {
+                'kty': key['kty'],
+                'kid': key['kid'],
+                'use': key['use'],
+                'n': key['n'],
+                'e': key['e']
+            } for key in jwks['keys'] if key.get('kty') == 'RSA'
+        }
+
+    '''
+    refresh(needed=None)
+        replaces the cached keys with a freshly fetched key set
+        @INPUTS
+            needed: called once the fetch lock is held, the fetch is skipped
+                when it returns False because another thread already did it
+    '''
+    def refresh(self, needed=None):
+        with self._refresh_lock:
+            if needed is not None and not needed():
+                return
+
+            with self._lock:
+                self._last_fetch_attempt = time.monotonic()
+            keys = self.fetch()
+
+            with self._lock:
+                self._keys = keys
+                self._fetched_at = time.monotonic()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh(lambda: self._older_than(self.ttl))
+            except Exception:
+                # Keep serving the stale keys, the next request retries.
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _older_than(self, seconds):
+        with self._lock:
+            return self._fetched_at is None or time.monotonic() - self._fetched_at > seconds
+
+    def _can_refetch(self):
+        with self._lock:
+            return self._last_fetch_attempt is None or \
+                time.monotonic() - self._last_fetch_attempt >= self.min_refetch_interval
+
+    '''
+    get_key(kid)
+        @INPUTS
+            kid: the key id from the token header
+
+    returns the RSA key for the kid, or None if the identity provider does not publish it
+    raises whatever fetch() raises when no usable key set can be obtained
+    '''
+    def get_key(self, kid):
+        expired_age = self.ttl + self.stale_ttl
+
+        if self._older_than(expired_age):
+            self.refresh(lambda: self._older_than(expired_age))
+        elif self._older_than(self.ttl):
+            self._refresh_in_background()
+
+        key = self._keys.get(kid)
+
+        if key is None and self._can_refetch():
+            # The provider may have rotated its keys since the last fetch.
+            self.refresh(lambda: kid not in self._keys and self._can_refetch())
+            key = self._keys.get(kid)
+
+        return key
@@ -0,0 +1,81 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+'''
+TokenCache
+A bounded LRU cache of verified JWT payloads
+
+    - entries are keyed by the SHA-256 of the token, never the token itself
+    - an entry is dropped once the token's `exp` claim has passed
+    - tokens without an `exp` claim are never cached
+    - hits and misses are counted, see stats()
+'''
+class TokenCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    '''
+    get(token)
+        returns the cached payload for the token, or None
+    '''
+    def get(self, token):
+        key = self._key(token)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[0] <= time.time():
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    '''
+    set(token, payload)
+        caches a verified payload until its `exp` claim
+    '''
+    def set(self, token, payload):
+        expires_at = payload.get('exp')
+        if not isinstance(expires_at, (int, float)) or expires_at <= time.time():
+            return
+
+        key = self._key(token)
+
+        with self._lock:
+            self._entries[key] = (expires_at, payload)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxsize': self.maxsize
+        }
@@ -1,21 +1,43 @@
 import os
-from sqlalchemy import Column, String, Integer
+import threading
+from sqlalchemy import Column, String, Integer, event
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from .pool import engine_options
+
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
 database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
 
 db = SQLAlchemy()
 
+'''
+menu version
+    a counter bumped by every Drink insert(), update() and delete(), so
+    anything derived from the whole menu can be cached until it changes
+    !!NOTE the counter lives in this process, writes made by other
+    processes are not seen; caches keyed by it must also expire
+'''
+_menu_version = 0
+_menu_version_lock = threading.Lock()
+
+def get_menu_version():
+    return _menu_version
+
+def bump_menu_version():
+    global _menu_version
+    with _menu_version_lock:
+        _menu_version += 1
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
 '''
-def setup_db(app):
+def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path)
     db.app = app
     db.init_app(app)
 
@@ -42,29 +64,52 @@ class Drink(db.Model):
     # the required datatype is [{'color': string, 'name':string, 'parts':number}]
     recipe =  Column(String(180), nullable=False)
 
+    # parsed recipe and serialized forms, computed on first use and
+    # cleared whenever the title or recipe changes (see the listeners below)
+    _recipe_data = None
+    _short = None
+    _long = None
+
+    '''
+    recipe_data()
+        the recipe blob parsed into a list, parsed at most once per instance
+    '''
+    def recipe_data(self):
+        if self._recipe_data is None:
+            self._recipe_data = json.loads(self.recipe)
+        return self._recipe_data
+
+    def clear_serializations(self):
+        self._recipe_data = None
+        self._short = None
+        self._long = None
+
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
-        return {
-            'id': self.id,
-            'title': self.title,
-            'recipe': short_recipe
-        }
+        if self._short is None:
+            short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in self.recipe_data()]
+            self._short = {
+                'id': self.id,
+                'title': self.title,
+                'recipe': short_recipe
+            }
+        return self._short
 
     '''
     long()
         long form representation of the Drink model
     '''
     def long(self):
-        return {
-            'id': self.id,
-            'title': self.title,
-            'recipe': json.loads(self.recipe)
-        }
+        if self._long is None:
+            self._long = {
+                'id': self.id,
+                'title': self.title,
+                'recipe': self.recipe_data()
+            }
+        return self._long
 
     '''
     insert()
@@ -78,6 +123,8 @@ class Drink(db.Model):
     def insert(self):
         db.session.add(self)
         db.session.commit()
+        self.clear_serializations()
+        bump_menu_version()
 
     '''
     delete()
@@ -90,6 +137,7 @@ class Drink(db.Model):
     def delete(self):
         db.session.delete(self)
         db.session.commit()
+        bump_menu_version()
 
     '''
     update()
@@ -102,6 +150,19 @@ class Drink(db.Model):
     '''
     def update(self):
         db.session.commit()
+        self.clear_serializations()
+        bump_menu_version()
 
     def __repr__(self):
-        return json.dumps(self.short())
\ No newline at end of file
+        return '<Drink {} {!r}>'.format(self.id, self.title)
+
+
+@event.listens_for(Drink.title, 'set')
+@event.listens_for(Drink.recipe, 'set')
+def clear_drink_serializations_on_set(drink, value, oldvalue, initiator):
+    drink.clear_serializations()
+
+
+@event.listens_for(Drink, 'refresh')
+def clear_drink_serializations_on_refresh(drink, context, attrs):
+    drink.clear_serializations()
@@ -0,0 +1,119 @@
+'''
+  Database engine options.
+
+  The connection pool is configured from the environment:
+
+    DB_POOL_SIZE          connections kept open (default 10)
+    DB_MAX_OVERFLOW       extra connections opened under load (default 20)
+    DB_POOL_TIMEOUT       seconds to wait for a free connection (default 10)
+    DB_POOL_RECYCLE       seconds after which a connection is replaced (default 1800)
+    DB_POOL_PRE_PING      test connections before handing them out (default true)
+    DB_STATEMENT_TIMEOUT  PostgreSQL statement timeout in ms (default none)
+
+  Size the pool for every thread of a worker: gunicorn with 8 threads
+  needs DB_POOL_SIZE + DB_MAX_OVERFLOW >= 8, or requests queue for
+  connections.
+
+  The same file is kept in every project, each of which is installed
+  and deployed from its own directory:
+
+    projects/01_fyyur/starter_code/pool.py
+    projects/02_trivia_api/starter/backend/pool.py
+    projects/03_coffee_shop_full_stack/starter_code/backend/src/database/pool.py
+
+  Change all three together; they must stay identical.
+'''
+
+import os
+import time
+
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.exc import TimeoutError
+
+
+class PoolWaitStats(object):
+  '''
+    How long checkouts waited for a connection. Updated
+    without a lock, like the other counters of the app.
+  '''
+  def __init__(self):
+    self.checkouts = 0
+    self.wait_time = 0.0
+    self.max_wait = 0.0
+    self.timeouts = 0
+
+  def record(self, wait, timed_out=False):
+    self.checkouts += 1
+    self.wait_time += wait
+    if wait > self.max_wait:
+      self.max_wait = wait
+    if timed_out:
+      self.timeouts += 1
+
+  def stats(self):
+    return {
+      'checkouts': self.checkouts,
+      'wait_time': self.wait_time,
+      'max_wait': self.max_wait,
+      'timeouts': self.timeouts
+    }
+
+class TimedQueuePool(QueuePool):
+  '''
+    A QueuePool timing how long each checkout waits for a
+    connection, the time a request is stalled when every
+    connection is in use.
+  '''
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.wait_stats = PoolWaitStats()
+
+  def recreate(self):
+    pool = super().recreate()
+    pool.wait_stats = self.wait_stats
+    return pool
+
+  def _do_get(self):
+    started_at = time.perf_counter()
+    try:
+      connection = super()._do_get()
+    except TimeoutError:
+      self.wait_stats.record(time.perf_counter() - started_at, timed_out=True)
+      raise
+
+    self.wait_stats.record(time.perf_counter() - started_at)
+    return connection
+
+def engine_options(database_uri, environ=os.environ):
+  '''
+    The SQLALCHEMY_ENGINE_OPTIONS for database_uri.
+
+    In-memory SQLite databases live in a single connection, so
+    only pre-ping applies to them. SQLite files are pooled like
+    any other database, their connections shared across threads.
+  '''
+  url = make_url(database_uri)
+  options = {
+    'pool_pre_ping': environ.get('DB_POOL_PRE_PING', 'true') == 'true'
+  }
+
+  if url.drivername.startswith('sqlite') and url.database in (None, '', ':memory:'):
+    return options
+
+  options.update({
+    'poolclass': TimedQueuePool,
+    'pool_size': int(environ.get('DB_POOL_SIZE', 10)),
+    'max_overflow': int(environ.get('DB_MAX_OVERFLOW', 20)),
+    'pool_timeout': float(environ.get('DB_POOL_TIMEOUT', 10)),
+    'pool_recycle': int(environ.get('DB_POOL_RECYCLE', 1800))
+  })
+
+  if url.drivername.startswith('sqlite'):
+    options['connect_args'] = { 'check_same_thread': False }
+
+  statement_timeout = environ.get('DB_STATEMENT_TIMEOUT')
+  if statement_timeout and url.drivername.startswith('postgres'):
+    options['connect_args'] = { 'options': f'-c statement_timeout={int(statement_timeout)}' }
+
+  return options
@@ -0,0 +1,97 @@
+import os
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+'''
+Per-request SQL instrumentation
+
+    - counts the statements each request executes and the time spent in the database
+    - reports both, along with the total latency, in a Server-Timing header
+    - logs statements slower than SLOW_QUERY_THRESHOLD_MS with the route that ran them
+    - SQL_INSTRUMENTATION switches all of it off
+
+The listeners are attached to every Engine rather than to the app's engine,
+because Flask-SQLAlchemy replaces the engine whenever the database uri changes.
+'''
+
+
+'''
+RequestStats
+    what a single request cost so far
+'''
+class RequestStats:
+    __slots__ = ('started_at', 'queries', 'db_time')
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started_at
+
+    def server_timing(self):
+        return 'db;dur={:.2f};desc="{} queries", total;dur={:.2f}'.format(
+            self.db_time * 1000, self.queries, self.elapsed * 1000)
+
+
+'''
+request_stats()
+    returns the RequestStats of the current request, or None outside of a
+    request or when instrumentation is switched off
+'''
+def request_stats():
+    if not has_request_context():
+        return None
+    return g.get('request_stats')
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.query_started_at = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = getattr(context, 'query_started_at', None)
+    stats = request_stats()
+    if started_at is None or stats is None:
+        return
+
+    elapsed = time.perf_counter() - started_at
+    stats.queries += 1
+    stats.db_time += elapsed
+
+    threshold = current_app.config['SLOW_QUERY_THRESHOLD_MS']
+    if threshold is not None and elapsed * 1000 >= threshold:
+        current_app.logger.getChild('sql').warning(
+            'slow query (%.1f ms) in %s %s [%s]: %s',
+            elapsed * 1000, request.method, request.path, request.endpoint, statement)
+
+
+'''
+init_instrumentation(app)
+    adds the request hooks, settings not already in the app config are
+    read from the environment
+'''
+def init_instrumentation(app):
+    app.config.setdefault('SQL_INSTRUMENTATION', os.environ.get('SQL_INSTRUMENTATION', 'true') == 'true')
+    app.config.setdefault('SLOW_QUERY_THRESHOLD_MS', int(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100)))
+
+    @app.before_request
+    def start_request_stats():
+        if app.config['SQL_INSTRUMENTATION']:
+            g.request_stats = RequestStats()
+
+    @app.after_request
+    def add_server_timing(response):
+        stats = request_stats()
+        if stats is not None:
+            response.headers['Server-Timing'] = stats.server_timing()
+        return response
@@ -0,0 +1,145 @@
+import json
+import unittest
+
+from src.api import app, menu_cache
+from src.auth import auth
+from src.auth.jwks import JWKSCache
+from src.database.models import db, Drink
+from test_auth import JWKSServer
+
+
+class DrinksMenuTestCase(unittest.TestCase):
+    """This class represents the drinks menu test case"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = JWKSServer().__enter__()
+        cls.server.add_key('key-1')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.__exit__(None, None, None)
+
+    def setUp(self):
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.client = app.test_client
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+        menu_cache.clear()
+
+        self.original_cache = auth.jwks_cache
+        auth.jwks_cache = JWKSCache(self.server.url)
+        self.headers = {'Authorization': 'Bearer ' + self.server.sign('key-1')}
+
+        Drink(title='Water', recipe=json.dumps([{'name': 'water', 'color': 'blue', 'parts': 1}])).insert()
+
+    def tearDown(self):
+        auth.jwks_cache = self.original_cache
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_get_drinks(self):
+        res = self.client().get('/drinks')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['drinks'][0]['recipe'], [{'color': 'blue', 'parts': 1}])
+        self.assertIsNotNone(res.headers.get('ETag'))
+
+    def test_get_drinks_not_modified(self):
+        etag = self.client().get('/drinks').headers['ETag']
+
+        res = self.client().get('/drinks', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+    def test_menu_changes_invalidate_etag(self):
+        etag = self.client().get('/drinks').headers['ETag']
+
+        Drink(title='Espresso', recipe=json.dumps([{'name': 'coffee', 'color': 'brown', 'parts': 1}])).insert()
+        res = self.client().get('/drinks', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(json.loads(res.data)['drinks']), 2)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+        etag = res.headers['ETag']
+        drink = Drink.query.filter(Drink.title == 'Espresso').one()
+        drink.delete()
+        res = self.client().get('/drinks', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(json.loads(res.data)['drinks']), 1)
+
+    def test_menu_expires_for_writes_made_elsewhere(self):
+        etag = self.client().get('/drinks').headers['ETag']
+
+        # Written as another worker would: this process' menu version stays put.
+        db.session.execute(Drink.__table__.insert().values(
+            title='Espresso', recipe=json.dumps([{'name': 'coffee', 'color': 'brown', 'parts': 1}])))
+        db.session.commit()
+        res = self.client().get('/drinks', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+
+        app.config['MENU_CACHE_MAX_AGE'] = 0
+        try:
+            res = self.client().get('/drinks', headers={'If-None-Match': etag})
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(len(json.loads(res.data)['drinks']), 2)
+
+            etag = res.headers['ETag']
+            res = self.client().get('/drinks', headers={'If-None-Match': etag})
+            self.assertEqual(res.status_code, 304)
+        finally:
+            app.config['MENU_CACHE_MAX_AGE'] = 5
+
+    def test_get_drinks_detail(self):
+        res = self.client().get('/drinks-detail', headers=self.headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['drinks'][0]['recipe'][0]['name'], 'water')
+
+        res = self.client().get('/drinks-detail',
+                                headers=dict(self.headers, **{'If-None-Match': res.headers['ETag']}))
+
+        self.assertEqual(res.status_code, 304)
+
+    def test_get_drinks_detail_requires_auth(self):
+        etag = self.client().get('/drinks-detail', headers=self.headers).headers['ETag']
+
+        res = self.client().get('/drinks-detail', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 401)
+        self.assertFalse(json.loads(res.data)['success'])
+
+    def test_server_timing_reports_queries(self):
+        db.session.remove()
+        first = self.client().get('/drinks')
+        second = self.client().get('/drinks')
+
+        self.assertRegex(first.headers['Server-Timing'],
+                         r'^db;dur=[0-9.]+;desc="1 queries", total;dur=[0-9.]+$')
+        # The menu is served from its cache until it changes.
+        self.assertIn('desc="0 queries"', second.headers['Server-Timing'])
+
+    def test_slow_queries_are_logged_with_their_route(self):
+        app.config['SLOW_QUERY_THRESHOLD_MS'] = 0
+        try:
+            with self.assertLogs(app.logger.getChild('sql'), 'WARNING') as logs:
+                self.client().get('/drinks')
+        finally:
+            app.config['SLOW_QUERY_THRESHOLD_MS'] = 100
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('GET /drinks [get_drinks]', logs.output[0])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,261 @@
+import json
+import threading
+import time
+import unittest
+from base64 import urlsafe_b64encode
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from Crypto.PublicKey import RSA
+from flask import Flask
+from jose import jwt
+
+from src.auth import auth
+from src.auth.auth import AuthError, requires_auth, verify_decode_jwt, get_verified_payload, \
+    check_permissions
+from src.auth.jwks import JWKSCache
+from src.auth.token_cache import TokenCache
+
+
+def b64_uint(value):
+    data = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+class JWKSServer:
+    """Local stand-in for the identity provider's /.well-known/jwks.json"""
+
+    def __init__(self):
+        self.keys = {}
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                body = json.dumps({'keys': [
+                    {
+                        'kty': 'RSA',
+                        'kid': kid,
+                        'use': 'sig',
+                        'n': b64_uint(key.n),
+                        'e': b64_uint(key.e)
+                    } for kid, key in server.keys.items()
+                ]}).encode('utf-8')
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/.well-known/jwks.json'.format(self.httpd.server_port)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def add_key(self, kid):
+        self.keys[kid] = RSA.generate(2048)
+        return self.keys[kid]
+
+    def sign(self, kid, **claims):
+        payload = {
+            'iss': 'https://' + auth.AUTH0_DOMAIN + '/',
+            'aud': auth.API_AUDIENCE,
+            'sub': 'auth0|barista',
+            'exp': int(time.time()) + 3600,
+            'permissions': ['get:drinks-detail']
+        }
+        payload.update(claims)
+        return jwt.encode(payload, self.keys[kid].export_key().decode('ascii'),
+                          algorithm='RS256', headers={'kid': kid})
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class AuthTestCase(unittest.TestCase):
+    """This class represents the auth test case, run against a local JWKS server"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = JWKSServer().__enter__()
+        cls.server.add_key('key-1')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.__exit__(None, None, None)
+
+    def setUp(self):
+        self.server.requests = 0
+        self.original_cache = auth.jwks_cache
+        auth.jwks_cache = JWKSCache(self.server.url)
+        auth.token_cache.clear()
+
+    def tearDown(self):
+        auth.jwks_cache = self.original_cache
+
+    def test_key_set_is_fetched_once(self):
+        token = self.server.sign('key-1')
+
+        for _ in range(5):
+            self.assertEqual(verify_decode_jwt(token)['sub'], 'auth0|barista')
+
+        self.assertEqual(self.server.requests, 1)
+
+    def test_stale_keys_are_served_while_refreshing(self):
+        auth.jwks_cache = JWKSCache(self.server.url, ttl=0, stale_ttl=3600)
+        token = self.server.sign('key-1')
+
+        verify_decode_jwt(token)
+        verify_decode_jwt(token)
+
+        for _ in range(100):
+            if self.server.requests == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.server.requests, 2)
+
+    def test_expired_keys_are_refetched(self):
+        auth.jwks_cache = JWKSCache(self.server.url, ttl=0, stale_ttl=0)
+        token = self.server.sign('key-1')
+
+        verify_decode_jwt(token)
+        verify_decode_jwt(token)
+
+        self.assertEqual(self.server.requests, 2)
+
+    def test_unknown_kid_forces_refetch(self):
+        auth.jwks_cache = JWKSCache(self.server.url, min_refetch_interval=0)
+        verify_decode_jwt(self.server.sign('key-1'))
+
+        # The provider rotated its keys after the cache was filled.
+        self.server.add_key('key-2')
+        self.assertEqual(verify_decode_jwt(self.server.sign('key-2'))['sub'], 'auth0|barista')
+        self.assertEqual(self.server.requests, 2)
+
+    def test_unknown_kid_refetch_is_rate_limited(self):
+        verify_decode_jwt(self.server.sign('key-1'))
+        token = jwt.encode(jwt.get_unverified_claims(self.server.sign('key-1')),
+                           self.server.keys['key-1'].export_key().decode('ascii'),
+                           algorithm='RS256', headers={'kid': 'key-unknown'})
+
+        for _ in range(5):
+            with self.assertRaises(AuthError) as context:
+                verify_decode_jwt(token)
+            self.assertEqual(context.exception.status_code, 400)
+
+        self.assertEqual(self.server.requests, 1)
+
+    def test_concurrent_refetches_are_single_flight(self):
+        class SlowJWKSCache(JWKSCache):
+            def fetch(self):
+                time.sleep(0.05)
+                return super().fetch()
+
+        def get_keys(kid):
+            threads = [threading.Thread(target=jwks_cache.get_key, args=(kid,)) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        jwks_cache = SlowJWKSCache(self.server.url, min_refetch_interval=0)
+        get_keys('key-1')
+        self.assertEqual(self.server.requests, 1)
+
+        self.server.add_key('key-3')
+        get_keys('key-3')
+        self.assertEqual(self.server.requests, 2)
+        self.assertIsNotNone(jwks_cache.get_key('key-3'))
+
+    def test_verified_payloads_are_cached(self):
+        token = self.server.sign('key-1')
+
+        first = get_verified_payload(token)
+        for _ in range(5):
+            self.assertIs(get_verified_payload(token), first)
+
+        self.assertEqual(auth.token_cache.stats()['hits'], 5)
+        self.assertEqual(auth.token_cache.stats()['misses'], 1)
+
+    def test_token_cache_honours_exp(self):
+        cache = TokenCache()
+
+        cache.set('expired', {'exp': time.time() - 1})
+        cache.set('no-exp', {'sub': 'auth0|barista'})
+        cache.set('expiring', {'exp': time.time() + 0.05})
+
+        self.assertIsNone(cache.get('expired'))
+        self.assertIsNone(cache.get('no-exp'))
+        self.assertIsNotNone(cache.get('expiring'))
+        time.sleep(0.06)
+        self.assertIsNone(cache.get('expiring'))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_token_cache_is_bounded(self):
+        cache = TokenCache(maxsize=2)
+        payload = {'exp': time.time() + 60}
+
+        cache.set('a', payload)
+        cache.set('b', payload)
+        cache.get('a')
+        cache.set('c', payload)
+
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_verified_payload_carries_permission_set(self):
+        token = self.server.sign('key-1', permissions=['get:drinks-detail', 'post:drinks'])
+        payload = get_verified_payload(token)
+
+        self.assertEqual(payload.permission_set, frozenset(['get:drinks-detail', 'post:drinks']))
+        self.assertEqual(json.loads(json.dumps(payload))['permissions'],
+                         ['get:drinks-detail', 'post:drinks'])
+        self.assertTrue(check_permissions('post:drinks', payload))
+        with self.assertRaises(AuthError) as context:
+            check_permissions('delete:drinks', payload)
+        self.assertEqual(context.exception.status_code, 403)
+
+    def test_check_permissions_on_plain_payload(self):
+        self.assertTrue(check_permissions('patch:drinks', {'permissions': ['patch:drinks']}))
+
+        with self.assertRaises(AuthError) as context:
+            check_permissions('patch:drinks', {'sub': 'auth0|barista'})
+        self.assertEqual(context.exception.status_code, 400)
+
+    def test_requires_auth(self):
+        app = Flask(__name__)
+
+        @requires_auth('get:drinks-detail')
+        def drinks_detail(payload):
+            return payload['sub']
+
+        @requires_auth('post:drinks')
+        def create_drink(payload):
+            return payload['sub']
+
+        headers = {'Authorization': 'Bearer ' + self.server.sign('key-1')}
+        with app.test_request_context(headers=headers):
+            self.assertEqual(drinks_detail(), 'auth0|barista')
+
+            with self.assertRaises(AuthError) as context:
+                create_drink()
+            self.assertEqual(context.exception.status_code, 403)
+
+        with app.test_request_context():
+            with self.assertRaises(AuthError) as context:
+                drinks_detail()
+            self.assertEqual(context.exception.status_code, 401)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import json
+import unittest
+
+from flask import Flask
+
+from src.database.models import db, setup_db, Drink
+from src.database.pool import TimedQueuePool, engine_options
+
+
+class DrinkTestCase(unittest.TestCase):
+    """This class represents the drink model test case"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        setup_db(self.app, 'sqlite://')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        self.drink = Drink(title='Matcha Shake', recipe=json.dumps([
+            {'name': 'milk', 'color': 'grey', 'parts': 1},
+            {'name': 'matcha', 'color': 'green', 'parts': 3}
+        ]))
+        self.drink.insert()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_short_and_long(self):
+        self.assertEqual(self.drink.short(), {
+            'id': self.drink.id,
+            'title': 'Matcha Shake',
+            'recipe': [{'color': 'grey', 'parts': 1}, {'color': 'green', 'parts': 3}]
+        })
+        self.assertEqual(self.drink.long()['recipe'][1]['name'], 'matcha')
+
+    def test_recipe_is_parsed_once(self):
+        self.assertIs(self.drink.short(), self.drink.short())
+        self.assertIs(self.drink.long()['recipe'], self.drink.recipe_data())
+
+    def test_update_clears_serializations(self):
+        short = self.drink.short()
+
+        self.drink.title = 'Water'
+        self.drink.recipe = json.dumps([{'name': 'water', 'color': 'blue', 'parts': 1}])
+        self.drink.update()
+
+        self.assertIsNot(self.drink.short(), short)
+        self.assertEqual(self.drink.short()['title'], 'Water')
+        self.assertEqual(self.drink.long()['recipe'], [{'name': 'water', 'color': 'blue', 'parts': 1}])
+
+    def test_loaded_drink(self):
+        drink_id = self.drink.id
+        db.session.expunge_all()
+
+        drink = Drink.query.get(drink_id)
+
+        self.assertEqual(drink.short()['recipe'][0], {'color': 'grey', 'parts': 1})
+        self.assertEqual(repr(drink), "<Drink {} 'Matcha Shake'>".format(drink_id))
+
+
+class EngineOptionsTestCase(unittest.TestCase):
+    """This class represents the connection pool configuration test case"""
+
+    def test_memory_database_keeps_its_connection(self):
+        self.assertEqual(engine_options('sqlite://', {}), {'pool_pre_ping': True})
+
+    def test_pool_from_environment(self):
+        options = engine_options('postgresql://localhost/coffee', {
+            'DB_POOL_SIZE': '4',
+            'DB_STATEMENT_TIMEOUT': '5000'
+        })
+
+        self.assertIs(options['poolclass'], TimedQueuePool)
+        self.assertEqual(options['pool_size'], 4)
+        self.assertEqual(options['max_overflow'], 20)
+        self.assertEqual(options['connect_args'], {'options': '-c statement_timeout=5000'})
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()